@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Admission control for the calculator server.
+
+Every request that reaches ``MCPServer.handle_request`` is admitted or
+rejected before it does any work:
+
+* at most ``max_in_flight`` requests are admitted at once (running or waiting
+  for their cost class)
+* the raw messages of admitted requests may hold at most ``max_queued_bytes``
+  (a larger message is admitted only when nothing else is)
+* each cost class runs at most ``concurrency`` requests at a time, and at most
+  ``queue`` more may wait for a slot in that class
+* with a ``rate``, each flow (the server uses one per client session) gets a
+  token bucket of ``burst`` requests refilled at ``rate`` per second
+
+A request that would break a limit is refused at once with ``Overloaded``,
+which the server turns into a JSON-RPC error carrying a suggested retry
+delay. Failing fast keeps latency bounded for the requests that are accepted,
+instead of letting a burst build a queue that every later request waits behind.
+
+Cost classes keep cheap work moving while expensive work is throttled. The
+server puts expensive tools (and graphs using them) in ``heavy`` and everything
+else in ``light``.
+Methods that must answer even under overload (``ping``, ``initialize``,
+``server/metrics``) have no class and bypass the limits.
+
+When a class slot frees up, the next request is chosen by priority band
+first (``INTERACTIVE`` before ``NORMAL`` before ``BULK``), then by
+self-clocked weighted fair queuing across flows. Each request gets a finish
+tag ``max(virtual time, flow's last tag) + 1 / weight``, the smallest tag goes
+next, and virtual time advances to the tag of the request being started. A
+client that queues a thousand jobs therefore delays another client's single job
+by about one job, not a thousand, and a flow with weight 2 gets twice the share
+of one with weight 1.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional, Tuple
+
+# JSON-RPC error code for a request shed by admission control.
+OVERLOADED = -32001
+# Bounds on the suggested retry delay, in milliseconds.
+MIN_RETRY_AFTER_MS = 10
+MAX_RETRY_AFTER_MS = 30_000
+# Weight of the newest sample in each class's average service time.
+SERVICE_TIME_SMOOTHING = 0.2
+# Priority bands, served strictly in this order.
+INTERACTIVE, NORMAL, BULK = 0, 1, 2
+# Per-flow scheduler and rate-limit state is pruned of idle flows past this many entries.
+MAX_IDLE_FLOWS = 1024
+
+
+class Overloaded(Exception):
+    """A request refused by admission control; ``reason`` names the limit it hit."""
+
+    def __init__(self, reason: str, retry_after_ms: int):
+        super().__init__(f"Server overloaded ({reason.replace('_', ' ')}); retry after {retry_after_ms} ms")
+        self.reason = reason
+        self.retry_after_ms = retry_after_ms
+
+    def error(self) -> Dict[str, Any]:
+        """The JSON-RPC ``error`` member for this rejection."""
+        return {"code": OVERLOADED, "message": str(self),
+                "data": {"reason": self.reason, "retryAfterMs": self.retry_after_ms}}
+
+
+class TokenBucket:
+    """Allows ``burst`` requests at once and ``rate`` per second on average."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Spend a token and return 0, or return the seconds until one is available."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.burst
+
+
+class CostClass:
+    """A concurrency limit with a bounded, priority- and fair-share-ordered queue of waiting requests."""
+
+    def __init__(self, name: str, concurrency: Optional[int] = None, queue: int = 0):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.running = 0
+        # Heap of (priority band, finish tag, arrival order, waiter); cancelled waiters are skipped when popped.
+        self.waiters: List[Tuple[int, float, int, asyncio.Future]] = []
+        self.waiting = 0
+        self.virtual_time = 0.0
+        self.finish_tags: Dict[Hashable, float] = {}
+        self._arrivals = itertools.count()
+        self.service_seconds = 0.001
+
+    def retry_after_ms(self, ahead: int) -> int:
+        """Time for ``ahead`` requests to clear this class at its recent pace."""
+        lanes = self.concurrency or 1
+        estimate = self.service_seconds * (ahead / lanes + 1) * 1000
+        return int(min(MAX_RETRY_AFTER_MS, max(MIN_RETRY_AFTER_MS, estimate)))
+
+    def observe(self, seconds: float):
+        self.service_seconds += SERVICE_TIME_SMOOTHING * (seconds - self.service_seconds)
+
+    def _finish_tag(self, flow: Hashable, weight: float) -> float:
+        tag = max(self.virtual_time, self.finish_tags.get(flow, 0.0)) + 1.0 / weight
+        self.finish_tags[flow] = tag
+        if len(self.finish_tags) > MAX_IDLE_FLOWS:
+            # A tag at or behind virtual time no longer affects its flow's next request.
+            self.finish_tags = {key: value for key, value in self.finish_tags.items() if value > self.virtual_time}
+        return tag
+
+    async def acquire(self, flow: Hashable = None, priority: int = NORMAL, weight: float = 1.0):
+        if self.concurrency is None:
+            self.running += 1
+            return
+        tag = self._finish_tag(flow, weight)
+        if self.running < self.concurrency and not self.waiting:
+            self.running += 1
+            self.virtual_time = max(self.virtual_time, tag)
+            return
+        if self.waiting >= self.queue:
+            self.finish_tags[flow] -= 1.0 / weight  # never queued, so it does not count against the flow
+            raise Overloaded(f"{self.name}_queue_full", self.retry_after_ms(self.running + self.waiting))
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, tag, next(self._arrivals), waiter))
+        self.waiting += 1
+        try:
+            await waiter  # release() counts us as running before waking us
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # granted a slot just as we were cancelled: pass it on
+            else:
+                waiter.cancel()
+                self.waiting -= 1
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, tag, _, waiter = heapq.heappop(self.waiters)
+            if not waiter.done():
+                self.waiting -= 1
+                self.virtual_time = tag
+                waiter.set_result(None)  # hand our slot straight to the next in line
+                return
+        self.running -= 1
+
+
+class AdmissionController:
+    """Global in-flight and byte limits plus per-class concurrency limits."""
+
+    def __init__(self, max_in_flight: Optional[int] = None, max_queued_bytes: Optional[int] = None,
+                 classes: Optional[Dict[str, CostClass]] = None, rate: Optional[float] = None,
+                 burst: Optional[float] = None):
+        self.max_in_flight = max_in_flight
+        self.max_queued_bytes = max_queued_bytes
+        self.classes = classes or {}
+        self.rate = rate
+        self.burst = burst or max(1.0, 2 * (rate or 0))
+        self.buckets: Dict[Hashable, TokenBucket] = {}
+        self.in_flight = 0
+        self.queued_bytes = 0
+
+    def _check_rate(self, flow: Hashable):
+        if not self.rate:
+            return
+        bucket = self.buckets.get(flow)
+        if bucket is None:
+            if len(self.buckets) >= MAX_IDLE_FLOWS:
+                self.buckets = {key: value for key, value in self.buckets.items() if not value.full}
+            bucket = self.buckets[flow] = TokenBucket(self.rate, self.burst)
+        wait = bucket.take()
+        if wait:
+            raise Overloaded("rate_limited", int(min(MAX_RETRY_AFTER_MS, max(MIN_RETRY_AFTER_MS, wait * 1000))))
+
+    def _check_global(self, cost_class: CostClass, size: int):
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            raise Overloaded("too_many_requests", cost_class.retry_after_ms(self.in_flight))
+        # An oversized message still gets in alone (transports cap message size), or it could never run.
+        if self.max_queued_bytes is not None and self.queued_bytes and self.queued_bytes + size > self.max_queued_bytes:
+            raise Overloaded("too_many_queued_bytes", cost_class.retry_after_ms(self.in_flight))
+
+    @contextlib.asynccontextmanager
+    async def admit(self, cost_class: Optional[str], size: int = 0, flow: Hashable = None,
+                    priority: int = NORMAL, weight: float = 1.0) -> AsyncIterator[None]:
+        """Hold an admission slot for the ``async with`` body; raise ``Overloaded`` rather than queue past a limit.
+
+        ``flow`` identifies the client for fair queuing and rate limiting; ``weight`` is its share.
+        """
+        if cost_class is None:
+            yield
+            return
+        limits = self.classes.setdefault(cost_class, CostClass(cost_class))
+        self._check_global(limits, size)
+        self._check_rate(flow)
+        self.in_flight += 1
+        self.queued_bytes += size
+        try:
+            await limits.acquire(flow, priority, weight)
+            started = asyncio.get_running_loop().time()
+            try:
+                yield
+            finally:
+                limits.observe(asyncio.get_running_loop().time() - started)
+                limits.release()
+        finally:
+            self.in_flight -= 1
+            self.queued_bytes -= size
+
+    def gauges(self) -> Dict[str, int]:
+        """Current load, for the server's metrics."""
+        gauges = {"admitted": self.in_flight, "queued_bytes": self.queued_bytes}
+        for name, limits in self.classes.items():
+            gauges[f"running:{name}"] = limits.running
+            gauges[f"queued:{name}"] = limits.waiting
+        return gauges
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Batch calculations for the Streamlit dashboard's Batch page.
+
+Rows come from either of two sources:
+
+* a CSV of ``operation,a,b``, where the operation is ``add``, ``subtract``,
+  ``multiply``, ``divide`` or one of their symbols
+* pasted arithmetic expressions, one per line, such as ``12 * (2 - 0.5)``
+
+A single operation becomes a plain tool call. A nested expression becomes one
+``compute_graph`` call, so the server evaluates the whole tree in one request.
+
+``BatchRun`` keeps up to ``in_flight`` calls outstanding on a ``ServerPool``,
+which spreads them over its servers. Each call gets the next row as soon as a
+slot frees up, instead of sending one request per click. Calls ask for compact
+results. A call the server sheds as overloaded is sent again once the
+server's ``retryAfterMs`` has passed (doubled on each further retry), and rows waiting to be retried hold their
+slot meanwhile, so a shed burst is not sent straight back. Iterating a run
+yields ``Progress`` a few times a second, so a caller can redraw while calls
+are still in flight. ``results`` fills in as responses arrive.
+"""
+
+import ast
+import csv
+import heapq
+import io
+import time
+from collections import deque
+from concurrent import futures
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from admission import OVERLOADED
+from mcp_client import MCPError, structured_result
+from replay import percentiles
+from server_pool import ServerPool
+
+DEFAULT_IN_FLIGHT = 64
+# Times a call shed by an overloaded server is sent again.
+OVERLOAD_RETRIES = 3
+# Completed rows kept for the live preview.
+RECENT_ROWS = 200
+
+OPERATIONS = {
+    "add": "add", "+": "add",
+    "subtract": "subtract", "-": "subtract",
+    "multiply": "multiply", "*": "multiply", "×": "multiply", "x": "multiply",
+    "divide": "divide", "/": "divide", "÷": "divide",
+}
+_AST_OPERATIONS = {ast.Add: "add", ast.Sub: "subtract", ast.Mult: "multiply", ast.Div: "divide"}
+
+RESULT_COLUMNS = ["row", "input", "result", "error", "latency_ms"]
+
+
+class Row(NamedTuple):
+    """One line of input: the call it becomes, or why it cannot become one."""
+
+    label: str
+    tool: Optional[str] = None
+    arguments: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class Progress(NamedTuple):
+    completed: int
+    total: int
+    errors: int
+    elapsed: float
+    rows_per_second: float
+    latency_ms: Dict[str, float]
+    finished: bool
+
+
+def _number(text: str) -> float:
+    value = float(text)
+    if value != value or value in (float("inf"), float("-inf")):
+        raise ValueError(f"not a finite number: {text!r}")
+    return value
+
+
+def _is_number(text: str) -> bool:
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_csv(text: str) -> List[Row]:
+    """Rows of ``operation,a,b``; a header naming those columns is optional and may order them differently."""
+    records = [record for record in csv.reader(io.StringIO(text)) if any(field.strip() for field in record)]
+    columns = (0, 1, 2)
+    if records:
+        header = [field.strip().lower() for field in records[0]]
+        if {"operation", "a", "b"} <= set(header):
+            columns = (header.index("operation"), header.index("a"), header.index("b"))
+            records = records[1:]
+        elif len(header) >= 3 and header[0] not in OPERATIONS and not _is_number(header[1]):
+            records = records[1:]  # a header with other names: columns by position
+    rows = []
+    for record in records:
+        label = ",".join(field.strip() for field in record)
+        try:
+            operation, a, b = (record[column].strip() for column in columns)
+        except IndexError:
+            rows.append(Row(label, error="Error: expected operation, a and b"))
+            continue
+        tool = OPERATIONS.get(operation.lower())
+        if tool is None:
+            rows.append(Row(label, error=f"Error: unknown operation '{operation}'"))
+            continue
+        try:
+            rows.append(Row(label, tool, {"a": _number(a), "b": _number(b)}))
+        except ValueError as e:
+            rows.append(Row(label, error=f"Error: {str(e)}"))
+    return rows
+
+
+def expression_call(expression: str) -> Tuple[str, Dict[str, Any]]:
+    """The tool call that evaluates ``expression`` on the server; raises ValueError for anything but arithmetic."""
+    try:
+        tree = ast.parse(expression.replace("×", "*").replace("÷", "/"), mode="eval").body
+    except SyntaxError as e:
+        raise ValueError(f"cannot parse '{expression}': {e.msg}") from None
+    nodes: Dict[str, Dict[str, Any]] = {}
+
+    def operand(node: ast.AST) -> Any:
+        """A number, or a reference to the graph node that computes it."""
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return node.value
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            value = operand(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return value
+            if not isinstance(value, dict):
+                return -value
+            return add_node("multiply", -1, value)
+        if isinstance(node, ast.BinOp) and type(node.op) in _AST_OPERATIONS:
+            return add_node(_AST_OPERATIONS[type(node.op)], operand(node.left), operand(node.right))
+        raise ValueError(f"only numbers, + - * / and parentheses are supported in '{expression}'")
+
+    def add_node(tool: str, a: Any, b: Any) -> Dict[str, str]:
+        node_id = f"n{len(nodes)}"
+        nodes[node_id] = {"tool": tool, "arguments": {"a": a, "b": b}}
+        return {"ref": node_id}
+
+    output = operand(tree)
+    if not isinstance(output, dict):
+        raise ValueError(f"'{expression}' has no operation to calculate")
+    if len(nodes) == 1:
+        return nodes["n0"]["tool"], nodes["n0"]["arguments"]
+    return "compute_graph", {"nodes": nodes, "outputs": [output["ref"]]}
+
+
+def parse_expressions(text: str) -> List[Row]:
+    """One row per non-blank line; ``#`` starts a comment."""
+    rows = []
+    for line in text.splitlines():
+        expression = line.split("#", 1)[0].strip()
+        if not expression:
+            continue
+        try:
+            rows.append(Row(expression, *expression_call(expression)))
+        except ValueError as e:
+            rows.append(Row(expression, error=f"Error: {str(e)}"))
+    return rows
+
+
+def _value(row: Row, response: Dict[str, Any]) -> float:
+    structured = structured_result(response)
+    if row.tool == "compute_graph":
+        return next(iter(structured["results"].values()))
+    return structured["result"]
+
+
+class BatchRun:
+    """Rows executed with up to ``in_flight`` calls outstanding; iterate for ``Progress``."""
+
+    def __init__(self, pool: ServerPool, rows: List[Row], in_flight: int = DEFAULT_IN_FLIGHT,
+                 timeout: float = 30.0, update_interval: float = 0.25):
+        self.pool = pool
+        self.rows = rows
+        self.in_flight = max(1, in_flight)
+        self.timeout = timeout
+        self.update_interval = update_interval
+        # Per row, once done: {"row", "input", "result", "error", "latency_ms"}.
+        self.results: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        self.recent: Deque[int] = deque(maxlen=RECENT_ROWS)
+        self.completed = 0
+        self.errors = 0
+        self._latencies: List[float] = []
+        self._started = 0.0
+
+    def _finish(self, index: int, result: Optional[float], error: Optional[str], latency: Optional[float]):
+        self.results[index] = {"row": index + 1, "input": self.rows[index].label, "result": result, "error": error,
+                               "latency_ms": None if latency is None else round(latency * 1000, 3)}
+        self.recent.append(index)
+        self.completed += 1
+        if error is not None:
+            self.errors += 1
+        if latency is not None:
+            self._latencies.append(latency * 1000)
+
+    def progress(self) -> Progress:
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return Progress(self.completed, len(self.rows), self.errors, elapsed,
+                        self.completed / elapsed if elapsed > 0 else 0.0, percentiles(self._latencies),
+                        self.completed == len(self.rows))
+
+    def __iter__(self) -> Iterator[Progress]:
+        self._started = time.perf_counter()
+        # future -> (row index, attempt)
+        pending: Dict[futures.Future, Tuple[int, int]] = {}
+        finished_at: Dict[futures.Future, float] = {}
+        # row index -> when its first attempt was sent; a row's latency covers all its attempts
+        submitted: Dict[int, float] = {}
+        # (when the server allows it, row index, attempt) for calls shed as overloaded
+        retries: List[Tuple[float, int, int]] = []
+        waiting = iter(range(len(self.rows)))
+
+        def submit(index: int, attempt: int):
+            row = self.rows[index]
+            params = {"name": row.tool, "arguments": row.arguments, "_meta": {"compact": True}}
+            future = self.pool.submit("tools/call", params, self.timeout)
+            submitted.setdefault(index, time.perf_counter())
+            # Runs on the pool's thread as the response lands, so latency excludes our redraws.
+            future.add_done_callback(lambda done: finished_at.setdefault(done, time.perf_counter()))
+            pending[future] = (index, attempt)
+
+        last_update = self._started
+        try:
+            while True:
+                while retries and retries[0][0] <= time.perf_counter():
+                    _, index, attempt = heapq.heappop(retries)
+                    submit(index, attempt)
+                while len(pending) + len(retries) < self.in_flight:
+                    index = next(waiting, None)
+                    if index is None:
+                        break
+                    if self.rows[index].error is not None:
+                        self._finish(index, None, self.rows[index].error, None)
+                    else:
+                        submit(index, 0)
+                if not pending and not retries:
+                    break
+                wait = self.update_interval
+                if retries:
+                    wait = max(0.0, min(wait, retries[0][0] - time.perf_counter()))
+                if pending:
+                    done, _ = futures.wait(pending, timeout=wait, return_when=futures.FIRST_COMPLETED)
+                else:
+                    done = set()
+                    time.sleep(wait)
+                for future in done:
+                    index, attempt = pending.pop(future)
+                    latency = finished_at.pop(future, time.perf_counter()) - submitted[index]
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        self._finish(index, None, f"Error: {str(e) or type(e).__name__}", latency)
+                        continue
+                    error = response.get("error") or {}
+                    if error.get("code") == OVERLOADED and attempt < OVERLOAD_RETRIES:
+                        # The server's hint, doubled for each attempt already shed.
+                        retry_after = ((error.get("data") or {}).get("retryAfterMs") or 0) / 1000 * 2 ** attempt
+                        heapq.heappush(retries, (time.perf_counter() + retry_after, index, attempt + 1))
+                        continue
+                    try:
+                        self._finish(index, _value(self.rows[index], response), None, latency)
+                    except MCPError as e:
+                        message = str(e)
+                        self._finish(index, None, message if message.startswith("Error") else f"Error: {message}",
+                                     latency)
+                now = time.perf_counter()
+                if now - last_update >= self.update_interval:
+                    last_update = now
+                    yield self.progress()
+        finally:
+            for future in pending:
+                future.cancel()
+        yield self.progress()
+
+    def recent_results(self) -> List[Dict[str, Any]]:
+        """The most recently completed rows, newest first."""
+        return [self.results[index] for index in reversed(self.recent)]
+
+
+def to_csv(results: List[Optional[Dict[str, Any]]]) -> str:
+    """Completed results as CSV text, in input order."""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, RESULT_COLUMNS, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(result for result in results if result is not None)
+    return output.getvalue()
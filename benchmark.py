@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the calculator server.
+
+``startup`` measures cold start, which dominates short-lived agent sessions:
+
+* import time of the server module, from ``python -X importtime``, with the
+  slowest imports by cumulative time
+* time from launching ``calculator_server.py`` to its first ``initialize``
+  response over stdio
+* time from launching a TCP server on port 0 to its ``--ready-file`` appearing,
+  and to a connected ``initialize``
+
+Run ``python benchmark.py startup --runs 20``.
+
+``fork`` compares a fresh ``calculator_server.py`` per session with sessions
+forked from a ``--zygote`` (see ``zygote.py``):
+
+* session start latency, from asking for a server to its ``initialize`` response
+* memory of N concurrent sessions from ``/proc/<pid>/smaps_rollup``: resident,
+  proportional (PSS, which splits shared pages between their users) and private
+  (dirtied or allocated by the session itself) per session
+
+Run ``python benchmark.py fork --runs 50 --sessions 20``.
+
+``backends`` runs the same workload against the hand-rolled
+``calculator_server.py`` and the mcp SDK based ``simple_server.py`` (see
+``sdk_server.py``), each over stdio:
+
+* time from launch to the ``initialize`` response
+* ``tools/list`` latency, and ``add`` latency with one call in flight
+* ``add`` throughput with ``--pipeline`` calls in flight
+* ``random_normal`` throughput with ``--parallel`` calls in flight, which
+  measures the process pool
+
+The SDK backend is skipped if the ``mcp`` package is not installed. Run
+``python benchmark.py backends --calls 2000``.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mcp_client import AsyncClient, Client, wait_for_ready_file
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(HERE, "calculator_server.py")
+SDK_SERVER_SCRIPT = os.path.join(HERE, "simple_server.py")
+
+
+def import_profile(module: str) -> Tuple[float, Dict[str, float]]:
+    """(total ms, {module: cumulative ms}) for importing ``module`` in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=HERE, capture_output=True, text=True, check=True)
+    cumulative: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+        cumulative[name] = int(cumulative_us) / 1000
+    return cumulative[module], cumulative
+
+
+def time_stdio_initialize() -> float:
+    started = time.perf_counter()
+    client = Client.spawn([sys.executable, SERVER_SCRIPT], cwd=HERE)
+    try:
+        client.initialize({"name": "benchmark", "version": "1.0"}, timeout=30)
+        return (time.perf_counter() - started) * 1000
+    finally:
+        client.close()
+
+
+def time_socket_ready() -> Tuple[float, float]:
+    """(ms until the ready file appears, ms until a connected client is initialized)."""
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, SERVER_SCRIPT, "--tcp", "127.0.0.1:0", "--ready-file", ready_file],
+                                   cwd=HERE, stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            info = wait_for_ready_file(ready_file, timeout=30, process=process)
+            ready = (time.perf_counter() - started) * 1000
+            host, _, port = info["address"].rpartition(":")
+            with Client.connect(host, int(port)) as client:
+                client.initialize({"name": "benchmark", "version": "1.0"}, timeout=30)
+            return ready, (time.perf_counter() - started) * 1000
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def summarize(samples: List[float]) -> str:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return f"median {statistics.median(ordered):7.1f} ms   min {ordered[0]:7.1f} ms   p95 {p95:7.1f} ms"
+
+
+def repeat(measure: Callable[[], float], runs: int) -> List[float]:
+    measure()  # warm the OS page cache and bytecode caches
+    return [measure() for _ in range(runs)]
+
+
+def startup(args: argparse.Namespace):
+    print(f"Cold start of calculator_server ({args.runs} runs, {sys.executable})")
+    if sys.flags.dont_write_bytecode:
+        print("  note: PYTHONDONTWRITEBYTECODE is set, so every run also recompiles sources")
+
+    profiles = [import_profile(args.module) for _ in range(args.runs + 1)][1:]
+    print(f"\nimport {args.module}: {summarize([total for total, _ in profiles])}")
+    names = profiles[0][1].keys()
+    medians = {name: statistics.median(profile.get(name, 0.0) for _, profile in profiles) for name in names}
+    print("  slowest imports (cumulative, median):")
+    for name, elapsed in sorted(medians.items(), key=lambda item: -item[1])[1:args.top + 1]:
+        print(f"    {elapsed:7.1f} ms  {name}")
+    for heavy in ("numpy", "multiprocessing", "statistics", "msgpack", "cbor2"):
+        print(f"  {heavy:>16}: {'imported at startup' if heavy in medians else 'deferred'}")
+
+    print(f"\nstdio launch -> initialize response: {summarize(repeat(time_stdio_initialize, args.runs))}")
+
+    socket_runs = [time_socket_ready() for _ in range(args.runs + 1)][1:]
+    print(f"tcp launch -> --ready-file:          {summarize([ready for ready, _ in socket_runs])}")
+    print(f"tcp launch -> connected initialize:  {summarize([connected for _, connected in socket_runs])}")
+    print("\n(previously clients slept a fixed 500 ms, test_simple_server 1000 ms, launch_demo 3000 ms)")
+
+
+def session_memory(pid: int) -> Optional[Dict[str, int]]:
+    """{"rss", "pss", "private"} in kB for ``pid``, or None where smaps_rollup is unavailable."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as rollup:
+            fields = dict(line.split(":", 1) for line in rollup if ":" in line and line[0].isupper())
+    except OSError:
+        return None
+    kb = {name: int(value.split()[0]) for name, value in fields.items() if value.strip().endswith("kB")}
+    return {"rss": kb["Rss"], "pss": kb["Pss"], "private": kb["Private_Clean"] + kb["Private_Dirty"]}
+
+
+async def open_sessions(connect: Callable[[], Any], count: int) -> Tuple[List[float], List[AsyncClient]]:
+    """Start ``count`` sessions one after another; (ms to each initialize response, the clients)."""
+    latencies, clients = [], []
+    for _ in range(count):
+        started = time.perf_counter()
+        client = await connect()
+        await client.initialize({"name": "benchmark", "version": "1.0"}, timeout=30)
+        latencies.append((time.perf_counter() - started) * 1000)
+        clients.append(client)
+    return latencies, clients
+
+
+async def measure_sessions(connect: Callable[[], Any], runs: int, sessions: int):
+    """Latency of ``runs`` sequential sessions, then memory of ``sessions`` held open at once."""
+    latencies = []
+    for _ in range(runs + 1):
+        elapsed, clients = await open_sessions(connect, 1)
+        latencies += elapsed
+        await clients[0].close()
+    _, clients = await open_sessions(connect, sessions)
+    try:
+        # Touch every session once more, as a client would, so lazily built state is counted.
+        await asyncio.gather(*(client.call_tool("add", {"a": 1, "b": 2}, timeout=30) for client in clients))
+        memory = [session_memory(client.process.pid) for client in clients]
+    finally:
+        await asyncio.gather(*(client.close() for client in clients))
+    return latencies[1:], memory
+
+
+def report_memory(memory: List[Optional[Dict[str, int]]]):
+    if not memory or memory[0] is None:
+        print("  memory: /proc/<pid>/smaps_rollup is not available here")
+        return
+    for key, label in (("rss", "resident"), ("pss", "proportional"), ("private", "private")):
+        per_session = statistics.median(sample[key] for sample in memory) / 1024
+        print(f"  {label + ' per session:':>26} {per_session:7.1f} MB")
+    shared = 1 - statistics.median(sample["private"] / sample["rss"] for sample in memory)
+    print(f"  {'shared:':>26} {shared:7.1%} of resident pages")
+
+
+def fork(args: argparse.Namespace):
+    print(f"Per-session start: spawn vs zygote fork ({args.runs} runs, {args.sessions} concurrent sessions)")
+    spawn_latency, spawn_memory = asyncio.run(measure_sessions(
+        lambda: AsyncClient.spawn([sys.executable, SERVER_SCRIPT], cwd=HERE), args.runs, args.sessions))
+    print(f"\nspawn calculator_server.py -> initialize: {summarize(spawn_latency)}")
+    report_memory(spawn_memory)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path, ready_file = os.path.join(directory, "zygote.sock"), os.path.join(directory, "ready.json")
+        started = time.perf_counter()
+        zygote = subprocess.Popen([sys.executable, SERVER_SCRIPT, "--zygote", path, "--ready-file", ready_file],
+                                  cwd=HERE, stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_ready_file(ready_file, timeout=60, process=zygote)
+            print(f"\nzygote preloaded and ready in {(time.perf_counter() - started) * 1000:.1f} ms")
+            fork_latency, fork_memory = asyncio.run(measure_sessions(
+                lambda: AsyncClient.fork(path), args.runs, args.sessions))
+        finally:
+            zygote.terminate()
+            zygote.wait()
+    print(f"fork from zygote -> initialize:          {summarize(fork_latency)}")
+    report_memory(fork_memory)
+
+
+async def measure_backend(command: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    """Launch, latency and throughput figures for one stdio server."""
+    launches = []
+    for _ in range(args.runs + 1):
+        started = time.perf_counter()
+        client = await AsyncClient.spawn(command, cwd=HERE)
+        try:
+            await client.initialize({"name": "benchmark", "version": "1.0"}, timeout=60)
+            launches.append((time.perf_counter() - started) * 1000)
+        finally:
+            await client.close()
+
+    async def timed(call: Callable[[], Any]) -> float:
+        started = time.perf_counter()
+        response = await call()
+        if isinstance(response, dict) and ("error" in response or response["result"].get("isError")):
+            raise RuntimeError(f"{command[-1]}: {response}")
+        return (time.perf_counter() - started) * 1000
+
+    async def throughput(call: Callable[[int], Any], count: int, in_flight: int) -> float:
+        limit = asyncio.Semaphore(in_flight)
+
+        async def one(index: int):
+            async with limit:
+                await timed(lambda: call(index))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(count)))
+        return count / (time.perf_counter() - started)
+
+    client = await AsyncClient.spawn(command, cwd=HERE)
+    try:
+        await client.initialize({"name": "benchmark", "version": "1.0"}, timeout=60)
+        add = lambda index: client.call_tool("add", {"a": index, "b": 0.5}, timeout=60)  # noqa: E731
+        normal = lambda index: client.call_tool("random_normal", {"count": args.samples, "seed": index + 1},  # noqa: E731
+                                                timeout=60)
+        await throughput(add, 100, 10)  # warm up both servers and the pools
+        await throughput(normal, args.parallel, args.parallel)
+        return {
+            "launch": launches[1:],
+            "list": [await timed(client.list_tools) for _ in range(args.runs * 10)],
+            "add": [await timed(lambda: add(index)) for index in range(args.calls)],
+            "pipelined": await throughput(add, args.calls, args.pipeline),
+            "parallel": await throughput(normal, args.heavy_calls, args.parallel),
+        }
+    finally:
+        await client.close()
+
+
+def backends(args: argparse.Namespace):
+    servers = [("calculator_server.py (hand-rolled)", [sys.executable, SERVER_SCRIPT])]
+    if importlib.util.find_spec("mcp") is None:
+        print(f"mcp is not installed for {sys.executable}; skipping simple_server.py (pip install -r requirements.txt)")
+    else:
+        servers.append(("simple_server.py (mcp SDK)", [sys.executable, SDK_SERVER_SCRIPT]))
+    print(f"Backends side by side ({args.calls} add calls, {args.heavy_calls} random_normal calls "
+          f"of {args.samples} samples, {sys.executable})")
+    for label, command in servers:
+        figures = asyncio.run(measure_backend(command, args))
+        print(f"\n{label}")
+        rows = [
+            ("launch -> initialize", summarize(figures["launch"])),
+            ("tools/list", summarize(figures["list"])),
+            ("add, 1 in flight", summarize(figures["add"])),
+            (f"add, {args.pipeline} in flight", f"{figures['pipelined']:9.0f} calls/s"),
+            (f"random_normal, {args.parallel} in flight", f"{figures['parallel']:9.1f} calls/s"),
+        ]
+        for name, value in rows:
+            print(f"  {name + ':':<30} {value}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Calculator server benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    startup_parser = commands.add_parser("startup", help="Import time and time-to-ready of a fresh server")
+    startup_parser.add_argument("--runs", type=int, default=10)
+    startup_parser.add_argument("--top", type=int, default=12, help="How many of the slowest imports to list")
+    startup_parser.add_argument("--module", default="calculator_server", help="Module whose import is profiled")
+    startup_parser.set_defaults(run=startup)
+    fork_parser = commands.add_parser("fork", help="Session start latency and shared memory: spawn vs zygote")
+    fork_parser.add_argument("--runs", type=int, default=30)
+    fork_parser.add_argument("--sessions", type=int, default=10, help="Concurrent sessions for the memory figures")
+    fork_parser.set_defaults(run=fork)
+    backends_parser = commands.add_parser("backends", help="calculator_server.py vs the mcp SDK simple_server.py")
+    backends_parser.add_argument("--runs", type=int, default=5, help="Launches timed per backend")
+    backends_parser.add_argument("--calls", type=int, default=1000, help="add calls per measurement")
+    backends_parser.add_argument("--pipeline", type=int, default=32, help="add calls in flight for throughput")
+    backends_parser.add_argument("--heavy-calls", type=int, default=64, help="random_normal calls")
+    backends_parser.add_argument("--parallel", type=int, default=os.cpu_count() or 1,
+                                 help="random_normal calls in flight")
+    backends_parser.add_argument("--samples", type=int, default=10_000, help="Samples per random_normal call")
+    backends_parser.set_defaults(run=backends)
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Chunked CSV bulk computation for the calculator server.
+
+A CSV (or any delimited text file with a header row) is read a fixed number
+of rows at a time. Only the columns the computation needs are converted, one
+column list (or NumPy array) per chunk, and each chunk's results are appended
+to the output file before the next chunk is read.
+"""
+
+import csv
+import math
+import time
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional
+
+from expressions import Expression
+from lazy_imports import optional_import
+
+# NumPy is optional (column lists are the fallback) and imported on first use.
+np = optional_import("numpy")
+
+DEFAULT_CHUNK_ROWS = 50_000
+
+_OPERATION_SYMBOLS = {"add": "+", "subtract": "-", "multiply": "*", "divide": "/"}
+
+
+def build_expression(operation: Optional[str] = None, columns: Optional[List[str]] = None,
+                     expression: Optional[str] = None, operand: Optional[float] = None) -> Expression:
+    """Turn either an expression or an operation over columns into an Expression."""
+    if expression is not None:
+        return Expression(expression)
+    if operation not in _OPERATION_SYMBOLS:
+        raise ValueError(f"Unknown operation '{operation}'")
+    columns = list(columns or [])
+    if len(columns) == 2 and operand is None:
+        return Expression(f"c0 {_OPERATION_SYMBOLS[operation]} c1")
+    if len(columns) == 1 and operand is not None:
+        return Expression(f"c0 {_OPERATION_SYMBOLS[operation]} ({float(operand)!r})")
+    raise ValueError("An operation needs two columns, or one column and an 'operand'")
+
+
+def _parse_column(values: List[str]) -> Any:
+    if np is not None:
+        try:
+            return np.array(values, dtype=float)
+        except ValueError:
+            pass
+    parsed = []
+    for value in values:
+        try:
+            parsed.append(float(value))
+        except ValueError:
+            parsed.append(math.nan)
+    return np.array(parsed) if np is not None else parsed
+
+
+def iter_bulk_compute(path: str, output_path: str, operation: Optional[str] = None,
+                      columns: Optional[List[str]] = None, expression: Optional[str] = None,
+                      operand: Optional[float] = None, output_column: str = "result",
+                      delimiter: str = ",", chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[Dict[str, Any]]:
+    """Process the file chunk by chunk, yielding a progress report after each chunk.
+
+    The last report yielded has ``"done": True``.
+    """
+    compiled = build_expression(operation, columns, expression, operand)
+    chunk_rows = max(1, int(chunk_rows))
+    started = time.perf_counter()
+    rows = invalid = chunks = 0
+
+    with open(path, newline="") as source, open(output_path, "w", newline="") as sink:
+        reader = csv.reader(source, delimiter=delimiter)
+        writer = csv.writer(sink, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError(f"'{path}' is empty")
+        header = [name.strip() for name in header]
+
+        if expression is not None:
+            bindings = {name: name for name in compiled.variables}
+        else:
+            bindings = {f"c{i}": name for i, name in enumerate(columns)}
+        missing = [name for name in bindings.values() if name not in header]
+        if missing:
+            raise ValueError(f"Columns not found in header: {', '.join(missing)}")
+        indices = {variable: header.index(name) for variable, name in bindings.items()}
+        writer.writerow([output_column])
+
+        while True:
+            block = list(islice(reader, chunk_rows))
+            if not block:
+                break
+            data = {
+                variable: _parse_column([row[index] if index < len(row) else "" for row in block])
+                for variable, index in indices.items()
+            }
+            results = compiled.evaluate_columns(data, len(block))
+            if not isinstance(results, list):
+                results = results.tolist()
+            invalid += sum(1 for value in results if not math.isfinite(value))
+            writer.writerows([value] for value in results)
+            rows += len(block)
+            chunks += 1
+            del block, data, results
+
+            elapsed = time.perf_counter() - started
+            yield {
+                "done": False,
+                "rows": rows,
+                "chunks": chunks,
+                "invalid": invalid,
+                "seconds": elapsed,
+                "rows_per_second": rows / elapsed if elapsed > 0 else 0.0,
+            }
+
+    elapsed = time.perf_counter() - started
+    yield {
+        "done": True,
+        "rows": rows,
+        "chunks": chunks,
+        "invalid": invalid,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed > 0 else 0.0,
+        "output_path": output_path,
+    }
+
+
+def bulk_compute(**arguments: Any) -> Dict[str, Any]:
+    """Run a bulk computation to completion and return the final report."""
+    report = {}
+    for report in iter_bulk_compute(**arguments):
+        pass
+    return report
@@ -3,32 +3,479 @@
 Working MCP Calculator Server
 """
 
+import argparse
 import asyncio
+import functools
+import hmac
 import json
+import operator
+import os
+import secrets
+import signal
 import sys
-from typing import Any, Dict
+import tempfile
+import time
+from concurrent import futures
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from admission import BULK, INTERACTIVE, NORMAL, AdmissionController, CostClass, Overloaded
+from bulk_compute import bulk_compute, iter_bulk_compute
+from dataset_io import elementwise_dataset, reduce_dataset
+from finance_tools import amortization_schedule, annuity, compound_table, irr, npv
+from framing import CODECS, compact_arrays, frame, negotiate, read_frame_sync
+from lazy_imports import lazy_import
+from metrics import Metrics, merge_snapshots, read_snapshots, summarize, write_snapshot
+from random_tools import (CHUNK_SAMPLES, monte_carlo, monte_carlo_block, monte_carlo_plan,
+                          monte_carlo_summary, random_samples)
+from recorder import Recorder
+from streaming_json import STREAM_THRESHOLD, Parsed, decode_parsed, read_line
+from tool_schemas import TOOLS
+from tracing import Tracer, current_trace
+
+# Shared memory brings in most of multiprocessing; load it when an array tool is first used.
+shared_arrays = lazy_import("shared_arrays")
+# cProfile, pstats and tracemalloc are only needed once an admin asks for them.
+diagnostics = lazy_import("diagnostics")
+
+
+class ToolError(Exception):
+    """A tool call that failed in an expected way; its message is returned to the client as the result text."""
+
+
+def _number(arguments: Dict[str, Any], key: str) -> float:
+    """Argument ``key`` as a float, with a short error rather than float()'s repr of a possibly huge value."""
+    value = arguments.get(key, 0)
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    raise ToolError(f"'{key}' expected a number, got {type(value).__name__}")
+
+
+def _operands(arguments: Dict[str, Any]):
+    return _number(arguments, "a"), _number(arguments, "b")
+
+
+def _binary_operation(func: Callable[[float, float], float]) -> Callable[[Dict[str, Any]], float]:
+    def operation(arguments: Dict[str, Any]) -> float:
+        return func(*_operands(arguments))
+    return operation
+
+
+def _divide(arguments: Dict[str, Any]) -> float:
+    a, b = _operands(arguments)
+    if b == 0:
+        raise ZeroDivisionError("Cannot divide by zero")
+    return a / b
+
+
+# Numeric implementations used wherever a tool's raw value is needed rather than
+# its prose reply (e.g. graph nodes). Worker processes look entries up by name
+# through run_operation, so only the name and arguments cross the pool boundary.
+OPERATIONS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "add": _binary_operation(operator.add),
+    "subtract": _binary_operation(operator.sub),
+    "multiply": _binary_operation(operator.mul),
+    "divide": _divide,
+    "dataset_reduce": lambda arguments: reduce_dataset(
+        arguments["path"], arguments["operation"], arguments.get("dtype")
+    )["value"],
+    "dataset_elementwise": lambda arguments: elementwise_dataset(
+        arguments["path"], arguments["operation"], arguments["output_path"],
+        operand=arguments.get("operand"), operand_path=arguments.get("operand_path"),
+        dtype=arguments.get("dtype")
+    )["output_path"],
+    "bulk_compute": lambda arguments: bulk_compute(**_bulk_arguments(arguments))["rows"],
+    "random_uniform": lambda arguments: _random_result(random_samples("uniform", **_random_arguments(arguments))),
+    "random_normal": lambda arguments: _random_result(random_samples("normal", **_random_arguments(arguments))),
+    "monte_carlo": lambda arguments: monte_carlo(**_monte_carlo_arguments(arguments))["mean"],
+    "amortization_schedule": lambda arguments: amortization_schedule(**_finance_arguments("amortization_schedule", arguments)),
+    "npv": lambda arguments: npv(arguments["rate"], arguments["cashflows"]),
+    "irr": lambda arguments: irr(arguments["cashflows"], arguments.get("guess", 0.1)),
+    "compound_table": lambda arguments: compound_table(**_finance_arguments("compound_table", arguments)),
+    "annuity": lambda arguments: annuity(**_finance_arguments("annuity", arguments)),
+    "array_elementwise": lambda arguments: shared_arrays.elementwise(
+        arguments["operation"], arguments["array"], operand=arguments.get("operand"),
+        operand_array=arguments.get("operand_array"), output=arguments.get("output")
+    )["output"],
+    "array_reduce": lambda arguments: shared_arrays.reduce(arguments["operation"], arguments["array"])["value"],
+}
+
+# Operations expensive enough to be worth shipping to a worker process.
+HEAVY_OPERATIONS = {
+    "dataset_reduce", "dataset_elementwise", "bulk_compute", "random_uniform", "random_normal", "monte_carlo",
+    "amortization_schedule", "compound_table"
+}
+# Tools admitted as "heavy": the process-pool operations, plus the shared-memory array
+# tools, which stay in this process (the segments are mapped here) but cost as much.
+HEAVY_TOOLS = HEAVY_OPERATIONS | {"array_elementwise", "array_reduce"}
+# Operations that pick a fresh seed when given none, so equal arguments do not mean equal results.
+RANDOM_OPERATIONS = {"random_uniform", "random_normal", "monte_carlo"}
+
+# Answered even when the server is shedding load (see admission.py).
+UNLIMITED_METHODS = {"initialize", "ping", "server/metrics"}
+# Methods under this prefix need --admin-token (or SIGUSR2) and bypass admission control too (see diagnostics.py).
+ADMIN_PREFIX = "admin/"
+# JSON-RPC error code for an admin request without the right token.
+ADMIN_UNAUTHORIZED = -32003
+DEFAULT_MAX_IN_FLIGHT = 1024
+DEFAULT_MAX_QUEUED_BYTES = 256 * 1024 * 1024
+# Values of a request's params._meta.priority hint, mapped to scheduler bands.
+PRIORITIES = {"interactive": INTERACTIVE, "normal": NORMAL, "bulk": BULK}
+
+
+def build_admission(max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, max_queued_bytes: int = DEFAULT_MAX_QUEUED_BYTES,
+                    heavy_concurrency: Optional[int] = None, heavy_queue: Optional[int] = None,
+                    rate_limit: float = 0, rate_burst: Optional[float] = None) -> AdmissionController:
+    """Admission limits (0 means unlimited). By default heavy tools get one lane per pool worker and a queue twice that."""
+    heavy = heavy_concurrency or os.cpu_count() or 1
+    return AdmissionController(max_in_flight or None, max_queued_bytes or None, {
+        "light": CostClass("light"),
+        "heavy": CostClass("heavy", heavy, 2 * heavy if heavy_queue is None else heavy_queue),
+    }, rate_limit or None, rate_burst)
+
+
+def is_admin(request: Dict[str, Any]) -> bool:
+    method = request.get("method")
+    return isinstance(method, str) and method.startswith(ADMIN_PREFIX)
+
+
+def request_priority(request: Dict[str, Any]) -> int:
+    """Scheduler band from ``params._meta.priority`` ("interactive", "normal", "bulk"); unknown hints count as normal."""
+    params = request.get("params")
+    meta = params.get("_meta") if isinstance(params, dict) else None
+    hint = meta.get("priority") if isinstance(meta, dict) else None
+    return PRIORITIES.get(hint, NORMAL) if isinstance(hint, str) else NORMAL
+
+
+def client_weight(spec: str) -> Tuple[str, float]:
+    """Parse a ``--client-weight NAME=WEIGHT`` option."""
+    name, _, weight = spec.rpartition("=")
+    try:
+        value = float(weight)
+    except ValueError:
+        value = 0.0
+    if not name or not value > 0:
+        raise argparse.ArgumentTypeError(f"expected NAME=WEIGHT with a positive weight, got {spec!r}")
+    return name, value
+
+
+_FINANCE_PARAMETERS = {
+    tool["name"]: tuple(tool["inputSchema"]["properties"])
+    for tool in TOOLS if tool["name"] in ("amortization_schedule", "compound_table", "annuity")
+}
+
+_BULK_PARAMETERS = ("path", "output_path", "operation", "columns", "operand", "expression",
+                    "output_column", "delimiter", "chunk_rows")
+
+
+def _bulk_arguments(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    for key in ("path", "output_path"):
+        if key not in arguments:
+            raise ValueError(f"Missing required argument '{key}'")
+    return {key: arguments[key] for key in _BULK_PARAMETERS if key in arguments}
+
+
+def _random_arguments(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    keys = ("count", "seed", "output_path", "low", "high", "mean", "std")
+    return {key: arguments[key] for key in keys if key in arguments}
+
+
+def _random_result(report: Dict[str, Any]) -> Any:
+    return report["values"] if "values" in report else report["output_path"]
+
+
+def _finance_arguments(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    keys = _FINANCE_PARAMETERS[tool_name]
+    return {key: arguments[key] for key in keys if key in arguments}
+
+
+def _monte_carlo_arguments(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    keys = ("expression", "variables", "samples", "seed", "confidence")
+    return {key: arguments[key] for key in keys if key in arguments}
+
+
+def run_operation(tool_name: str, arguments: Dict[str, Any]) -> Any:
+    """Run a numeric operation by name (process-pool entry point)."""
+    return OPERATIONS[tool_name](arguments)
+
+
+def _is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and "ref" in value
+
+
+def _node_refs(value: Any) -> List[str]:
+    """Collect the node ids referenced anywhere inside an argument value."""
+    if _is_ref(value):
+        return [value["ref"]]
+    if isinstance(value, dict):
+        return [ref for item in value.values() for ref in _node_refs(item)]
+    if isinstance(value, list):
+        return [ref for item in value for ref in _node_refs(item)]
+    return []
+
+
+def _substitute(value: Any, mapping: Dict[str, Any]) -> Any:
+    """Replace every {"ref": id} inside an argument value with mapping[id]."""
+    if _is_ref(value):
+        return mapping[value["ref"]]
+    if isinstance(value, dict):
+        return {key: _substitute(item, mapping) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, mapping) for item in value]
+    return value
+
+
+class Session:
+    """Per-connection state plus the channel used to send messages back to that client."""
+
+    def __init__(self, send: Callable[[Dict[str, Any]], Awaitable[None]], peer: str = "stdio",
+                 framing: bool = True):
+        self.send = send
+        self.peer = peer
+        self.client_info: Optional[Dict[str, Any]] = None
+        self.initialized = False
+        # Share of contended cost classes relative to other sessions (see admission.py).
+        self.weight = 1.0
+        # Default for tools/call results without prose (see MCPServer.call_tool); chosen at initialize.
+        self.compact = False
+        # Stream transports (stdio, sockets) can switch to a binary encoding at
+        # initialize; the switch happens once the initialize response is sent.
+        self.framing = framing
+        self.encoding = "json"
+        self.next_encoding: Optional[str] = None
+        # JSON-RPC id -> task of a request in progress, for notifications/cancelled.
+        self.requests: Dict[Any, asyncio.Task] = {}
+
+    def cancel_request(self, request_id: Any) -> bool:
+        """Cancel this client's request ``request_id``; False if it is not in progress."""
+        task = self.requests.get(request_id) if isinstance(request_id, (str, int)) else None
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def switch_encoding(self) -> bool:
+        """Adopt the encoding negotiated by initialize; call after sending its response."""
+        if self.next_encoding is None:
+            return False
+        self.encoding, self.next_encoding = self.next_encoding, None
+        return True
+
+
+async def _send_stdout(message: Dict[str, Any]):
+    trace = current_trace.get()
+    started = time.perf_counter() if trace is not None else 0.0
+    if _stdio_session.encoding == "json":
+        data = json.dumps(message).encode() + b"\n"
+    else:
+        data = frame(CODECS[_stdio_session.encoding].encode(message))
+    encoded = time.perf_counter() if trace is not None else 0.0
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
+    if trace is not None:
+        trace.sent(message, started, encoded)
+
+
+def _timed(read: Callable[..., Any], *args: Any) -> Tuple[Any, float]:
+    """``read(*args)`` and the ``perf_counter()`` time it returned, for reads done in a thread."""
+    return read(*args), time.perf_counter()
+
+
+_stdio_session = Session(_send_stdout)
+
+# Session of the request being handled; each request task sees its own connection's.
+current_session: ContextVar[Session] = ContextVar("current_session", default=_stdio_session)
+
 
 class MCPServer:
     def __init__(self, name: str):
         self.name = name
         self.version = "1.0.0"
+        self._executor: Optional["futures.ProcessPoolExecutor"] = None
+        self.metrics = Metrics()
+        # Set in multi-worker mode: every worker publishes snapshots here so
+        # server/metrics can report totals across the whole group.
+        self.metrics_dir: Optional[str] = None
+        self._in_flight = 0
+        self.admission = build_admission()
+        # clientInfo name -> fair-share weight, applied to sessions at initialize.
+        self.client_weights: Dict[str, float] = {}
+        # Set by --record: keeps a copy of the traffic for replay.py.
+        self.recorder: Optional[Recorder] = None
+        # Set by --trace: writes per-phase spans of sampled requests.
+        self.tracer: Optional[Tracer] = None
+        # Token the admin/* methods require; None while they are disabled.
+        self.admin_token: Optional[str] = None
+        self.diagnostics: Optional["diagnostics.Diagnostics"] = None
+        # JSON messages at least this long are decoded as they are read (see streaming_json); 0 never.
+        self.stream_threshold = STREAM_THRESHOLD
+
+    def _get_executor(self) -> "futures.ProcessPoolExecutor":
+        """Create the worker pool for heavy operations on first use."""
+        if self._executor is None:
+            self._executor = futures.ProcessPoolExecutor(max_workers=os.cpu_count())
+        return self._executor
+
+    async def run_in_pool(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a picklable module-level function in the worker pool."""
+        loop = asyncio.get_running_loop()
+        trace = current_trace.get()
+        if trace is None:
+            return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+        finally:
+            trace.add("pool", started)
+
+    async def execute(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        """Run a numeric operation, in the process pool if it is heavy."""
+        if tool_name in HEAVY_OPERATIONS:
+            return await self.run_in_pool(run_operation, tool_name, arguments)
+        return run_operation(tool_name, arguments)
+
+    def shutdown(self):
+        """Release the worker pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
         
-    async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
-        """Handle incoming MCP requests."""
+    def update_gauges(self):
+        self.metrics.set_gauge("in_flight", self._in_flight)
+        for name, value in self.admission.gauges().items():
+            self.metrics.set_gauge(name, value)
+        if self.recorder is not None:
+            self.metrics.set_gauge("recorded", self.recorder.recorded)
+            self.metrics.set_gauge("record_dropped", self.recorder.dropped)
+        if self.tracer is not None:
+            for name, value in self.tracer.gauges().items():
+                self.metrics.set_gauge(name, value)
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        """This process's metrics, or the merged view of all workers in multi-worker mode."""
+        self.update_gauges()
+        if self.metrics_dir is None:
+            return summarize(merge_snapshots([self.metrics.snapshot()]))
+        write_snapshot(self.metrics_dir, self.metrics.snapshot())
+        return summarize(merge_snapshots(read_snapshots(self.metrics_dir)))
+
+    def cost_class(self, request: Dict[str, Any]) -> Optional[str]:
+        """Admission class of a request: "heavy" for expensive tools, None for control methods.
+
+        A calculation graph is heavy if any of its nodes is.
+        """
+        method = request.get("method")
+        if method in UNLIMITED_METHODS or is_admin(request):
+            return None
+        params = request.get("params") or {}
+        if method != "tools/call" or not isinstance(params, dict):
+            return "light"
+        name = params.get("name")
+        if name == "compute_graph":
+            arguments = params.get("arguments")
+            nodes = arguments.get("nodes") if isinstance(arguments, dict) else None
+            if isinstance(nodes, dict) and any(isinstance(node, dict) and node.get("tool") in HEAVY_TOOLS
+                                               for node in nodes.values()):
+                return "heavy"
+        elif name in HEAVY_TOOLS:
+            return "heavy"
+        return "light"
+
+    async def handle_request(self, request: Dict[str, Any], size: int = 0) -> Optional[Dict[str, Any]]:
+        """Handle incoming MCP requests, recording count, errors and latency.
+
+        ``size`` is the request's encoded length, counted against the queued-bytes limit.
+        Returns None, and sends no response, if the client cancels the request.
+        """
+        started = time.perf_counter()
+        session = current_session.get()
+        # Admin requests carry the token and change server state, so they are never recorded.
+        recording = self.recorder is not None and not is_admin(request) and self.recorder.sampled(request)
+        trace = current_trace.get()
+        cost_class, priority = self.cost_class(request), request_priority(request)
+        if trace is not None:
+            queued = time.perf_counter()
+            trace.add("validate", started, queued)
+
+        async def admit_and_dispatch() -> Dict[str, Any]:
+            async with self.admission.admit(cost_class, size, session, priority, session.weight):
+                if trace is None:
+                    return await self.dispatch(request)
+                admitted = time.perf_counter()
+                trace.add("queue", queued, admitted)
+                response = await self.dispatch(request)
+                trace.add("compute", admitted)
+                return response
+
+        # A task of its own, so notifications/cancelled can stop it (queued or running)
+        # without cancelling the transport's task.
+        request_id = request.get("id")
+        task = asyncio.ensure_future(admit_and_dispatch())
+        if isinstance(request_id, (str, int)):
+            session.requests[request_id] = task
+        self._in_flight += 1
+        try:
+            await asyncio.wait((task,))
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            self._in_flight -= 1
+            if isinstance(request_id, (str, int)) and session.requests.get(request_id) is task:
+                del session.requests[request_id]
+        self.metrics.increment("requests")
+        self.metrics.increment(f"method:{request.get('method')}")
+        if task.cancelled():
+            self.metrics.increment("cancelled")
+            return None
+        try:
+            response = task.result()
+        except Overloaded as e:
+            response = {"jsonrpc": "2.0", "id": request_id, "error": e.error()}
+            self.metrics.increment("shed")
+            self.metrics.increment(f"shed:{e.reason}")
+        if "error" in response:
+            self.metrics.increment("errors")
+        elapsed = time.perf_counter() - started
+        self.metrics.observe_latency(elapsed)
+        if recording:
+            self.recorder.record(session, request, response, started, elapsed)
+        return response
+
+    async def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Route one JSON-RPC request to its method."""
         method = request.get("method")
         request_id = request.get("id")
         params = request.get("params", {})
         
         try:
             if method == "initialize":
+                session = current_session.get()
+                session.client_info = params.get("clientInfo")
+                session.initialized = True
+                session.weight = self.client_weights.get((session.client_info or {}).get("name"), 1.0)
+                capabilities: Dict[str, Any] = {"tools": {"listChanged": False}}
+                experimental: Dict[str, Any] = {}
+                encoding = negotiate(params) if session.framing else None
+                if encoding is not None:
+                    session.next_encoding = encoding
+                    experimental["encoding"] = encoding
+                session.compact = ((params.get("capabilities") or {}).get("experimental") or {}).get("compact") is True
+                if session.compact:
+                    experimental["compact"] = True
+                if experimental:
+                    capabilities["experimental"] = experimental
                 return {
                     "jsonrpc": "2.0",
                     "id": request_id,
                     "result": {
                         "protocolVersion": "2024-11-05",
-                        "capabilities": {
-                            "tools": {"listChanged": False}
-                        },
+                        "capabilities": capabilities,
                         "serverInfo": {
                             "name": self.name,
                             "version": self.version
@@ -36,81 +483,54 @@ class MCPServer:
                     }
                 }
             
+            elif method == "ping":
+                return {"jsonrpc": "2.0", "id": request_id, "result": {}}
+            
             elif method == "tools/list":
-                tools = [
-                    {
-                        "name": "add",
-                        "description": "Add two numbers together",
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "a": {"type": "number", "description": "First number"},
-                                "b": {"type": "number", "description": "Second number"}
-                            },
-                            "required": ["a", "b"]
-                        }
-                    },
-                    {
-                        "name": "multiply",
-                        "description": "Multiply two numbers",
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "a": {"type": "number", "description": "First number"},
-                                "b": {"type": "number", "description": "Second number"}
-                            },
-                            "required": ["a", "b"]
-                        }
-                    },
-                    {
-                        "name": "subtract",
-                        "description": "Subtract second number from first",
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "a": {"type": "number", "description": "First number"},
-                                "b": {"type": "number", "description": "Second number"}
-                            },
-                            "required": ["a", "b"]
-                        }
-                    },
-                    {
-                        "name": "divide",
-                        "description": "Divide first number by second",
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "a": {"type": "number", "description": "First number"},
-                                "b": {"type": "number", "description": "Second number"}
-                            },
-                            "required": ["a", "b"]
-                        }
-                    }
-                ]
-                
                 return {
                     "jsonrpc": "2.0",
                     "id": request_id,
-                    "result": {"tools": tools}
+                    "result": {"tools": TOOLS}
                 }
             
+            elif method == "server/metrics":
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": self.metrics_snapshot()
+                }
+            
+            elif method == "shm/release":
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {"released": shared_arrays.release(str(params.get("name")))}
+                }
+            
+            elif method == "shm/segments":
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {"segments": shared_arrays.owned_segments()}
+                }
+            
+            elif is_admin(request):
+                return {"jsonrpc": "2.0", "id": request_id, **(await self.call_admin(method, params))}
+            
             elif method == "tools/call":
                 tool_name = params.get("name")
                 arguments = params.get("arguments", {})
                 
-                result = await self.call_tool(tool_name, arguments)
+                meta = params.get("_meta") or {}
+                progress_token = meta.get("progressToken")
+                compact = bool(meta.get("compact", current_session.get().compact))
+                
+                result = await self.call_tool(tool_name, arguments, progress_token, compact)
                 
                 return {
                     "jsonrpc": "2.0",
                     "id": request_id,
-                    "result": {
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": result
-                            }
-                        ]
-                    }
+                    "result": result
                 }
             
             else:
@@ -133,69 +553,350 @@ class MCPServer:
                 }
             }
     
-    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
-        """Execute the requested tool."""
+    async def send_notification(self, method: str, params: Dict[str, Any]):
+        """Send a JSON-RPC notification to the client of the current request."""
+        await current_session.get().send({"jsonrpc": "2.0", "method": method, "params": params})
+    
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any],
+                        progress_token: Optional[Any] = None, compact: bool = False) -> Dict[str, Any]:
+        """Execute the requested tool and build its ``tools/call`` result.
+
+        A successful result carries ``structuredContent`` (see ``tool_schemas.OUTPUT_SCHEMAS``)
+        and, unless ``compact``, the prose reply as text. In compact mode the
+        text is never formatted and numeric lists are packed by ``compact_arrays``.
+        Failures carry only the error text and ``isError``.
+        """
         try:
-            a = float(arguments.get("a", 0))
-            b = float(arguments.get("b", 0))
-            
-            if tool_name == "add":
-                result = a + b
-                return f"Adding {a} + {b} = {result}"
-            
-            elif tool_name == "subtract":
-                result = a - b
-                return f"Subtracting {a} - {b} = {result}"
-            
-            elif tool_name == "multiply":
-                result = a * b
-                return f"Multiplying {a} × {b} = {result}"
-            
-            elif tool_name == "divide":
-                if b == 0:
-                    return "Error: Cannot divide by zero"
-                result = a / b
-                return f"Dividing {a} ÷ {b} = {result}"
-            
-            else:
-                return f"Error: Unknown tool '{tool_name}'"
-                
+            structured, describe = await self.run_tool(tool_name, arguments, progress_token)
+        except ToolError as e:
+            return {"content": [{"type": "text", "text": f"Error: {str(e)}"}], "isError": True}
         except Exception as e:
-            return f"Error executing tool: {str(e)}"
+            return {"content": [{"type": "text", "text": f"Error executing tool: {str(e)}"}], "isError": True}
+        if compact:
+            return {"content": [], "structuredContent": compact_arrays(structured,
+                                                                       current_session.get().encoding != "json")}
+        return {"content": [{"type": "text", "text": describe()}], "structuredContent": structured}
+
+    async def run_tool(self, tool_name: str, arguments: Dict[str, Any],
+                       progress_token: Optional[Any] = None) -> Tuple[Dict[str, Any], Callable[[], str]]:
+        """Execute a tool; returns its structured result and a function formatting the prose reply."""
+        if tool_name in ("add", "subtract", "multiply", "divide"):
+            a, b = _operands(arguments)
+        
+        if tool_name == "add":
+            result = a + b
+            return {"result": result}, lambda: f"Adding {a} + {b} = {result}"
+        
+        elif tool_name == "subtract":
+            result = a - b
+            return {"result": result}, lambda: f"Subtracting {a} - {b} = {result}"
+        
+        elif tool_name == "multiply":
+            result = a * b
+            return {"result": result}, lambda: f"Multiplying {a} × {b} = {result}"
+        
+        elif tool_name == "divide":
+            if b == 0:
+                raise ToolError("Cannot divide by zero")
+            result = a / b
+            return {"result": result}, lambda: f"Dividing {a} ÷ {b} = {result}"
+        
+        elif tool_name == "dataset_reduce":
+            result = await self.execute(tool_name, arguments)
+            return {"result": result}, lambda: f"{arguments['operation'].title()} of {arguments['path']} = {result}"
+        
+        elif tool_name == "dataset_elementwise":
+            result = await self.execute(tool_name, arguments)
+            return {"output_path": result}, lambda: f"Wrote {arguments['operation']} results to {result}"
+        
+        elif tool_name == "bulk_compute":
+            report = await self.bulk_compute(arguments, progress_token)
+            report.pop("done")
+            return report, lambda: (
+                f"Processed {report['rows']} rows in {report['seconds']:.2f}s "
+                f"({report['rows_per_second']:.0f} rows/s, {report['invalid']} invalid) "
+                f"-> {report['output_path']}"
+            )
+        
+        elif tool_name in ("random_uniform", "random_normal"):
+            distribution = tool_name.split("_", 1)[1]
+            report = await self.run_in_pool(random_samples, distribution, **_random_arguments(arguments))
+            if "values" in report:
+                return report, lambda: json.dumps({"seed": report["seed"], "values": report["values"]})
+            return report, lambda: (
+                f"Wrote {report['count']} {distribution} samples to {report['output_path']} (seed {report['seed']})"
+            )
+        
+        elif tool_name == "monte_carlo":
+            summary = await self.monte_carlo(arguments)
+            margin = summary["ci_high"] - summary["mean"]
+            return summary, lambda: (
+                f"Monte Carlo estimate of {arguments['expression']} = {summary['mean']} ± {margin} "
+                f"({summary['confidence']:.0%} CI [{summary['ci_low']}, {summary['ci_high']}], "
+                f"{summary['valid_samples']} samples, seed {summary['seed']})"
+            )
+        
+        elif tool_name in ("amortization_schedule", "compound_table"):
+            # Schedules can run to millions of rows or a CSV file, so they go to the pool.
+            report = await self.execute(tool_name, arguments)
+            return report, lambda: json.dumps(report)
+        
+        elif tool_name == "annuity":
+            report = await asyncio.to_thread(run_operation, tool_name, arguments)
+            return report, lambda: json.dumps(report)
+        
+        elif tool_name == "npv":
+            result = await asyncio.to_thread(run_operation, tool_name, arguments)
+            return {"result": result}, lambda: f"NPV at {float(arguments['rate']):.4%} = {result}"
+        
+        elif tool_name == "irr":
+            result = await asyncio.to_thread(run_operation, tool_name, arguments)
+            return {"result": result}, lambda: f"IRR = {result} ({result:.4%})"
+        
+        elif tool_name == "array_elementwise":
+            # In this process (not the pool) so segments it creates can be released here.
+            output = await asyncio.to_thread(run_operation, tool_name, arguments)
+            report = {"operation": arguments["operation"], "output": output}
+            return report, lambda: json.dumps(report)
+        
+        elif tool_name == "array_reduce":
+            result = await asyncio.to_thread(run_operation, tool_name, arguments)
+            return {"result": result}, lambda: (
+                f"{arguments['operation'].title()} of shared array {arguments['array']['shm']} = {result}"
+            )
+        
+        elif tool_name == "compute_graph":
+            results = await self.compute_graph(arguments)
+            return {"results": results}, lambda: json.dumps(results)
+        
+        else:
+            raise ToolError(f"Unknown tool '{tool_name}'")
+    
+    async def bulk_compute(self, arguments: Dict[str, Any], progress_token: Optional[Any] = None) -> Dict[str, Any]:
+        """Run a bulk job chunk by chunk off the event loop, reporting progress between chunks."""
+        try:
+            chunks = iter_bulk_compute(**_bulk_arguments(arguments))
+        except ValueError as e:
+            raise ToolError(str(e)) from None
+        while True:
+            report = await asyncio.to_thread(next, chunks)
+            if report["done"]:
+                return report
+            if progress_token is not None:
+                await self.send_notification("notifications/progress", {
+                    "progressToken": progress_token,
+                    "progress": report["rows"],
+                    "message": f"{report['rows']} rows, {report['rows_per_second']:.0f} rows/s"
+                })
+    
+    async def monte_carlo(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Spread Monte Carlo blocks over the worker pool and combine them in block order."""
+        kwargs = _monte_carlo_arguments(arguments)
+        confidence = kwargs.pop("confidence", 0.95)
+        plan = monte_carlo_plan(**kwargs)
+        if plan["samples"] <= CHUNK_SAMPLES:
+            results = [monte_carlo_block(task) for task in plan["tasks"]]
+        else:
+            results = await asyncio.gather(*(self.run_in_pool(monte_carlo_block, task) for task in plan["tasks"]))
+        return monte_carlo_summary(plan, results, confidence)
+    
+    async def compute_graph(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Evaluate a DAG of operations and return the value of each requested output.
+
+        Nodes that are identical once their references are resolved are
+        evaluated once (unless they draw unseeded random numbers), nodes not needed by any output are skipped, and
+        independent branches run concurrently (heavy ones in the process pool).
+        """
+        nodes = arguments.get("nodes") or {}
+        outputs = arguments.get("outputs") or []
+        if not isinstance(nodes, dict) or not isinstance(outputs, list):
+            raise ToolError("'nodes' must be an object and 'outputs' a list")
+
+        # Canonical key per node: its tool plus arguments with every reference
+        # replaced by the referenced node's own key, so equal subexpressions
+        # collapse onto one key regardless of node ids.
+        keys: Dict[str, str] = {}
+        visiting = set()
+
+        def canonical(node_id: str) -> str:
+            if not isinstance(node_id, str):
+                raise ValueError(f"Node references must be node id strings, not {type(node_id).__name__}")
+            if node_id in keys:
+                return keys[node_id]
+            if node_id not in nodes:
+                raise ValueError(f"Unknown node '{node_id}'")
+            if node_id in visiting:
+                raise ValueError(f"Cycle detected at node '{node_id}'")
+            node = nodes[node_id]
+            if not isinstance(node, dict) or node.get("tool") not in OPERATIONS:
+                tool = node.get("tool") if isinstance(node, dict) else None
+                raise ValueError(f"Node '{node_id}' uses unsupported tool '{tool}'")
+            visiting.add(node_id)
+            node_arguments = node.get("arguments", {})
+            ref_keys = {ref: canonical(ref) for ref in _node_refs(node_arguments)}
+            visiting.discard(node_id)
+            key = [node["tool"], _substitute(node_arguments, {ref: {"$node": key} for ref, key in ref_keys.items()})]
+            seeded = isinstance(node_arguments, dict) and node_arguments.get("seed") is not None
+            if node["tool"] in RANDOM_OPERATIONS and not seeded:
+                key.append(node_id)  # independent draws: never shared, nor is anything computed from them
+            keys[node_id] = json.dumps(key, sort_keys=True, default=list)  # default: packed arrays
+            return keys[node_id]
+
+        try:
+            for output in outputs:
+                canonical(output)
+        except ValueError as e:
+            raise ToolError(str(e)) from e
+
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def evaluate(node_id: str) -> Any:
+            node = nodes[node_id]
+            node_arguments = node.get("arguments", {})
+            refs = _node_refs(node_arguments)
+            values = await asyncio.gather(*(schedule(ref) for ref in refs))
+            resolved = _substitute(node_arguments, dict(zip(refs, values)))
+            try:
+                return await self.execute(node["tool"], resolved)
+            except (ArithmeticError, KeyError, OSError, TypeError, ValueError) as e:
+                raise ValueError(f"node '{node_id}': {str(e)}") from e
+
+        def schedule(node_id: str) -> asyncio.Task:
+            key = keys[node_id]
+            if key not in tasks:
+                tasks[key] = asyncio.ensure_future(evaluate(node_id))
+            return tasks[key]
+
+        try:
+            values = await asyncio.gather(*(schedule(output) for output in outputs))
+        except Exception as e:
+            for task in tasks.values():
+                if task.done() and not task.cancelled():
+                    task.exception()
+                else:
+                    task.cancel()
+            if isinstance(e, ValueError):
+                raise ToolError(str(e)) from e
+            raise
+
+        return dict(zip(outputs, values))
+    
+    async def call_admin(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """The ``result`` or ``error`` member answering an ``admin/*`` request."""
+        not_found = {"error": {"code": -32601, "message": f"Method not found: {method}"}}
+        if self.admin_token is None:
+            return not_found
+        token = params.get("token")
+        if not isinstance(token, str) or not hmac.compare_digest(token.encode(), self.admin_token.encode()):
+            return {"error": {"code": ADMIN_UNAUTHORIZED, "message": "Unauthorized: admin methods need a valid token"}}
+        if self.diagnostics is None:
+            self.diagnostics = diagnostics.Diagnostics()
+        try:
+            return {"result": await self.diagnostics.call(method, params)}
+        except LookupError:
+            return not_found
+        except (ValueError, OSError) as e:
+            return {"error": {"code": -32602, "message": f"Invalid params: {e}"}}
+
+    def toggle_admin(self, token_file: str):
+        """SIGUSR2 handler: enable the admin methods with a new token written to ``token_file``, or disable them."""
+        try:
+            os.unlink(token_file)
+        except FileNotFoundError:
+            pass
+        if self.admin_token is not None:
+            self.admin_token = None
+            print("calculator-server: admin methods disabled", file=sys.stderr, flush=True)
+            return
+        token = secrets.token_hex(16)
+        try:
+            # O_EXCL and O_NOFOLLOW: never write the token through a file or link someone else planted.
+            fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0), 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(token + "\n")
+        except OSError as e:
+            print(f"calculator-server: cannot enable admin methods: {e}", file=sys.stderr, flush=True)
+            return
+        self.admin_token = token
+        print(f"calculator-server: admin methods enabled; token in {token_file}", file=sys.stderr, flush=True)
+
+    async def handle_message(self, data: Union[str, bytes, Parsed],
+                             decode: Callable[[Any], Any] = json.loads,
+                             received: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Parse one JSON-RPC message (JSON text, a binary frame's payload, or ``Parsed``) and return the response.
+
+        Notifications (messages without an id) get no response, nor do requests
+        the client cancels, and messages that are not JSON objects get an
+        Invalid Request error. ``received`` is
+        the ``perf_counter()`` time the transport had the message, for tracing.
+        """
+        parse_start = time.perf_counter() if self.tracer is not None else 0.0
+        try:
+            request = decode(data)
+        except (ValueError, TypeError):
+            if self.tracer is not None:
+                current_trace.set(None)
+            return {
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {
+                    "code": -32700,
+                    "message": "Parse error"
+                }
+            }
+        if self.tracer is not None:
+            traced = isinstance(request, dict) and "id" in request
+            current_trace.set(self.tracer.begin(request, received or parse_start, parse_start, time.perf_counter())
+                              if traced else None)
+        if not isinstance(request, dict):
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}}
+        if "id" not in request:
+            self.handle_notification(request)
+            return None
+        return await self.handle_request(request, len(data))
+
+    def handle_notification(self, notification: Dict[str, Any]):
+        """Act on a client notification; ``notifications/cancelled`` stops the named request."""
+        params = notification.get("params")
+        if notification.get("method") == "notifications/cancelled" and isinstance(params, dict):
+            current_session.get().cancel_request(params.get("requestId"))
     
     async def run(self):
         """Run the MCP server with stdio transport."""
+        session = _stdio_session
         while True:
             try:
-                # Read from stdin
-                line = await asyncio.to_thread(sys.stdin.readline)
-                if not line:
-                    break
-                
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Parse JSON request
-                request = json.loads(line)
-                
-                # Handle request
-                response = await self.handle_request(request)
-                
-                # Send response
-                print(json.dumps(response), flush=True)
-                
-            except json.JSONDecodeError:
-                # Invalid JSON, send error response
-                error_response = {
-                    "jsonrpc": "2.0",
-                    "id": None,
-                    "error": {
-                        "code": -32700,
-                        "message": "Parse error"
-                    }
-                }
-                print(json.dumps(error_response), flush=True)
+                if session.encoding == "json":
+                    # Read from stdin (bytes, so a switch to binary frames loses nothing to text buffering)
+                    line, received = await asyncio.to_thread(_timed, read_line, sys.stdin.buffer,
+                                                             self.stream_threshold)
+                    if not line:
+                        break
+
+                    if isinstance(line, Parsed):
+                        # Long enough to have been decoded while it was read.
+                        response = await self.handle_message(line, decode_parsed, received)
+                    else:
+                        line = line.strip()
+                        if not line:
+                            continue
+
+                        # Handle request and send response
+                        response = await self.handle_message(line, received=received)
+                else:
+                    try:
+                        payload, received = await asyncio.to_thread(_timed, read_frame_sync, sys.stdin.buffer)
+                    except (EOFError, ValueError) as e:
+                        # The stream cannot be resynchronised after a bad frame.
+                        await session.send({"jsonrpc": "2.0", "id": None,
+                                            "error": {"code": -32700, "message": f"Parse error: {e}"}})
+                        break
+                    if payload is None:
+                        break
+                    response = await self.handle_message(payload, CODECS[session.encoding].decode, received)
+                if response is not None:
+                    await session.send(response)
+                session.switch_encoding()
             
             except Exception as e:
                 # Unexpected error
@@ -207,12 +908,196 @@ class MCPServer:
                         "message": f"Internal error: {str(e)}"
                     }
                 }
-                print(json.dumps(error_response), flush=True)
+                await session.send(error_response)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="MCP calculator server")
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument("--tcp", metavar="HOST:PORT", help="Serve newline-delimited JSON-RPC over TCP")
+    transport.add_argument("--unix", metavar="PATH", help="Serve newline-delimited JSON-RPC on a Unix socket")
+    transport.add_argument("--http", metavar="HOST:PORT", help="Serve MCP Streamable HTTP on /mcp")
+    parser.add_argument("--max-connections", type=int, default=256, help="Concurrent socket/HTTP clients allowed")
+    parser.add_argument("--idle-timeout", type=float, default=300.0,
+                        help="Close socket/HTTP clients, and expire HTTP sessions, idle this long (s)")
+    parser.add_argument("--max-sessions", type=int, default=10_000,
+                        help="HTTP sessions kept open; the least recently used is dropped beyond this")
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="On SIGTERM, wait this long (s) for in-flight requests before exiting")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="Refuse requests beyond this many in progress (0: no limit)")
+    parser.add_argument("--max-queued-mb", type=float, default=DEFAULT_MAX_QUEUED_BYTES / 1048576,
+                        help="Refuse requests once admitted messages total this many MB (0: no limit)")
+    parser.add_argument("--heavy-concurrency", type=int,
+                        help="Process-pool tools running at once (default: one per CPU)")
+    parser.add_argument("--heavy-queue", type=int,
+                        help="Process-pool tools allowed to wait for a slot (default: twice --heavy-concurrency)")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="Requests per second allowed to each client session (0: no limit)")
+    parser.add_argument("--rate-burst", type=float,
+                        help="Requests a client session may send at once under --rate-limit (default: twice the rate)")
+    parser.add_argument("--client-weight", type=client_weight, action="append", default=[], metavar="NAME=WEIGHT",
+                        help="Fair share of busy tool slots for clients whose clientInfo name is NAME (default 1)")
+    parser.add_argument("--record", metavar="PATH",
+                        help="Append every request, its response and timing to this JSONL file (see replay.py)")
+    parser.add_argument("--record-sample", type=float, default=1.0, metavar="RATE",
+                        help="Fraction of requests to record (initialize is always recorded)")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="Write per-phase spans of sampled requests to this file (see tracing.py)")
+    parser.add_argument("--trace-sample", type=float, default=1.0, metavar="RATE",
+                        help="Fraction of requests to trace (requests with a sampled traceparent always are)")
+    parser.add_argument("--trace-format", choices=["jsonl", "chrome"], default="jsonl",
+                        help="One JSON line per request, or Chrome trace events for chrome://tracing and Perfetto")
+    parser.add_argument("--trace-max-mb", type=float, default=64.0, help="Rotate the trace file at this size")
+    parser.add_argument("--trace-backups", type=int, default=3, help="Rotated trace files to keep")
+    parser.add_argument("--admin-token", default=os.environ.get("CALCULATOR_ADMIN_TOKEN"), metavar="TOKEN",
+                        help="Enable the admin/* profiling and memory methods for requests carrying this token "
+                             "(default: $CALCULATOR_ADMIN_TOKEN)")
+    parser.add_argument("--admin-token-file", metavar="PATH",
+                        help="Where SIGUSR2 writes a fresh admin token when it enables the admin methods on a live "
+                             "server (default: calculator-admin-<pid>.token in the temporary directory)")
+    parser.add_argument("--stream-threshold-mb", type=float, default=STREAM_THRESHOLD / 1048576,
+                        help="Decode JSON messages at least this large while reading them, packing numeric arrays "
+                             "(0: never)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Serve socket/HTTP transports from N supervised worker processes")
+    parser.add_argument("--zygote", metavar="PATH",
+                        help="Preload everything, then fork a ready stdio session per request on this Unix socket")
+    parser.add_argument("--ready-fd", type=int, metavar="FD",
+                        help="Write 'ready' to this inherited file descriptor once serving, then close it")
+    parser.add_argument("--ready-file", metavar="PATH",
+                        help="Once serving, atomically write {pid, transport, address} as JSON to PATH")
+    # Set by the worker supervisor (see workers.py), not meant to be used directly.
+    parser.add_argument("--listen-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--reuse-port", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--metrics-dir", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
 
-async def main():
+
+def announce_ready(args: argparse.Namespace, address: str):
+    """Tell whoever launched the server that it is now accepting requests.
+
+    Launchers wait on this rather than sleeping: ``--ready-fd`` gets a line,
+    ``--ready-file`` appears with the bound address (useful with port 0), and
+    without a ready fd a ``ready`` line goes to stderr.
+    """
+    transport = ("http" if args.http else "tcp" if args.tcp else "unix" if args.unix
+                 else "zygote" if args.zygote else "stdio")
+    if args.ready_file:
+        temporary = f"{args.ready_file}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"pid": os.getpid(), "transport": transport, "address": address}, f)
+        os.replace(temporary, args.ready_file)
+    if args.ready_fd is not None:
+        os.write(args.ready_fd, b"ready\n")
+        os.close(args.ready_fd)
+        args.ready_fd = None
+    else:
+        where = f"{transport} {address}" if address else transport
+        print(f"calculator-server: ready on {where}", file=sys.stderr, flush=True)
+
+
+async def publish_metrics(server: MCPServer, interval: float = 1.0):
+    """Periodically write this worker's metrics where its siblings can read them."""
+    while True:
+        server.update_gauges()
+        await asyncio.to_thread(write_snapshot, server.metrics_dir, server.metrics.snapshot())
+        await asyncio.sleep(interval)
+
+
+async def main(args: Optional[argparse.Namespace] = None):
     """Main function."""
+    args = args or parse_args()
     server = MCPServer("calculator-server")
-    await server.run()
+    server.admission = build_admission(args.max_in_flight, int(args.max_queued_mb * 1048576),
+                                       args.heavy_concurrency, args.heavy_queue, args.rate_limit, args.rate_burst)
+    server.client_weights = dict(args.client_weight)
+    server.admin_token = args.admin_token or None
+    server.stream_threshold = int(args.stream_threshold_mb * 1048576)
+    token_file = None
+    if hasattr(signal, "SIGUSR2"):
+        token_file = args.admin_token_file or os.path.join(tempfile.gettempdir(), f"calculator-admin-{os.getpid()}.token")
+        if args.metrics_dir and args.admin_token_file:
+            token_file = f"{token_file}.{os.getpid()}"  # one per worker, like --trace
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, server.toggle_admin, token_file)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass  # not the main thread
+    if args.record:
+        server.recorder = Recorder(args.record, args.record_sample)
+        server.recorder.start()
+    if args.trace:
+        # Workers each write their own file; rotation cannot be shared between processes.
+        path = f"{args.trace}.{os.getpid()}" if args.metrics_dir else args.trace
+        server.tracer = Tracer(path, args.trace_sample, args.trace_format, int(args.trace_max_mb * 1048576),
+                               args.trace_backups)
+        server.tracer.start()
+    publisher = None
+    if args.metrics_dir:
+        server.metrics_dir = args.metrics_dir
+        publisher = asyncio.create_task(publish_metrics(server))
+
+    def ready(address: str):
+        announce_ready(args, address)
+
+    sock = None
+    if args.listen_fd is not None:
+        import socket
+        sock = socket.socket(fileno=args.listen_fd)
+    options = dict(
+        max_connections=args.max_connections,
+        idle_timeout=args.idle_timeout,
+        drain_timeout=args.drain_timeout,
+        sock=sock,
+        reuse_port=args.reuse_port,
+        ready=ready
+    )
+    try:
+        if args.http:
+            from transports import serve_http
+            host, _, port = args.http.rpartition(":")
+            await serve_http(server, host=host.strip("[]") or None, port=int(port), max_sessions=args.max_sessions, **options)
+        elif args.tcp or args.unix:
+            from transports import serve_socket
+            host, _, port = (args.tcp or "").rpartition(":")
+            await serve_socket(
+                server,
+                host=host.strip("[]") or None,
+                port=int(port) if args.tcp else None,
+                path=args.unix,
+                **options
+            )
+        else:
+            ready("")
+            await server.run()
+    finally:
+        if publisher is not None:
+            publisher.cancel()
+        if server.recorder is not None:
+            await server.recorder.close()
+        if server.tracer is not None:
+            await server.tracer.close()
+        server.shutdown()
+        if token_file is not None and server.admin_token is not None and server.admin_token != args.admin_token:
+            try:
+                os.unlink(token_file)
+            except FileNotFoundError:
+                pass
+        if args.ready_file:
+            try:
+                os.unlink(args.ready_file)
+            except FileNotFoundError:
+                pass
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Run the importable module rather than __main__, so the transports (which
+    # import calculator_server) share its session context and classes.
+    import calculator_server
+    arguments = calculator_server.parse_args()
+    if arguments.zygote:
+        from zygote import serve
+        sys.exit(serve(arguments))
+    if arguments.workers > 1:
+        from workers import supervise
+        sys.exit(supervise(arguments))
+    asyncio.run(calculator_server.main(arguments))
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped numeric datasets for the calculator server.
+
+Bulk operands are passed to tools as local file paths instead of JSON arrays.
+Supported layouts:
+
+* raw little-endian values (``.f64``/``.i64`` or an explicit ``dtype``)
+* NumPy ``.npy`` files (C order, little-endian numeric dtypes)
+* the calculator header format: ``b"CALCARR1"``, a little-endian uint32
+  header length, a JSON header ``{"dtype": ..., "count": ...}``, then data
+
+Files are mapped one window at a time, so resident memory stays bounded by
+``CHUNK_BYTES`` no matter how large the dataset is. NumPy is used for the
+per-window arithmetic when it is installed; otherwise typed memoryviews are
+used directly.
+"""
+
+import ast
+import json
+import math
+import mmap
+import operator
+import os
+import struct
+import sys
+from array import array
+from itertools import repeat
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+from lazy_imports import optional_import
+
+# NumPy is optional (memoryview loops are the fallback) and imported on first use.
+np = optional_import("numpy")
+
+NPY_MAGIC = b"\x93NUMPY"
+CALC_MAGIC = b"CALCARR1"
+
+# Bytes mapped per window; a multiple of every platform's allocation granularity.
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# dtype name -> (memoryview format, NumPy descr)
+DTYPES: Dict[str, Tuple[str, str]] = {
+    "float64": ("d", "<f8"),
+    "int64": ("q", "<i8"),
+    "float32": ("f", "<f4"),
+    "int32": ("i", "<i4"),
+}
+_DESCR_TO_DTYPE = {descr: name for name, (_, descr) in DTYPES.items()}
+_EXTENSION_DTYPES = {".f64": "float64", ".i64": "int64", ".f32": "float32", ".i32": "int32"}
+
+
+class Dataset(NamedTuple):
+    path: str
+    dtype: str
+    offset: int
+    count: int
+    shape: Tuple[int, ...]
+
+    @property
+    def itemsize(self) -> int:
+        return struct.calcsize(DTYPES[self.dtype][0])
+
+
+def _check_dtype(dtype: str) -> str:
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}' (expected one of {', '.join(DTYPES)})")
+    return dtype
+
+
+def _data_size(path: str) -> int:
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        return f.tell()
+
+
+def open_dataset(path: str, dtype: Optional[str] = None) -> Dataset:
+    """Inspect a dataset file and describe where its values live."""
+    with open(path, "rb") as f:
+        prefix = f.read(12)
+        if prefix.startswith(NPY_MAGIC):
+            major = prefix[6]
+            if major == 1:
+                header_len = struct.unpack("<H", prefix[8:10])[0]
+                offset = 10 + header_len
+            else:
+                header_len = struct.unpack("<I", prefix[8:12])[0]
+                offset = 12 + header_len
+            f.seek(offset - header_len)
+            header = ast.literal_eval(f.read(header_len).decode("latin1"))
+            descr = header.get("descr")
+            if descr not in _DESCR_TO_DTYPE:
+                raise ValueError(f"Unsupported .npy dtype '{descr}'")
+            shape = tuple(header.get("shape", ()))
+            if header.get("fortran_order") and len(shape) > 1:
+                raise ValueError("Fortran-ordered .npy files are not supported")
+            return Dataset(path, _DESCR_TO_DTYPE[descr], offset, math.prod(shape), shape)
+
+        if prefix.startswith(CALC_MAGIC):
+            header_len = struct.unpack("<I", prefix[8:12])[0]
+            header = json.loads(f.read(header_len))
+            name = _check_dtype(header.get("dtype", "float64"))
+            count = int(header["count"])
+            return Dataset(path, name, 12 + header_len, count, (count,))
+
+    name = _check_dtype(dtype or _EXTENSION_DTYPES.get(path[path.rfind("."):].lower(), "float64"))
+    itemsize = struct.calcsize(DTYPES[name][0])
+    size = _data_size(path)
+    if size % itemsize:
+        raise ValueError(f"File size {size} is not a multiple of the {name} item size")
+    return Dataset(path, name, 0, size // itemsize, (size // itemsize,))
+
+
+class MappedWindow:
+    """One mapped slice of a dataset file plus its typed view."""
+
+    def __init__(self, fileobj, dataset: Dataset, first: int, count: int, writable: bool = False):
+        start = dataset.offset + first * dataset.itemsize
+        aligned = start - start % mmap.ALLOCATIONGRANULARITY
+        length = start - aligned + count * dataset.itemsize
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        self.mapping = mmap.mmap(fileobj.fileno(), length, access=access, offset=aligned)
+        code, descr = DTYPES[dataset.dtype]
+        if np is not None:
+            self.view = np.frombuffer(self.mapping, dtype=descr, count=count, offset=start - aligned)
+        elif sys.byteorder != "little":
+            self.mapping.close()
+            raise ValueError("Reading datasets without NumPy requires a little-endian host")
+        else:
+            self.view = memoryview(self.mapping)[start - aligned:].cast(code)
+
+    def close(self):
+        view, self.view = self.view, None
+        if isinstance(view, memoryview):
+            view.release()
+        del view
+        try:
+            self.mapping.close()
+        except BufferError:
+            pass  # a caller still holds the chunk; it is unmapped once dropped
+
+
+def _chunk_items(*datasets: Dataset) -> int:
+    return max(1, CHUNK_BYTES // max(ds.itemsize for ds in datasets))
+
+
+def iter_chunks(dataset: Dataset) -> Iterator[Any]:
+    """Yield the dataset's values one mapped window at a time.
+
+    Each chunk is only valid until the next one is requested.
+    """
+    step = _chunk_items(dataset)
+    with open(dataset.path, "rb") as f:
+        for first in range(0, dataset.count, step):
+            window = MappedWindow(f, dataset, first, min(step, dataset.count - first))
+            try:
+                yield window.view
+            finally:
+                window.close()
+
+
+def reduce_dataset(path: str, operation: str, dtype: Optional[str] = None) -> Dict[str, Any]:
+    """Compute sum, mean, min or max over a dataset file."""
+    if operation not in ("sum", "mean", "min", "max"):
+        raise ValueError(f"Unknown reduction '{operation}'")
+    dataset = open_dataset(path, dtype)
+    if dataset.count == 0 and operation != "sum":
+        raise ValueError(f"Cannot compute {operation} of an empty dataset")
+
+    total = 0
+    extreme = None
+    pick = min if operation == "min" else max
+    for chunk in iter_chunks(dataset):
+        if operation in ("sum", "mean"):
+            total += chunk.sum().item() if np is not None else sum(chunk)
+        else:
+            value = (chunk.min() if operation == "min" else chunk.max()).item() if np is not None else pick(chunk)
+            extreme = value if extreme is None else pick(extreme, value)
+        del chunk
+
+    if operation == "sum":
+        value = total
+    elif operation == "mean":
+        value = total / dataset.count
+    else:
+        value = extreme
+    return {"operation": operation, "count": dataset.count, "value": value}
+
+
+def _safe_divide(a: float, b: float) -> float:
+    if b == 0:
+        raise ZeroDivisionError("Cannot divide by zero")
+    return a / b
+
+
+ELEMENTWISE: Dict[str, Callable[[Any, Any], Any]] = {
+    "add": operator.add,
+    "subtract": operator.sub,
+    "multiply": operator.mul,
+    "divide": _safe_divide,
+}
+
+
+def _npy_header(shape: Tuple[int, ...], descr: str) -> bytes:
+    shape_text = f"({shape[0]},)" if len(shape) == 1 else str(tuple(shape))
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': {shape_text}, }}"
+    padding = 64 - (10 + len(header) + 1) % 64
+    return NPY_MAGIC + b"\x01\x00" + struct.pack("<H", len(header) + padding + 1) + \
+        (header + " " * padding + "\n").encode("latin1")
+
+
+def create_output(path: str, count: int, shape: Optional[Tuple[int, ...]] = None) -> Dataset:
+    """Allocate a float64 output file (``.npy`` if the name says so, else raw)."""
+    shape = shape or (count,)
+    header = _npy_header(shape, DTYPES["float64"][1]) if path.lower().endswith(".npy") else b""
+    with open(path, "wb") as f:
+        f.write(header)
+        f.truncate(len(header) + count * 8)
+    return Dataset(path, "float64", len(header), count, shape)
+
+
+def elementwise_dataset(path: str, operation: str, output_path: str, operand: Optional[float] = None,
+                        operand_path: Optional[str] = None, dtype: Optional[str] = None) -> Dict[str, Any]:
+    """Apply ``operation`` to a dataset and a scalar or second dataset, writing float64 output."""
+    if operation not in ELEMENTWISE:
+        raise ValueError(f"Unknown elementwise operation '{operation}'")
+    if (operand is None) == (operand_path is None):
+        raise ValueError("Provide exactly one of 'operand' or 'operand_path'")
+    if os.path.abspath(output_path) in (os.path.abspath(path), os.path.abspath(operand_path or path)):
+        raise ValueError("Output path must differ from the input datasets")
+    func = ELEMENTWISE[operation]
+    dataset = open_dataset(path, dtype)
+    other = open_dataset(operand_path, dtype) if operand_path is not None else None
+    if other is not None and other.count != dataset.count:
+        raise ValueError(f"Dataset lengths differ: {dataset.count} vs {other.count}")
+    if other is None:
+        operand = float(operand)
+        if operation == "divide" and operand == 0:
+            raise ZeroDivisionError("Cannot divide by zero")
+
+    output = create_output(output_path, dataset.count, dataset.shape)
+    step = _chunk_items(dataset, output, *([other] if other is not None else []))
+    with open(path, "rb") as src, open(output_path, "r+b") as dst, \
+            open(operand_path or path, "rb") as rhs:
+        for first in range(0, dataset.count, step):
+            count = min(step, dataset.count - first)
+            windows = [
+                MappedWindow(src, dataset, first, count),
+                MappedWindow(dst, output, first, count, writable=True),
+            ]
+            if other is not None:
+                windows.append(MappedWindow(rhs, other, first, count))
+            try:
+                values, out = windows[0].view, windows[1].view
+                right = windows[2].view if other is not None else operand
+                if np is not None:
+                    if operation == "divide" and other is not None and not right.all():
+                        raise ZeroDivisionError("Cannot divide by zero")
+                    getattr(np, operation)(values, right, out=out, casting="unsafe")
+                else:
+                    out[:] = array("d", map(func, values, right if other is not None else repeat(right)))
+            finally:
+                values = out = right = None
+                for window in windows:
+                    window.close()
+    return {"operation": operation, "count": dataset.count, "output_path": output_path}
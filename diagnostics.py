@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+CPU profiling and memory diagnostics for a running calculator server.
+
+The server exposes these as ``admin/*`` JSON-RPC methods (see
+``calculator_server.py --admin-token``). Nothing here costs anything until
+one of them is called:
+
+* ``admin/profile/start`` and ``admin/profile/stop`` run ``cProfile`` on the
+  event loop thread between the two calls. Stop returns the top functions
+  with exact call counts and times, and can write a pstats file for snakeviz
+  or gprof2dot. cProfile hooks every call, so expect requests to run several
+  times slower while it is on.
+* ``admin/sample`` reads the event loop thread's stack every few
+  milliseconds for N seconds from a background thread. It returns the
+  functions seen most often, on the stack and at its top, plus the stacks in
+  collapsed format (``frame;frame;frame count`` per line) for flamegraph.pl,
+  speedscope or Perfetto. The cost is one stack walk per tick, so it is fine
+  on a server under production load.
+* ``admin/tracemalloc/start``, ``snapshot``, ``diff`` and ``stop`` trace
+  Python allocations. A diff compares a new snapshot with an earlier one and
+  shows where memory grew.
+* ``admin/memory`` reports RSS, GC generations and thresholds, and the
+  tracemalloc totals. It can also run a collection first.
+
+Heavy tools run in the process pool, so their time shows up here as the
+wait for the pool's future, not as their own frames.
+"""
+
+import asyncio
+import cProfile
+import collections
+import gc
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Counter, Dict, List, Optional
+
+# Bounds on admin/sample's duration (seconds) and tick (milliseconds).
+MAX_SAMPLE_SECONDS = 300.0
+MIN_SAMPLE_INTERVAL_MS = 1.0
+DEFAULT_TOP = 20
+# tracemalloc snapshots kept for diffs; the oldest is dropped past this.
+MAX_SNAPSHOTS = 8
+GROUPINGS = ("lineno", "filename", "traceback")
+# Allocations made by tracemalloc and the import machinery are noise in a diff.
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _number(params: Dict[str, Any], name: str, default: float, low: float, high: float) -> float:
+    value = params.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+        raise ValueError(f"{name} must be a number from {low:g} to {high:g}")
+    return value
+
+
+def _top(params: Dict[str, Any]) -> int:
+    return int(_number(params, "top", DEFAULT_TOP, 1, 1000))
+
+
+def _path(params: Dict[str, Any]) -> Optional[str]:
+    path = params.get("path")
+    if path is not None and not isinstance(path, str):
+        raise ValueError("path must be a string")
+    return path
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _memory_status() -> Dict[str, Optional[int]]:
+    """Current and peak resident set size in bytes; current is None where /proc is unavailable."""
+    status = {"rssBytes": None, "peakRssBytes": None}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key = "rssBytes" if line.startswith("VmRSS:") else "peakRssBytes"
+                    status[key] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if status["peakRssBytes"] is None:
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            status["peakRssBytes"] = peak if sys.platform == "darwin" else peak * 1024
+        except (ImportError, OSError):
+            pass
+    return status
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float) -> Counter[str]:
+    """Collapsed stacks of ``thread_id`` read every ``interval`` seconds for ``seconds``; run it in another thread."""
+    stacks: Counter[str] = collections.Counter()
+    labels: Dict[Any, str] = {}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = _frame_label(code)
+            names.append(label)
+            frame = frame.f_back
+        del frame
+        stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def summarize_stacks(stacks: Counter[str], top: int) -> List[Dict[str, Any]]:
+    """Functions by samples with them at the top of the stack ("self") and anywhere on it ("total")."""
+    own: Counter[str] = collections.Counter()
+    total: Counter[str] = collections.Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            total[name] += count
+    samples = sum(stacks.values()) or 1
+    ranked = sorted(total, key=lambda name: (own[name], total[name]), reverse=True)[:top]
+    return [{"function": name, "self": own[name], "total": total[name],
+             "selfPercent": round(100 * own[name] / samples, 1), "totalPercent": round(100 * total[name] / samples, 1)}
+            for name in ranked]
+
+
+class Diagnostics:
+    """Profiling and memory state of one server process, driven by its admin methods."""
+
+    def __init__(self):
+        self.profile: Optional[cProfile.Profile] = None
+        self.profile_started = 0.0
+        self.sampling = False
+        self.snapshots: "collections.OrderedDict[int, tracemalloc.Snapshot]" = collections.OrderedDict()
+        self._snapshot_ids = 0
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Run admin method ``method``; ValueError for bad parameters or a call that does not fit the current state."""
+        handlers = {
+            "admin/profile/start": self.profile_start,
+            "admin/profile/stop": self.profile_stop,
+            "admin/sample": self.sample,
+            "admin/tracemalloc/start": self.tracemalloc_start,
+            "admin/tracemalloc/snapshot": self.tracemalloc_snapshot,
+            "admin/tracemalloc/diff": self.tracemalloc_diff,
+            "admin/tracemalloc/stop": self.tracemalloc_stop,
+            "admin/memory": self.memory,
+        }
+        handler = handlers.get(method)
+        if handler is None:
+            raise LookupError(method)
+        return await handler(params)
+
+    async def profile_start(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self.profile is not None:
+            raise ValueError("A profile is already running; stop it first")
+        profile = cProfile.Profile()
+        profile.enable()  # raises ValueError if another profiler already owns this thread
+        self.profile = profile
+        self.profile_started = time.perf_counter()
+        return {"profiling": True}
+
+    async def profile_stop(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self.profile is None:
+            raise ValueError("No profile is running")
+        top, path = _top(params), _path(params)
+        sort = params.get("sort", "cumulative")
+        if sort not in ("cumulative", "tottime", "calls"):
+            raise ValueError("sort must be cumulative, tottime or calls")
+        profile, self.profile = self.profile, None
+        profile.disable()
+        seconds = time.perf_counter() - self.profile_started
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        if path is not None:
+            await asyncio.to_thread(stats.dump_stats, path)
+        column = {"calls": 1, "tottime": 2, "cumulative": 3}[sort]
+        ranked = sorted(stats.stats.items(), key=lambda item: item[1][column], reverse=True)[:top]
+        return {
+            "seconds": round(seconds, 3),
+            "totalCalls": stats.total_calls,
+            "functions": [{
+                "function": f"{name} ({os.path.basename(filename)}:{line})",
+                "calls": calls, "primitiveCalls": primitive,
+                "ownMs": round(own * 1000, 3), "cumulativeMs": round(cumulative * 1000, 3),
+            } for (filename, line, name), (primitive, calls, own, cumulative, _) in ranked],
+            "path": path,
+        }
+
+    async def sample(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        seconds = _number(params, "seconds", 5.0, 0.01, MAX_SAMPLE_SECONDS)
+        interval = _number(params, "intervalMs", 5.0, MIN_SAMPLE_INTERVAL_MS, 1000.0) / 1000
+        top, path = _top(params), _path(params)
+        if self.sampling:
+            raise ValueError("A sample is already being taken")
+        self.sampling = True
+        try:
+            # The loop keeps serving requests while the sampler thread watches it.
+            stacks = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds, interval)
+        finally:
+            self.sampling = False
+        collapsed = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(collapsed)
+        return {"seconds": seconds, "samples": sum(stacks.values()), "functions": summarize_stacks(stacks, top),
+                "collapsed": collapsed, "path": path}
+
+    async def tracemalloc_start(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        frames = int(_number(params, "frames", 1, 1, 100))
+        if tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is already tracing")
+        tracemalloc.start(frames)
+        return {"tracing": True, "frames": frames}
+
+    @staticmethod
+    def _group_by(params: Dict[str, Any]) -> str:
+        group_by = params.get("groupBy", "lineno")
+        if group_by not in GROUPINGS:
+            raise ValueError(f"groupBy must be one of {', '.join(GROUPINGS)}")
+        return group_by
+
+    @staticmethod
+    def _location(statistic) -> str:
+        return " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in statistic.traceback)
+
+    def _keep(self, snapshot: "tracemalloc.Snapshot") -> int:
+        self._snapshot_ids += 1
+        self.snapshots[self._snapshot_ids] = snapshot
+        while len(self.snapshots) > MAX_SNAPSHOTS:
+            self.snapshots.popitem(last=False)
+        return self._snapshot_ids
+
+    async def tracemalloc_snapshot(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is not tracing; call admin/tracemalloc/start first")
+        group_by, top = self._group_by(params), _top(params)
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        statistics = await asyncio.to_thread(snapshot.statistics, group_by)
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "id": self._keep(snapshot), "tracedBytes": traced, "peakBytes": peak,
+            "top": [{"location": self._location(stat), "bytes": stat.size, "count": stat.count}
+                    for stat in statistics[:top]],
+        }
+
+    async def tracemalloc_diff(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Compare snapshot ``other`` (default: a new one) against snapshot ``base`` (default: the oldest kept)."""
+        if not self.snapshots:
+            raise ValueError("No snapshot to compare against; call admin/tracemalloc/snapshot first")
+        group_by, top = self._group_by(params), _top(params)
+        base_id = params.get("base", next(iter(self.snapshots)))
+        if base_id not in self.snapshots:
+            raise ValueError(f"Unknown snapshot {base_id}; kept: {list(self.snapshots)}")
+        other_id = params.get("other")
+        if other_id is None:
+            if not tracemalloc.is_tracing():
+                raise ValueError("tracemalloc is not tracing; pass other to compare two kept snapshots")
+            other_id = self._keep(tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS))
+        elif other_id not in self.snapshots:
+            raise ValueError(f"Unknown snapshot {other_id}; kept: {list(self.snapshots)}")
+        differences = await asyncio.to_thread(self.snapshots[other_id].compare_to, self.snapshots[base_id], group_by)
+        return {
+            "base": base_id, "other": other_id,
+            "sizeDiffBytes": sum(stat.size_diff for stat in differences),
+            "top": [{"location": self._location(stat), "sizeDiffBytes": stat.size_diff, "bytes": stat.size,
+                     "countDiff": stat.count_diff, "count": stat.count} for stat in differences[:top]],
+        }
+
+    async def tracemalloc_stop(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        tracemalloc.stop()
+        self.snapshots.clear()
+        return {"tracing": False, "wasTracing": tracing}
+
+    async def memory(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        collected = gc.collect() if params.get("collect") else None
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        return {
+            **_memory_status(),
+            "gc": {
+                "enabled": gc.isenabled(), "counts": list(gc.get_count()), "thresholds": list(gc.get_threshold()),
+                "generations": gc.get_stats(), "frozen": gc.get_freeze_count(), "uncollectable": len(gc.garbage),
+                "collected": collected,
+            },
+            "tracemalloc": {"tracing": tracemalloc.is_tracing(), "tracedBytes": traced, "peakBytes": peak},
+            "threads": threading.active_count(),
+            "profiling": self.profile is not None,
+            "sampling": self.sampling,
+        }
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Safe arithmetic expressions for the calculator tools.
+
+Expressions such as ``"price * qty - sqrt(fee)"`` are parsed once, checked
+against a whitelist of syntax and functions, and compiled. They can then be
+evaluated row by row on plain floats, or once per chunk on NumPy arrays.
+"""
+
+import ast
+import functools
+import math
+from typing import Any, Dict, List, Mapping
+
+from lazy_imports import is_loaded, optional_import
+
+# NumPy is optional (scalar evaluation is the fallback) and imported on first use.
+np = optional_import("numpy")
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load, ast.Call,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.FloorDiv, ast.UAdd, ast.USub,
+)
+
+SCALAR_FUNCTIONS: Dict[str, Any] = {
+    "sqrt": math.sqrt, "exp": math.exp, "log": math.log, "log10": math.log10,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "abs": abs, "min": min, "max": max, "floor": math.floor, "ceil": math.ceil,
+}
+CONSTANTS: Dict[str, float] = {"pi": math.pi, "e": math.e}
+
+# Expression function -> NumPy ufunc name, looked up when an array is first evaluated.
+VECTOR_FUNCTIONS: Dict[str, str] = {} if np is None else {
+    "sqrt": "sqrt", "exp": "exp", "log": "log", "log10": "log10",
+    "sin": "sin", "cos": "cos", "tan": "tan",
+    "abs": "abs", "min": "minimum", "max": "maximum", "floor": "floor", "ceil": "ceil",
+}
+
+
+def _vector_function(ufunc: str) -> Any:
+    function = getattr(np, ufunc)
+    if ufunc in ("minimum", "maximum"):
+        # Binary ufuncs take a third argument as ``out``; fold pairwise so min/max accept any count, like the builtins.
+        return lambda *args: functools.reduce(function, args)
+    return function
+
+
+class Expression:
+    """A validated, compiled arithmetic expression over named variables."""
+
+    def __init__(self, text: str):
+        try:
+            tree = ast.parse(text, mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"Invalid expression '{text}': {e.msg}") from e
+
+        names = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}")
+            if isinstance(node, ast.Constant):
+                if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                    raise ValueError("Only numeric constants are allowed in expressions")
+                # Float constants keep "9 ** 9 ** 9" an OverflowError instead of a huge int.
+                node.value = float(node.value)
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in SCALAR_FUNCTIONS or node.keywords:
+                    raise ValueError(f"Unsupported function call in expression '{text}'")
+            elif isinstance(node, ast.Name) and node.id not in SCALAR_FUNCTIONS:
+                names.add(node.id)
+
+        self.text = text
+        self.variables: List[str] = sorted(names - set(CONSTANTS))
+        self._code = compile(tree, "<expression>", "eval")
+        row_source = f"lambda {', '.join(self.variables)}: {ast.unparse(tree.body)}"
+        self._row_function = eval(row_source, {"__builtins__": {}, **SCALAR_FUNCTIONS, **CONSTANTS})
+
+    def evaluate(self, values: Mapping[str, Any]) -> Any:
+        """Evaluate on scalars (or, with NumPy, on whole arrays at once)."""
+        missing = [name for name in self.variables if name not in values]
+        if missing:
+            raise ValueError(f"Missing values for: {', '.join(missing)}")
+        vectorized = is_loaded(np) and any(isinstance(values[name], np.ndarray) for name in self.variables)
+        if vectorized:
+            namespace = {name: _vector_function(ufunc) for name, ufunc in VECTOR_FUNCTIONS.items()}
+        else:
+            namespace = dict(SCALAR_FUNCTIONS)
+        namespace.update(CONSTANTS)
+        namespace.update(values)
+        return eval(self._code, {"__builtins__": {}}, namespace)
+
+    def evaluate_columns(self, columns: Mapping[str, Any], length: int) -> Any:
+        """Evaluate over equal-length columns.
+
+        NumPy array columns are evaluated in one vectorized pass; list columns
+        are evaluated row by row, with rows that raise a math error yielding NaN.
+        """
+        if is_loaded(np) and any(isinstance(columns.get(name), np.ndarray) for name in self.variables):
+            with np.errstate(all="ignore"):
+                return np.broadcast_to(np.asarray(self.evaluate(columns), dtype=float), (length,))
+        if not self.variables:
+            return [float(self._row_function())] * length
+        row_function = self._row_function
+
+        def safe_row(*row):
+            try:
+                return float(row_function(*row))
+            except (ArithmeticError, ValueError):
+                return math.nan
+        return list(map(safe_row, *(columns[name] for name in self.variables)))
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Financial schedule tools for the calculator server.
+
+Schedules are computed in closed form over the whole period axis at once
+(NumPy arrays when available, list comprehensions otherwise) rather than by
+stepping period by period. Results are columnar: one list per field. Long
+schedules can be paged with ``offset``/``limit`` or streamed to a CSV file in
+chunks via ``output_path``.
+"""
+
+import csv
+import math
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from lazy_imports import optional_import
+
+# NumPy is optional (list comprehensions are the fallback) and imported on first use.
+np = optional_import("numpy")
+
+# Rows per chunk when streaming a schedule to a file.
+CHUNK_PERIODS = 10_000
+# Largest schedule returned inline; longer ones need paging or output_path.
+MAX_INLINE_PERIODS = 100_000
+
+
+def _axis(start: int, stop: int) -> Any:
+    return np.arange(start, stop, dtype=float) if np is not None else [float(k) for k in range(start, stop)]
+
+
+def _apply(func: Callable[[Any], Any], values: Any) -> Any:
+    """Apply an elementwise function to an axis (NumPy or list)."""
+    return func(values) if np is not None else [func(value) for value in values]
+
+
+def _columns_to_lists(columns: Dict[str, Any]) -> Dict[str, List[float]]:
+    return {name: (values.tolist() if np is not None else list(values)) for name, values in columns.items()}
+
+
+def payment(principal: float, rate: float, periods: int) -> float:
+    """Level payment that repays ``principal`` over ``periods`` at periodic ``rate``."""
+    if periods <= 0:
+        raise ValueError("periods must be positive")
+    if rate == 0:
+        return principal / periods
+    return principal * rate / (1 - (1 + rate) ** -periods)
+
+
+def _amortization_rows(principal: float, rate: float, level: float, periods: int,
+                       start: int, stop: int) -> Dict[str, Any]:
+    """Closed-form amortization rows for periods ``start+1 .. stop``."""
+    k = _axis(start + 1, stop + 1)
+    if rate == 0:
+        def remaining(p):
+            return principal * (1 - p / periods)
+    else:
+        # L * (1 - (1+r)^(p-n)) / (1 - (1+r)^-n): only non-positive exponents, so
+        # long schedules neither overflow nor cancel catastrophically.
+        scale = principal / (1 - (1 + rate) ** -periods)
+
+        def remaining(p):
+            return scale * (1 - (1 + rate) ** (p - periods))
+    balance = _apply(remaining, k)
+    interest = _apply(lambda p: remaining(p - 1) * rate, k)
+    if np is not None:
+        return {"period": k, "payment": np.full(len(k), level), "interest": interest,
+                "principal": level - interest, "balance": balance}
+    return {"period": k, "payment": [level] * len(k), "interest": interest,
+            "principal": [level - value for value in interest], "balance": balance}
+
+
+def _write_chunks(output_path: str, fields: Sequence[str], total: int,
+                  rows: Callable[[int, int], Dict[str, Any]]) -> None:
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for start in range(0, total, CHUNK_PERIODS):
+            columns = _columns_to_lists(rows(start, min(total, start + CHUNK_PERIODS)))
+            writer.writerows(zip(*(columns[name] for name in fields)))
+
+
+def _page(total: int, offset: int, limit: Optional[int]) -> range:
+    offset = max(0, int(offset))
+    stop = total if limit is None else min(total, offset + max(0, int(limit)))
+    if stop - offset > MAX_INLINE_PERIODS:
+        raise ValueError(f"More than {MAX_INLINE_PERIODS} rows requested; use 'limit' or 'output_path'")
+    return range(offset, max(offset, stop))
+
+
+def amortization_schedule(principal: float, annual_rate: float, periods: int, periods_per_year: int = 12,
+                          offset: int = 0, limit: Optional[int] = None,
+                          output_path: Optional[str] = None) -> Dict[str, Any]:
+    """Level-payment loan schedule as columns (period, payment, interest, principal, balance)."""
+    principal, periods = float(principal), int(periods)
+    rate = float(annual_rate) / int(periods_per_year)
+    level = payment(principal, rate, periods)
+    fields = ["period", "payment", "interest", "principal", "balance"]
+    summary = {"payment": level, "periods": periods, "total_interest": level * periods - principal}
+
+    if output_path is not None:
+        _write_chunks(output_path, fields, periods,
+                      lambda start, stop: _amortization_rows(principal, rate, level, periods, start, stop))
+        return {**summary, "output_path": output_path}
+    page = _page(periods, offset, limit)
+    columns = _columns_to_lists(_amortization_rows(principal, rate, level, periods, page.start, page.stop))
+    return {**summary, "offset": page.start, "columns": columns}
+
+
+def npv(rate: float, cashflows: Sequence[float]) -> float:
+    """Net present value; ``cashflows[0]`` is at time zero."""
+    rate = float(rate)
+    if rate <= -1:
+        raise ValueError("rate must be greater than -1")
+    if np is not None:
+        flows = np.asarray(cashflows, dtype=float)
+        return float(np.sum(flows / (1 + rate) ** np.arange(len(flows))))
+    return math.fsum(float(flow) / (1 + rate) ** t for t, flow in enumerate(cashflows))
+
+
+def _npv_derivative(rate: float, cashflows: Sequence[float]) -> float:
+    if np is not None:
+        flows = np.asarray(cashflows, dtype=float)
+        t = np.arange(len(flows))
+        return float(np.sum(-t * flows / (1 + rate) ** (t + 1)))
+    return math.fsum(-t * float(flow) / (1 + rate) ** (t + 1) for t, flow in enumerate(cashflows))
+
+
+def _npv_or_none(rate: float, cashflows: Sequence[float]) -> Optional[float]:
+    """NPV at ``rate``, or None where long schedules under/overflow the discount factors."""
+    try:
+        if np is not None:
+            with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+                value = npv(rate, cashflows)
+        else:
+            value = npv(rate, cashflows)
+    except (ZeroDivisionError, OverflowError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def irr(cashflows: Sequence[float], guess: float = 0.1, tolerance: float = 1e-10, max_iterations: int = 100) -> float:
+    """Internal rate of return: Newton's method, falling back to bisection on a bracket."""
+    flows = [float(flow) for flow in cashflows]
+    if not (any(flow > 0 for flow in flows) and any(flow < 0 for flow in flows)):
+        raise ValueError("Cash flows need at least one positive and one negative value")
+
+    rate = float(guess)
+    for _ in range(max_iterations):
+        if rate <= -1:
+            break
+        value = _npv_or_none(rate, flows)
+        if value is None:
+            break
+        if abs(value) < tolerance:
+            return rate
+        try:
+            slope = _npv_derivative(rate, flows)
+        except (ZeroDivisionError, OverflowError):
+            break
+        if slope == 0 or not math.isfinite(slope):
+            break
+        step = value / slope
+        if rate - step <= -1:
+            # Never step onto or past -1; go halfway there instead.
+            step = (rate + 1) / 2
+        rate -= step
+        if abs(step) < tolerance:
+            return rate
+
+    # Bracket a sign change on a grid of rates, then bisect. Points whose
+    # discount factors under/overflow for this many periods are skipped.
+    grid = [-0.99, -0.9, -0.5, -0.2, 0.0, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 100.0]
+    points = [(r, v) for r, v in ((r, _npv_or_none(r, flows)) for r in grid) if v is not None]
+    for (low, f_low), (high, f_high) in zip(points, points[1:]):
+        if f_low == 0:
+            return low
+        if f_low * f_high < 0:
+            for _ in range(200):
+                mid = (low + high) / 2
+                f_mid = _npv_or_none(mid, flows)
+                if f_mid is None:
+                    break
+                if abs(f_mid) < tolerance or high - low < tolerance:
+                    return mid
+                if f_low * f_mid < 0:
+                    high = mid
+                else:
+                    low, f_low = mid, f_mid
+            return (low + high) / 2
+    raise ValueError("IRR did not converge and no sign change was found between -99% and 10000%")
+
+
+def _compound_rows(principal: float, rate: float, per_year: int, contribution: float,
+                   start: int, stop: int) -> Dict[str, Any]:
+    years = _axis(start + 1, stop + 1)
+    n = _apply(lambda y: y * per_year, years)
+    growth = _apply(lambda periods: (1 + rate) ** periods, n)
+    if rate == 0:
+        balance = _apply(lambda periods: principal + contribution * periods, n)
+    else:
+        balance = _apply(lambda g: principal * g + contribution * (g - 1) / rate, growth)
+    contributed = _apply(lambda periods: principal + contribution * periods, n)
+    if np is not None:
+        interest = balance - contributed
+    else:
+        interest = [b - c for b, c in zip(balance, contributed)]
+    return {"year": years, "balance": balance, "contributions": contributed, "interest": interest}
+
+
+def compound_table(principal: float, annual_rate: float, years: int, compounds_per_year: int = 1,
+                   contribution: float = 0.0, offset: int = 0, limit: Optional[int] = None,
+                   output_path: Optional[str] = None) -> Dict[str, Any]:
+    """Year-end balances for compound growth with optional per-period contributions."""
+    principal, years, per_year = float(principal), int(years), int(compounds_per_year)
+    if years < 0 or per_year <= 0:
+        raise ValueError("years must be non-negative and compounds_per_year positive")
+    rate, contribution = float(annual_rate) / per_year, float(contribution)
+    fields = ["year", "balance", "contributions", "interest"]
+
+    def rows(start, stop):
+        return _compound_rows(principal, rate, per_year, contribution, start, stop)
+    if output_path is not None:
+        _write_chunks(output_path, fields, years, rows)
+        return {"years": years, "output_path": output_path}
+    page = _page(years, offset, limit)
+    return {"years": years, "offset": page.start, "columns": _columns_to_lists(rows(page.start, page.stop))}
+
+
+def annuity(payment: float, rate: float, periods: int, due: bool = False) -> Dict[str, float]:
+    """Present and future value of ``periods`` level payments at periodic ``rate``."""
+    payment, rate, periods = float(payment), float(rate), int(periods)
+    if periods < 0:
+        raise ValueError("periods must be non-negative")
+    if rate == 0:
+        present, future = payment * periods, payment * periods
+    else:
+        present = payment * (1 - (1 + rate) ** -periods) / rate
+        future = payment * ((1 + rate) ** periods - 1) / rate
+    if due:
+        present, future = present * (1 + rate), future * (1 + rate)
+    return {"present_value": present, "future_value": future}
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Message encodings for the calculator server.
+
+JSON text is the default on every transport. Over stdio and sockets a client
+may ask, in its ``initialize`` request, for a binary encoding instead::
+
+    "capabilities": {"experimental": {"encodings": ["msgpack", "cbor"]}}
+
+The server picks the first one it supports and reports it in the
+``initialize`` result as ``capabilities.experimental.encoding``. From the next
+message on, in both directions, every message is a frame: a 4-byte big-endian
+length followed by the encoded message. Over HTTP the same encodings are
+selected per request with ``Content-Type: application/msgpack`` or
+``application/cbor``.
+
+Numeric arrays (``array.array`` or NumPy arrays of float64, int64, float32 or
+int32) are carried as raw little-endian blobs, a MessagePack extension type or
+an RFC 8746 typed-array tag in CBOR, and decode to ``array.array``. This skips
+the float-to-text round trip that dominates large JSON payloads.
+
+Tool results in compact mode (see ``calculator_server.py``) use the same
+blobs for numeric lists: ``compact_arrays`` turns them into ``array.array``
+under a binary encoding, and into ``{"dtype", "shape", "base64"}`` objects under
+JSON. ``unpack_arrays`` turns either form back into ``array.array``.
+
+MessagePack and CBOR need the optional ``msgpack`` and ``cbor2`` packages; an
+encoding whose package is missing is never negotiated.
+"""
+
+import asyncio
+import base64
+import json
+import struct
+import sys
+from array import array
+from typing import Any, BinaryIO, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from dataset_io import DTYPES
+from lazy_imports import is_loaded, optional_import
+
+# MessagePack and CBOR framing are optional; each package is imported when first used.
+msgpack = optional_import("msgpack")
+cbor2 = optional_import("cbor2")
+
+# NumPy arrays are encoded only when NumPy is present; it is imported on first use.
+np = optional_import("numpy")
+
+# Largest binary frame accepted from a peer.
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+# Numeric lists shorter than this stay plain lists in compact results; packing would not make them smaller.
+COMPACT_ARRAY_MIN = 8
+
+_LENGTH = struct.Struct(">I")
+
+# MessagePack extension type codes and RFC 8746 little-endian typed-array tags.
+_MSGPACK_EXT = {"float64": 1, "int64": 2, "float32": 3, "int32": 4}
+_CBOR_TAGS = {"float64": 86, "int64": 79, "float32": 85, "int32": 78}
+_EXT_DTYPE = {code: name for name, code in _MSGPACK_EXT.items()}
+_TAG_DTYPE = {tag: name for name, tag in _CBOR_TAGS.items()}
+_TYPECODE_DTYPE = {typecode: name for name, (typecode, _) in DTYPES.items()}
+_NUMPY_DTYPE = {descr[1:]: name for name, (_, descr) in DTYPES.items()}
+
+
+class Codec(NamedTuple):
+    """An encoding; ``decode`` raises ValueError (or TypeError) on malformed input."""
+
+    name: str
+    content_type: str
+    encode: Callable[[Any], bytes]
+    decode: Callable[[bytes], Any]
+
+
+def _array_blob(value: Any) -> Optional[Tuple[str, bytes]]:
+    """(dtype, little-endian bytes) for a supported numeric array, else None."""
+    if isinstance(value, array):
+        dtype = _TYPECODE_DTYPE.get(value.typecode)
+        if dtype is None:
+            return None
+        if sys.byteorder == "big":
+            value = array(value.typecode, value)
+            value.byteswap()
+        return dtype, value.tobytes()
+    if is_loaded(np) and isinstance(value, np.ndarray):
+        dtype = _NUMPY_DTYPE.get(f"{value.dtype.kind}{value.dtype.itemsize}")
+        if dtype is None:
+            return None
+        # Multi-dimensional arrays travel flattened, in C order.
+        return dtype, np.ascontiguousarray(value.ravel(), dtype=DTYPES[dtype][1]).tobytes()
+    return None
+
+
+def _from_blob(dtype: str, data: bytes) -> array:
+    values = array(DTYPES[dtype][0])
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def pack_array(values: List[Any], binary: bool) -> Any:
+    """A list of numbers as int64 or float64 ``array.array``, or for JSON its base64 blob object."""
+    typecode = "q" if all(type(value) is int for value in values) else "d"
+    try:
+        packed = array(typecode, values)
+    except OverflowError:
+        packed = array("d", values)
+    if binary:
+        return packed
+    dtype, data = _array_blob(packed)
+    return {"dtype": dtype, "shape": [len(packed)], "base64": base64.b64encode(data).decode("ascii")}
+
+
+def compact_arrays(value: Any, binary: bool) -> Any:
+    """``value`` with every list of at least ``COMPACT_ARRAY_MIN`` numbers packed by ``pack_array``."""
+    if isinstance(value, dict):
+        return {key: compact_arrays(item, binary) for key, item in value.items()}
+    if isinstance(value, list):
+        if len(value) >= COMPACT_ARRAY_MIN and all(type(item) in (float, int) for item in value):
+            return pack_array(value, binary)
+        return [compact_arrays(item, binary) for item in value]
+    return value
+
+
+def unpack_arrays(value: Any) -> Any:
+    """``value`` with every base64 array object from ``compact_arrays`` decoded to ``array.array``."""
+    if isinstance(value, dict):
+        if value.keys() == {"dtype", "shape", "base64"} and value["dtype"] in DTYPES:
+            return _from_blob(value["dtype"], base64.b64decode(value["base64"]))
+        return {key: unpack_arrays(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [unpack_arrays(item) for item in value]
+    return value
+
+
+def _plain(value: Any) -> Any:
+    """Fallback for types the encoders do not know: arrays become lists."""
+    if isinstance(value, array):
+        return value.tolist()
+    if is_loaded(np) and isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _msgpack_default(value: Any) -> Any:
+    blob = _array_blob(value)
+    if blob is not None:
+        return msgpack.ExtType(_MSGPACK_EXT[blob[0]], blob[1])
+    return _plain(value)
+
+
+def _msgpack_ext(code: int, data: bytes) -> Any:
+    if code in _EXT_DTYPE:
+        return _from_blob(_EXT_DTYPE[code], data)
+    return msgpack.ExtType(code, data)
+
+
+def _cbor_default(encoder: Any, value: Any):
+    blob = _array_blob(value)
+    if blob is not None:
+        encoder.encode(cbor2.CBORTag(_CBOR_TAGS[blob[0]], blob[1]))
+    else:
+        encoder.encode(_plain(value))
+
+
+def _cbor_tagged(value: Any) -> Any:
+    """``value`` with numeric arrays as typed-array tags: newer cbor2 writes ``array.array`` as a plain list."""
+    if isinstance(value, dict):
+        return {key: _cbor_tagged(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_cbor_tagged(item) for item in value]
+    blob = _array_blob(value)
+    if blob is not None:
+        return cbor2.CBORTag(_CBOR_TAGS[blob[0]], blob[1])
+    return value
+
+
+def _cbor_tag(first: Any, second: Any) -> Any:
+    # cbor2 5 calls tag_hook(decoder, tag); cbor2 6's C decoder calls it as (tag, immutable).
+    tag = first if isinstance(first, cbor2.CBORTag) else second
+    if tag.tag in _TAG_DTYPE:
+        return _from_blob(_TAG_DTYPE[tag.tag], tag.value)
+    return tag
+
+
+def _cbor_loads(data: bytes) -> Any:
+    try:
+        return cbor2.loads(data, tag_hook=_cbor_tag)
+    except cbor2.CBORDecodeError as e:
+        raise ValueError(str(e)) from e
+
+
+JSON = Codec("json", "application/json", lambda message: json.dumps(message, default=_plain).encode(), json.loads)
+
+CODECS: Dict[str, Codec] = {"json": JSON}
+if msgpack is not None:
+    CODECS["msgpack"] = Codec(
+        "msgpack", "application/msgpack",
+        lambda message: msgpack.packb(message, default=_msgpack_default, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, ext_hook=_msgpack_ext, raw=False, strict_map_key=False),
+    )
+if cbor2 is not None:
+    CODECS["cbor"] = Codec(
+        "cbor", "application/cbor",
+        lambda message: cbor2.dumps(_cbor_tagged(message), default=_cbor_default),
+        _cbor_loads,
+    )
+
+
+def negotiate(params: Optional[Dict[str, Any]]) -> Optional[str]:
+    """The first binary encoding offered in ``initialize`` params that this server supports."""
+    capabilities = (params or {}).get("capabilities") or {}
+    offered = (capabilities.get("experimental") or {}).get("encodings") or []
+    for name in offered:
+        if name != "json" and name in CODECS:
+            return name
+    return None
+
+
+def codec_for_content_type(content_type: Optional[str]) -> Codec:
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    for codec in CODECS.values():
+        if codec.content_type == media_type:
+            return codec
+    return JSON
+
+
+def frame(payload: bytes) -> bytes:
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def _check_length(header: bytes, max_bytes: int) -> int:
+    (length,) = _LENGTH.unpack(header)
+    if length > max_bytes:
+        raise ValueError(f"Frame of {length} bytes exceeds {max_bytes} bytes")
+    return length
+
+
+async def read_frame(reader: asyncio.StreamReader, max_bytes: int = MAX_FRAME_BYTES,
+                     idle_timeout: Optional[float] = None) -> Optional[bytes]:
+    """Read one frame; None at a clean end of stream.
+
+    ``idle_timeout`` only bounds the wait for a frame to start, so a timeout
+    never leaves half a frame consumed.
+    """
+    try:
+        header = await asyncio.wait_for(reader.readexactly(_LENGTH.size), idle_timeout)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    return await reader.readexactly(_check_length(header, max_bytes))
+
+
+def read_frame_sync(stream: BinaryIO, max_bytes: int = MAX_FRAME_BYTES) -> Optional[bytes]:
+    """Blocking ``read_frame`` for file objects such as ``sys.stdin.buffer``."""
+    header = stream.read(_LENGTH.size)
+    if not header:
+        return None
+    if len(header) < _LENGTH.size:
+        raise EOFError("Truncated frame header")
+    length = _check_length(header, max_bytes)
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise EOFError("Truncated frame")
+    return payload
@@ -3,12 +3,17 @@
 Launch script to test the complete MCP Calculator Demo
 """
 
+import socket
 import subprocess
 import time
 import webbrowser
 import sys
 import os
 
+STREAMLIT_PORT = 8501
+# How long Streamlit may take to start accepting connections.
+STARTUP_TIMEOUT = 30.0
+
 def test_server():
     """Test the MCP server functionality."""
     print("🧪 Testing MCP Server...")
@@ -23,23 +28,52 @@ def test_server():
         print(result.stderr)
         return False
 
+def port_in_use(port):
+    """True if something already accepts connections on localhost:port."""
+    try:
+        with socket.create_connection(("localhost", port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+def wait_for_port(port, process, timeout=STARTUP_TIMEOUT):
+    """Wait until localhost:port accepts a connection; False if the process exits or time runs out."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        if port_in_use(port):
+            return process.poll() is None
+        time.sleep(0.05)
+    return False
+
 def launch_streamlit():
     """Launch the Streamlit app."""
     print("🚀 Launching Streamlit app...")
     
-    # Start Streamlit in background
+    # Otherwise the readiness check below would be answered by whatever holds the port
+    if port_in_use(STREAMLIT_PORT):
+        print(f"❌ Port {STREAMLIT_PORT} is already in use; stop whatever is running there first.")
+        return None
+    
+    # Start Streamlit in background; its errors go to this terminal rather
+    # than to a pipe nobody drains, which would eventually fill and block it
     process = subprocess.Popen(
-        [sys.executable, "-m", "streamlit", "run", "streamlit_app.py", "--server.headless", "true"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
+        [sys.executable, "-m", "streamlit", "run", "streamlit_app.py", "--server.headless", "true",
+         "--server.port", str(STREAMLIT_PORT)],
+        stdout=subprocess.DEVNULL
     )
     
-    # Wait for server to start
-    time.sleep(3)
+    # Wait until it accepts connections rather than for a fixed time
+    if not wait_for_port(STREAMLIT_PORT, process):
+        print("❌ Streamlit did not start! (see its errors above)")
+        process.terminate()
+        process.wait()
+        return None
     
     # Open browser
     print("🌐 Opening browser...")
-    webbrowser.open("http://localhost:8501")
+    webbrowser.open(f"http://localhost:{STREAMLIT_PORT}")
     
     return process
 
@@ -59,6 +93,8 @@ def main():
     
     # Launch Streamlit
     streamlit_process = launch_streamlit()
+    if streamlit_process is None:
+        return
     
     print("\n🎉 Demo is ready!")
     print("📋 What to do next:")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Deferred imports for optional, slow-to-import packages.
+
+``optional_import("numpy")`` returns None when the package is not installed
+and otherwise a module whose real import runs on first attribute access. The
+calculator modules keep their ``np is not None`` checks, while a server that
+never touches an array no longer pays NumPy's import time at startup.
+``lazy_import`` does the same for required modules that only some requests use.
+"""
+
+import importlib.util
+import sys
+from types import ModuleType
+from typing import List, Optional
+
+# Names of the modules lazy_import has deferred, for load_pending.
+_deferred: List[str] = []
+
+
+def lazy_import(name: str) -> ModuleType:
+    """The named module, executed on first attribute access; ImportError if it cannot be found."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    try:
+        spec = importlib.util.find_spec(name)
+    except ValueError as e:
+        raise ImportError(str(e), name=name) from e
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    _deferred.append(name)
+    return module
+
+
+def optional_import(name: str) -> Optional[ModuleType]:
+    """The named module, loaded lazily, or None if it is not installed."""
+    try:
+        return lazy_import(name)
+    except ImportError:
+        return None
+
+
+def load_pending():
+    """Finish every deferred import now, e.g. in a process that is about to fork warm children."""
+    while _deferred:
+        module = sys.modules.get(_deferred.pop())
+        if module is not None and not is_loaded(module):
+            # Any attribute access makes LazyLoader execute the module, which may defer further imports.
+            getattr(module, "__name__")
+
+
+def is_loaded(module: Optional[ModuleType]) -> bool:
+    """Whether ``module`` (from ``optional_import``) has really been imported yet.
+
+    Objects of a package's types can only exist once it is loaded, so
+    ``is_loaded(np) and isinstance(value, np.ndarray)`` never triggers the import.
+    """
+    # LazyLoader turns the placeholder into a plain module when it loads it.
+    return module is not None and type(module) is ModuleType
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Pipelined JSON-RPC client for the calculator MCP servers.
+
+``AsyncClient`` talks to a server subprocess over stdio, or to a server
+listening on TCP or a Unix socket. Every request gets the next id from a
+monotonic counter, and a background reader task resolves the matching future
+whenever a response arrives. Callers can therefore keep many requests in
+flight on one connection, and responses may come back in any order.
+
+Requests take an optional timeout. A request that times out or is cancelled
+is forgotten locally and the server is sent ``notifications/cancelled``.
+``batch`` pipelines a list of requests and returns their responses in order.
+
+``Client`` is the synchronous facade. It runs an ``AsyncClient`` on a private
+event-loop thread, for scripts, test harnesses and Streamlit.
+
+No fixed sleep is needed after starting a server. Over stdio, requests queue in
+the pipe until the server reads them, so the ``initialize`` response is the
+readiness handshake. For socket servers, ``connect(..., wait=...)`` retries
+until the server accepts, and ``wait_for_ready_file`` waits for a server started
+with ``--ready-file`` (which also reports the port when 0 was requested).
+
+``fork(PATH)`` gets a session from a running ``calculator_server.py --zygote
+PATH`` instead of spawning a new interpreter; see ``zygote.py``.
+"""
+
+import asyncio
+import itertools
+import json
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from framing import CODECS, frame, read_frame, unpack_arrays
+
+# Largest single message accepted from the server.
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+PROTOCOL_VERSION = "2024-11-05"
+
+Call = Tuple[str, Optional[Dict[str, Any]]]
+
+
+class MCPError(Exception):
+    """A JSON-RPC error response, raised by helpers that return results directly."""
+
+    def __init__(self, error: Dict[str, Any]):
+        super().__init__(error.get("message", "Unknown error"))
+        self.code = error.get("code")
+        self.data = error.get("data")
+
+
+def result_text(response: Optional[Dict[str, Any]]) -> str:
+    """The text of a tools/call response, or ``"Error: ..."`` for an error response.
+
+    Compact results have no text; their structured content is returned as JSON.
+    """
+    if response is None:
+        return "No response received"
+    if "error" in response:
+        return f"Error: {response['error'].get('message')}"
+    result = response.get("result", {})
+    content = result.get("content")
+    if not content and "structuredContent" in result:
+        return json.dumps(unpack_arrays(result["structuredContent"]), default=list)
+    return (content or [{}])[0].get("text", "")
+
+
+def structured_result(response: Dict[str, Any]) -> Dict[str, Any]:
+    """The structured content of a tools/call response, with compact arrays as ``array.array``.
+
+    Raises ``MCPError`` for an error response or a failed tool call.
+    """
+    if "error" in response:
+        raise MCPError(response["error"])
+    result = response.get("result", {})
+    if result.get("isError") or "structuredContent" not in result:
+        raise MCPError({"message": result_text(response)})
+    return unpack_arrays(result["structuredContent"])
+
+
+def wait_for_ready_file(path: str, timeout: float = 15.0,
+                        process: Optional[subprocess.Popen] = None) -> Dict[str, Any]:
+    """Wait for a server started with ``--ready-file path``; returns its ``{pid, transport, address}``.
+
+    Raises TimeoutError, or RuntimeError if ``process`` exits before it is ready.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.002
+    while True:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode} before it was ready")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Server did not write {path} within {timeout} seconds")
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+class AsyncClient:
+    """One connection to an MCP server, with any number of requests in flight."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 process: Optional[asyncio.subprocess.Process] = None):
+        self.reader = reader
+        self.writer = writer
+        self.process = process
+        self.encoding = "json"
+        self.server_info: Optional[Dict[str, Any]] = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._progress: Dict[Any, Callable[[Dict[str, Any]], None]] = {}
+        self._notification_handlers: List[Callable[[Dict[str, Any]], None]] = []
+        self._write_lock = asyncio.Lock()
+        self._closed = False
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def spawn(cls, command: Sequence[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                    stderr: Any = subprocess.DEVNULL) -> "AsyncClient":
+        """Start a stdio server subprocess and connect to it."""
+        process = await asyncio.create_subprocess_exec(
+            *command, cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr,
+            limit=MAX_MESSAGE_BYTES,
+        )
+        return cls(process.stdout, process.stdin, process)
+
+    @classmethod
+    async def fork(cls, zygote: str, stderr: Optional[int] = None) -> "AsyncClient":
+        """A stdio session forked from a warm ``calculator_server.py --zygote PATH``, over a socketpair.
+
+        ``process`` is then a ``zygote.ForkedSession``; pass a file descriptor as ``stderr`` to keep its log.
+        """
+        from zygote import fork_session
+
+        ours, theirs = socket.socketpair()
+        try:
+            fds = [theirs.fileno(), theirs.fileno()] + ([stderr] if stderr is not None else [])
+            process = await fork_session(zygote, fds)
+            reader, writer = await asyncio.open_unix_connection(sock=ours, limit=MAX_MESSAGE_BYTES)
+        except BaseException:
+            ours.close()
+            raise
+        finally:
+            theirs.close()
+        return cls(reader, writer, process)
+
+    @classmethod
+    async def connect(cls, host: Optional[str] = None, port: Optional[int] = None,
+                      path: Optional[str] = None, wait: float = 0.0) -> "AsyncClient":
+        """Connect to a server started with ``--tcp`` (host/port) or ``--unix`` (path).
+
+        A refused connection is retried for up to ``wait`` seconds, for a server that is still starting.
+        """
+        deadline = time.monotonic() + wait
+        delay = 0.005
+        while True:
+            try:
+                if path is not None:
+                    reader, writer = await asyncio.open_unix_connection(path, limit=MAX_MESSAGE_BYTES)
+                else:
+                    reader, writer = await asyncio.open_connection(host, port, limit=MAX_MESSAGE_BYTES)
+                return cls(reader, writer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.monotonic() + delay > deadline:
+                    raise
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+
+    @property
+    def connected(self) -> bool:
+        """False once the server has gone away or the client was closed."""
+        return not self._closed and not self._reader_task.done()
+
+    def on_notification(self, handler: Callable[[Dict[str, Any]], None]):
+        """Call ``handler`` with every server notification."""
+        self._notification_handlers.append(handler)
+
+    async def _write(self, message: Dict[str, Any]):
+        if self._closed:
+            raise ConnectionError("Client is closed")
+        if self.encoding == "json":
+            data = json.dumps(message).encode() + b"\n"
+        else:
+            data = frame(CODECS[self.encoding].encode(message))
+        async with self._write_lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def _read_message(self) -> Optional[Dict[str, Any]]:
+        if self.encoding == "json":
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    return None
+                try:
+                    return json.loads(line)
+                except ValueError:
+                    continue  # blank or stray non-JSON output
+        payload = await read_frame(self.reader, MAX_MESSAGE_BYTES)
+        return None if payload is None else CODECS[self.encoding].decode(payload)
+
+    async def _read_loop(self):
+        error: BaseException = ConnectionError("Server closed the connection")
+        try:
+            while True:
+                message = await self._read_message()
+                if message is None:
+                    break
+                if not isinstance(message, dict):
+                    continue
+                if "method" in message:
+                    self._dispatch_notification(message)
+                    continue
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except asyncio.CancelledError:
+            error = ConnectionError("Client is closed")
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            error = ConnectionError(f"Connection to server failed: {e}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+
+    def _dispatch_notification(self, message: Dict[str, Any]):
+        params = message.get("params") or {}
+        if message.get("method") == "notifications/progress" and params.get("progressToken") in self._progress:
+            self._progress[params["progressToken"]](params)
+        for handler in self._notification_handlers:
+            handler(message)
+
+    async def request(self, method: str, params: Optional[Dict[str, Any]] = None,
+                      timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Send a request and wait for its response (a result or an error message)."""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        try:
+            await self._write(message)
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if self._pending.pop(request_id, None) is not None and not self._closed:
+                reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "cancelled"
+                try:
+                    await self.notify("notifications/cancelled", {"requestId": request_id, "reason": reason})
+                except ConnectionError:
+                    pass
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def notify(self, method: str, params: Optional[Dict[str, Any]] = None):
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        await self._write(message)
+
+    async def send_raw(self, data: bytes):
+        """Write ``data`` to the connection as is, e.g. to see how a server copes with malformed input."""
+        if self._closed:
+            raise ConnectionError("Client is closed")
+        async with self._write_lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def batch(self, calls: Iterable[Call], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Pipeline ``(method, params)`` requests; responses are returned in call order."""
+        return list(await asyncio.gather(*(self.request(method, params, timeout) for method, params in calls)))
+
+    async def initialize(self, client_info: Optional[Dict[str, Any]] = None,
+                         encodings: Optional[List[str]] = None, timeout: Optional[float] = None,
+                         compact: bool = False) -> Dict[str, Any]:
+        """Initialize the session; ``encodings`` offers binary framing (see ``framing``).
+
+        With ``compact``, tool results carry only structured content; read them with ``structured_result``.
+        """
+        experimental: Dict[str, Any] = {}
+        offered = [name for name in encodings or [] if name in CODECS and name != "json"]
+        if offered:
+            experimental["encodings"] = offered
+        if compact:
+            experimental["compact"] = True
+        capabilities: Dict[str, Any] = {"experimental": experimental} if experimental else {}
+        response = await self.request("initialize", {
+            "protocolVersion": PROTOCOL_VERSION,
+            "capabilities": capabilities,
+            "clientInfo": client_info or {"name": "mcp-client", "version": "1.0"},
+        }, timeout)
+        if "result" in response:
+            self.server_info = response["result"].get("serverInfo")
+            encoding = ((response["result"].get("capabilities") or {}).get("experimental") or {}).get("encoding")
+            if encoding in offered:
+                # The server switched right after this response; nothing else is in flight yet.
+                await self._switch_encoding(encoding)
+            await self.notify("notifications/initialized")
+        return response
+
+    async def _switch_encoding(self, encoding: str):
+        self._reader_task.cancel()
+        try:
+            await self._reader_task
+        except asyncio.CancelledError:
+            pass
+        self.encoding = encoding
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def ping(self, timeout: Optional[float] = None):
+        """Round-trip an MCP ``ping``; raises on timeout or a dead connection."""
+        response = await self.request("ping", timeout=timeout)
+        if "error" in response:
+            raise MCPError(response["error"])
+
+    async def list_tools(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        response = await self.request("tools/list", timeout=timeout)
+        if "error" in response:
+            raise MCPError(response["error"])
+        return response["result"]["tools"]
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                        progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Call a tool; ``progress`` receives the request's progress notifications."""
+        params: Dict[str, Any] = {"name": name, "arguments": arguments or {}}
+        if progress is None:
+            return await self.request("tools/call", params, timeout)
+        token = f"progress-{next(self._ids)}"
+        params["_meta"] = {"progressToken": token}
+        self._progress[token] = progress
+        try:
+            return await self.request("tools/call", params, timeout)
+        finally:
+            self._progress.pop(token, None)
+
+    async def close(self, timeout: float = 2.0):
+        """Fail outstanding requests, close the connection and stop the server subprocess."""
+        if self._closed:
+            return
+        self._closed = True
+        self._reader_task.cancel()
+        try:
+            await self._reader_task
+        except asyncio.CancelledError:
+            pass
+        self.writer.close()
+        if self.process is not None:
+            try:
+                # Closing stdin lets the server exit on its own; terminate it if it does not.
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.process.terminate()
+                try:
+                    await asyncio.wait_for(self.process.wait(), timeout)
+                except asyncio.TimeoutError:
+                    self.process.kill()
+                    await self.process.wait()
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class LoopThread:
+    """An asyncio event loop running on a daemon thread, for driving clients from synchronous code."""
+
+    def __init__(self, name: str = "mcp-client"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, coroutine: Any) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine: Any) -> Any:
+        return self.submit(coroutine).result()
+
+    @property
+    def stopped(self) -> bool:
+        return self.loop.is_closed()
+
+    def stop(self):
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class Client:
+    """Synchronous facade over ``AsyncClient``, driven by a private event-loop thread."""
+
+    def __init__(self, connect: Callable[[], Any]):
+        self._thread = LoopThread()
+        try:
+            self._client: AsyncClient = self._thread.run(connect())
+        except BaseException:
+            self._thread.stop()
+            raise
+
+    @classmethod
+    def spawn(cls, command: Sequence[str], **options: Any) -> "Client":
+        return cls(lambda: AsyncClient.spawn(command, **options))
+
+    @classmethod
+    def fork(cls, zygote: str, **options: Any) -> "Client":
+        return cls(lambda: AsyncClient.fork(zygote, **options))
+
+    @classmethod
+    def connect(cls, host: Optional[str] = None, port: Optional[int] = None, path: Optional[str] = None,
+                wait: float = 0.0) -> "Client":
+        return cls(lambda: AsyncClient.connect(host, port, path, wait))
+
+    def _run(self, coroutine: Any) -> Any:
+        return self._thread.run(coroutine)
+
+    @property
+    def process(self) -> Optional[asyncio.subprocess.Process]:
+        return self._client.process
+
+    @property
+    def server_info(self) -> Optional[Dict[str, Any]]:
+        return self._client.server_info
+
+    def on_notification(self, handler: Callable[[Dict[str, Any]], None]):
+        """Register a notification handler; it runs on the client's event-loop thread."""
+        self._thread.loop.call_soon_threadsafe(self._client.on_notification, handler)
+
+    def submit(self, method: str, params: Optional[Dict[str, Any]] = None,
+               timeout: Optional[float] = None) -> Future:
+        """Send a request without waiting; the returned future resolves to its response."""
+        return self._thread.submit(self._client.request(method, params, timeout))
+
+    def request(self, method: str, params: Optional[Dict[str, Any]] = None,
+                timeout: Optional[float] = None) -> Dict[str, Any]:
+        return self._run(self._client.request(method, params, timeout))
+
+    def notify(self, method: str, params: Optional[Dict[str, Any]] = None):
+        self._run(self._client.notify(method, params))
+
+    def batch(self, calls: Iterable[Call], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        return self._run(self._client.batch(list(calls), timeout))
+
+    def initialize(self, client_info: Optional[Dict[str, Any]] = None, encodings: Optional[List[str]] = None,
+                   timeout: Optional[float] = None, compact: bool = False) -> Dict[str, Any]:
+        return self._run(self._client.initialize(client_info, encodings, timeout, compact))
+
+    def ping(self, timeout: Optional[float] = None):
+        self._run(self._client.ping(timeout))
+
+    def list_tools(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        return self._run(self._client.list_tools(timeout))
+
+    def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                  progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        return self._run(self._client.call_tool(name, arguments, timeout, progress))
+
+    def close(self):
+        if self._thread.stopped:
+            return
+        try:
+            self._run(self._client.close())
+        finally:
+            self._thread.stop()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
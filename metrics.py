@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Request metrics for the calculator server.
+
+Counters and a fixed-bucket latency histogram are kept per process. Because
+the buckets are fixed, snapshots from several worker processes can be merged
+by simple addition (see ``merge_snapshots``), and percentiles estimated from
+the merged histogram.
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# Upper bounds of the latency buckets, in milliseconds; the last bucket is open.
+LATENCY_BUCKETS_MS: List[float] = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Metrics:
+    """Per-process request counters and latency histogram."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, int] = {}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+
+    def increment(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: int):
+        self.gauges[name] = value
+
+    def observe_latency(self, seconds: float):
+        ms = seconds * 1000.0
+        self.latency_sum_ms += ms
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                self.latency_buckets[index] += 1
+                return
+        self.latency_buckets[-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": time.time() - self.started,
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "latency_buckets": list(self.latency_buckets),
+            "latency_sum_ms": self.latency_sum_ms,
+        }
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Add counters, gauges and histograms from several snapshots together."""
+    merged: Dict[str, Any] = {
+        "processes": 0, "counters": {}, "gauges": {},
+        "latency_buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1), "latency_sum_ms": 0.0,
+    }
+    for snapshot in snapshots:
+        merged["processes"] += 1
+        for section in ("counters", "gauges"):
+            for name, value in snapshot.get(section, {}).items():
+                merged[section][name] = merged[section].get(name, 0) + value
+        for index, count in enumerate(snapshot.get("latency_buckets", [])):
+            merged["latency_buckets"][index] += count
+        merged["latency_sum_ms"] += snapshot.get("latency_sum_ms", 0.0)
+    return merged
+
+
+def percentile(buckets: List[int], fraction: float) -> Optional[float]:
+    """Estimate a latency percentile (ms) as the upper bound of its bucket."""
+    total = sum(buckets)
+    if total == 0:
+        return None
+    rank = fraction * total
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= rank:
+            return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else float("inf")
+    return float("inf")
+
+
+def summarize(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """Add request count, mean and p50/p90/p99 latency to a (merged) snapshot."""
+    buckets = snapshot["latency_buckets"]
+    requests = sum(buckets)
+    return {
+        **snapshot,
+        "latency_ms": {
+            "count": requests,
+            "mean": snapshot["latency_sum_ms"] / requests if requests else None,
+            "p50": percentile(buckets, 0.50),
+            "p90": percentile(buckets, 0.90),
+            "p99": percentile(buckets, 0.99),
+        },
+    }
+
+
+def write_snapshot(directory: str, snapshot: Dict[str, Any]):
+    """Atomically publish this process's snapshot for other workers to read."""
+    path = os.path.join(directory, f"worker-{snapshot['pid']}.json")
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(temporary, path)
+
+
+def read_snapshots(directory: str) -> List[Dict[str, Any]]:
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith("worker-") and name.endswith(".json"):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # the worker is mid-write or just exited
+    return snapshots
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Seeded random sampling and Monte Carlo estimation for the calculator server.
+
+Samples are drawn in fixed-size blocks, each from its own independent stream
+derived from ``(seed, block index)``: a spawned PCG64 stream with NumPy, or a
+seeded ``random.Random`` without it. Because blocks never depend on which
+worker runs them, and block results are combined in block order, a given seed
+gives the same answer for any number of workers.
+"""
+
+import math
+import random
+import secrets
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dataset_io import MappedWindow, create_output
+from expressions import Expression
+from lazy_imports import optional_import
+
+# NumPy is optional (random.Random streams are the fallback) and imported on first use.
+np = optional_import("numpy")
+
+# Samples per independent stream; the unit of work handed to a worker.
+BLOCK_SAMPLES = 1_000_000
+# Samples generated at once inside a block, bounding per-worker memory.
+CHUNK_SAMPLES = 65_536
+# Largest sample count returned inline; bigger requests must use output_path.
+MAX_INLINE_SAMPLES = 10_000
+
+DISTRIBUTIONS = ("uniform", "normal")
+
+
+def new_seed() -> int:
+    return secrets.randbits(64)
+
+
+def _stream(seed: int, block: int, variable: int = 0):
+    if np is not None:
+        sequence = np.random.SeedSequence(entropy=seed, spawn_key=(block, variable))
+        return np.random.Generator(np.random.PCG64(sequence))
+    return random.Random(f"{seed}:{block}:{variable}")
+
+
+def _check_distribution(spec: Dict[str, Any]) -> Dict[str, Any]:
+    kind = spec.get("distribution", "uniform")
+    if kind not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution '{kind}' (expected one of {', '.join(DISTRIBUTIONS)})")
+    if kind == "uniform":
+        low, high = float(spec.get("low", 0.0)), float(spec.get("high", 1.0))
+        if not low < high:
+            raise ValueError("Uniform distribution needs low < high")
+        return {"distribution": kind, "low": low, "high": high}
+    mean, std = float(spec.get("mean", 0.0)), float(spec.get("std", 1.0))
+    if std < 0:
+        raise ValueError("Normal distribution needs std >= 0")
+    return {"distribution": kind, "mean": mean, "std": std}
+
+
+def _draw(stream, spec: Dict[str, Any], count: int) -> Any:
+    """Draw ``count`` samples: a NumPy array, or a list without NumPy."""
+    if spec["distribution"] == "uniform":
+        if np is not None:
+            return stream.uniform(spec["low"], spec["high"], count)
+        low, span = spec["low"], spec["high"] - spec["low"]
+        draw = stream.random
+        return [low + span * draw() for _ in range(count)]
+    if np is not None:
+        return stream.normal(spec["mean"], spec["std"], count)
+    gauss, mean, std = stream.gauss, spec["mean"], spec["std"]
+    return [gauss(mean, std) for _ in range(count)]
+
+
+def _blocks(samples: int) -> List[Tuple[int, int]]:
+    """Split a sample count into (block index, block size) pairs."""
+    return [(block, min(BLOCK_SAMPLES, samples - start))
+            for block, start in enumerate(range(0, samples, BLOCK_SAMPLES))]
+
+
+def _iter_samples(spec: Dict[str, Any], count: int, seed: int) -> Iterator[Any]:
+    for block, size in _blocks(count):
+        stream = _stream(seed, block)
+        for start in range(0, size, CHUNK_SAMPLES):
+            yield _draw(stream, spec, min(CHUNK_SAMPLES, size - start))
+
+
+def random_samples(distribution: str, count: int, seed: Optional[int] = None,
+                   output_path: Optional[str] = None, **parameters: Any) -> Dict[str, Any]:
+    """Draw samples, either returned inline or written to a float64 dataset file."""
+    spec = _check_distribution({"distribution": distribution, **parameters})
+    count = int(count)
+    if count < 0:
+        raise ValueError("count must be non-negative")
+    seed = new_seed() if seed is None else int(seed)
+
+    if output_path is None:
+        if count > MAX_INLINE_SAMPLES:
+            raise ValueError(f"count above {MAX_INLINE_SAMPLES} requires 'output_path'")
+        values: List[float] = []
+        for chunk in _iter_samples(spec, count, seed):
+            values.extend(chunk.tolist() if np is not None else chunk)
+        return {"seed": seed, "count": count, "values": values}
+
+    output = create_output(output_path, count)
+    written = 0
+    with open(output_path, "r+b") as f:
+        for chunk in _iter_samples(spec, count, seed):
+            window = MappedWindow(f, output, written, len(chunk), writable=True)
+            try:
+                window.view[:] = chunk if np is not None else array("d", chunk)
+            finally:
+                window.close()
+            written += len(chunk)
+    return {"seed": seed, "count": count, "output_path": output_path}
+
+
+def _combine(left: Tuple[int, float, float], right: Tuple[int, float, float]) -> Tuple[int, float, float]:
+    """Merge (count, mean, M2) moments (Chan et al. parallel variance)."""
+    n_a, mean_a, m2_a = left
+    n_b, mean_b, m2_b = right
+    if n_a == 0:
+        return right
+    if n_b == 0:
+        return left
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n
+
+
+def _moments(values: Any) -> Tuple[int, float, float]:
+    if np is not None:
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return 0, 0.0, 0.0
+        mean = float(values.mean())
+        return int(values.size), mean, float(((values - mean) ** 2).sum())
+    values = [value for value in values if math.isfinite(value)]
+    if not values:
+        return 0, 0.0, 0.0
+    mean = math.fsum(values) / len(values)
+    return len(values), mean, math.fsum((value - mean) ** 2 for value in values)
+
+
+def monte_carlo_plan(expression: str, variables: Dict[str, Dict[str, Any]], samples: int,
+                     seed: Optional[int] = None) -> Dict[str, Any]:
+    """Validate a Monte Carlo request and split it into independent block tasks."""
+    compiled = Expression(expression)
+    specs = {name: _check_distribution(spec or {}) for name, spec in (variables or {}).items()}
+    missing = [name for name in compiled.variables if name not in specs]
+    if missing:
+        raise ValueError(f"No distribution given for: {', '.join(missing)}")
+    samples = int(samples)
+    if samples <= 0:
+        raise ValueError("samples must be positive")
+    seed = new_seed() if seed is None else int(seed)
+    names = sorted(specs)
+    tasks = [
+        {"expression": expression, "variables": specs, "names": names, "seed": seed, "block": block, "size": size}
+        for block, size in _blocks(samples)
+    ]
+    return {"seed": seed, "samples": samples, "tasks": tasks}
+
+
+def monte_carlo_block(task: Dict[str, Any]) -> Tuple[int, float, float]:
+    """Evaluate one block; returns the (count, mean, M2) of the finite results."""
+    compiled = Expression(task["expression"])
+    # One stream per variable, so variables are independent within the block.
+    streams = {name: _stream(task["seed"], task["block"], index) for index, name in enumerate(task["names"])}
+    moments = (0, 0.0, 0.0)
+    for start in range(0, task["size"], CHUNK_SAMPLES):
+        count = min(CHUNK_SAMPLES, task["size"] - start)
+        columns = {name: _draw(streams[name], task["variables"][name], count) for name in task["names"]}
+        moments = _combine(moments, _moments(compiled.evaluate_columns(columns, count)))
+    return moments
+
+
+def monte_carlo_summary(plan: Dict[str, Any], results: List[Tuple[int, float, float]],
+                        confidence: float = 0.95) -> Dict[str, Any]:
+    """Combine block results (in block order) into the estimate and its confidence interval."""
+    from statistics import NormalDist  # imported here: it is slow to import and only needed now
+
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be between 0 and 1")
+    n, mean, m2 = 0, 0.0, 0.0
+    for moments in results:
+        n, mean, m2 = _combine((n, mean, m2), moments)
+    if n == 0:
+        raise ValueError("Expression produced no finite values")
+    std = math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+    stderr = std / math.sqrt(n)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    return {
+        "mean": mean,
+        "std": std,
+        "stderr": stderr,
+        "confidence": confidence,
+        "ci_low": mean - z * stderr,
+        "ci_high": mean + z * stderr,
+        "samples": plan["samples"],
+        "valid_samples": n,
+        "seed": plan["seed"],
+    }
+
+
+def monte_carlo(expression: str, variables: Dict[str, Dict[str, Any]], samples: int,
+                seed: Optional[int] = None, confidence: float = 0.95) -> Dict[str, Any]:
+    """Serial Monte Carlo estimate; same result as the parallel server path."""
+    plan = monte_carlo_plan(expression, variables, samples, seed)
+    return monte_carlo_summary(plan, [monte_carlo_block(task) for task in plan["tasks"]], confidence)
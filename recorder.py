@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Traffic recorder for the calculator server.
+
+``calculator_server.py --record PATH`` appends one JSON line per handled
+request to PATH::
+
+    {"t": 1760000000.123456, "session": 3, "request": {...}, "response": {...}, "ms": 0.21}
+
+``t`` is the wall-clock arrival time, ``session`` numbers the client sessions
+in the order they were first seen, and ``ms`` is the server-side latency.
+``replay.py`` drives a server with a recording and checks the responses
+against the recorded ones.
+
+With ``--record-sample RATE`` only that fraction of requests is kept, except
+``initialize``, which is always kept so every replayed session is set up
+the way the original one was.
+
+The request path only appends to a list. A background task hands the list
+to a thread that encodes and writes it every ``flush_interval`` seconds, or
+sooner once ``BATCH_RECORDS`` have piled up. Each batch is a single ``write``
+to a file opened for appending, so the workers of a multi-worker server can
+share one recording. If the writer falls more than ``MAX_BUFFERED`` records
+behind, new records are dropped and counted rather than slowing requests down.
+"""
+
+import asyncio
+import itertools
+import os
+import random
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+from framing import JSON
+
+# Records that wake the writer before its flush interval is up.
+BATCH_RECORDS = 1000
+# Records held in memory at most; beyond this the recorder drops new ones.
+MAX_BUFFERED = 100_000
+
+_Record = Tuple[float, int, Dict[str, Any], Optional[Dict[str, Any]], float]
+
+
+class Recorder:
+    def __init__(self, path: str, sample_rate: float = 1.0, flush_interval: float = 0.5):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.buffer: List[_Record] = []
+        self.recorded = 0
+        self.dropped = 0
+        # Maps perf_counter() readings to wall-clock time.
+        self._epoch = time.time() - time.perf_counter()
+        self._session_numbers: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+        self._next_session = itertools.count(1)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._fd: Optional[int] = None
+        self._stopping = False
+
+    def start(self):
+        """Open the recording and start the background writer; call from the server's event loop."""
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._write_loop())
+
+    def sampled(self, request: Dict[str, Any]) -> bool:
+        """Whether to record ``request``; decide before handling it, so sampled-out requests cost nothing more."""
+        return self.sample_rate >= 1 or request.get("method") == "initialize" or random.random() < self.sample_rate
+
+    def record(self, session: Any, request: Dict[str, Any], response: Optional[Dict[str, Any]],
+               started: float, elapsed: float):
+        """Queue one request; ``started`` is its ``time.perf_counter()`` arrival time, ``elapsed`` in seconds."""
+        if len(self.buffer) >= MAX_BUFFERED:
+            self.dropped += 1
+            return
+        number = self._session_numbers.get(session)
+        if number is None:
+            number = self._session_numbers[session] = next(self._next_session)
+        self.buffer.append((self._epoch + started, number, request, response, elapsed * 1000))
+        if len(self.buffer) >= BATCH_RECORDS and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _write(self, batch: List[_Record]):
+        lines = [
+            JSON.encode({"t": round(t, 6), "session": number, "request": request, "response": response,
+                         "ms": round(ms, 3)})
+            for t, number, request, response, ms in batch
+        ]
+        os.write(self._fd, b"\n".join(lines) + b"\n")
+
+    async def flush(self):
+        if self.buffer and self._fd is not None:
+            batch, self.buffer = self.buffer, []
+            await asyncio.to_thread(self._write, batch)
+            self.recorded += len(batch)
+
+    async def _write_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        """Stop the writer and write out whatever is still buffered."""
+        if self._task is not None:
+            # Not cancelled: a batch half handed to the writer thread would be lost.
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Replay recorded calculator traffic against a server.
+
+Record with ``calculator_server.py --record traffic.jsonl`` (see recorder.py),
+then::
+
+    python replay.py traffic.jsonl                    # recorded pacing, against a fresh local server
+    python replay.py traffic.jsonl --speed 10         # ten times faster
+    python replay.py traffic.jsonl --speed max --tcp 127.0.0.1:8765
+
+Each recorded session gets its own connection and replays its requests in
+order. With a speed, each request is sent at its recorded offset divided by the
+speed. At ``max`` speed, each session keeps up to ``--window`` requests in
+flight. ``initialize`` is sent with the recorded client info, encodings and
+compact mode, and later requests wait for its response.
+
+Every response is checked against the recorded one:
+
+- results are compared by their ``structuredContent`` when present;
+- floats are compared with a small relative tolerance;
+- timing fields such as ``seconds`` are ignored;
+- unseeded random tools are replayed with the seed the server reported;
+- overload rejections (``-32001``) depend on load, so they are counted
+  separately rather than as mismatches.
+
+The report gives client-side latency percentiles per method next to the
+server-side latencies that were recorded.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from admission import OVERLOADED
+from framing import unpack_arrays
+from mcp_client import AsyncClient, wait_for_ready_file
+
+# Methods whose responses describe server state rather than the request.
+UNVERIFIED_METHODS = {"server/metrics", "shm/segments", "ping"}
+# Result fields that legitimately differ between runs.
+VOLATILE_KEYS = {"seconds", "rows_per_second"}
+# Tools that pick and report a seed when the request has none.
+SEEDED_TOOLS = {"random_uniform", "random_normal", "monte_carlo"}
+# Relative tolerance when comparing floats.
+FLOAT_TOLERANCE = 1e-9
+# Mismatches described in full in the report.
+MISMATCH_EXAMPLES = 5
+
+
+def load_recording(path: str) -> List[Dict[str, Any]]:
+    """The records in a recording, oldest first; lines that are not records are skipped."""
+    records = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and isinstance(record.get("request"), dict):
+                records.append(record)
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def _same(recorded: Any, replayed: Any) -> bool:
+    if hasattr(replayed, "tolist"):
+        replayed = replayed.tolist()
+    if hasattr(recorded, "tolist"):
+        recorded = recorded.tolist()
+    if isinstance(recorded, float) or isinstance(replayed, float):
+        if not isinstance(recorded, (int, float)) or not isinstance(replayed, (int, float)):
+            return False
+        return math.isclose(recorded, replayed, rel_tol=FLOAT_TOLERANCE) or (math.isnan(recorded) and math.isnan(replayed))
+    if isinstance(recorded, dict) and isinstance(replayed, dict):
+        keys = (recorded.keys() | replayed.keys()) - VOLATILE_KEYS
+        return all(_same(recorded.get(key), replayed.get(key)) for key in keys)
+    if isinstance(recorded, list) and isinstance(replayed, list):
+        return len(recorded) == len(replayed) and all(map(_same, recorded, replayed))
+    return recorded == replayed
+
+
+def _comparable(response: Dict[str, Any]) -> Any:
+    result = response.get("result")
+    if isinstance(result, dict) and "structuredContent" in result:
+        return {"structuredContent": unpack_arrays(result["structuredContent"]), "isError": result.get("isError")}
+    return result
+
+
+def compare(request: Dict[str, Any], recorded: Optional[Dict[str, Any]], replayed: Dict[str, Any]) -> Optional[str]:
+    """Why ``replayed`` does not match ``recorded``, or None if it does."""
+    if recorded is None or request.get("method") in UNVERIFIED_METHODS:
+        return None
+    if "error" in recorded or "error" in replayed:
+        codes = [(response.get("error") or {}).get("code") for response in (recorded, replayed)]
+        if codes[0] != codes[1] and OVERLOADED not in codes:
+            return f"error code {codes[0]} recorded, {codes[1]} replayed"
+        return None
+    if not _same(_comparable(recorded), _comparable(replayed)):
+        return f"result {json.dumps(_comparable(recorded), default=list)[:200]} recorded, " \
+               f"{json.dumps(_comparable(replayed), default=list)[:200]} replayed"
+    return None
+
+
+def _with_recorded_seed(request: Dict[str, Any], recorded: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """``request`` with the seed the server chose when it was recorded, if it asked for none."""
+    params = request.get("params") or {}
+    arguments = params.get("arguments") or {}
+    if params.get("name") not in SEEDED_TOOLS or "seed" in arguments:
+        return params
+    seed = (((recorded or {}).get("result") or {}).get("structuredContent") or {}).get("seed")
+    if seed is None:
+        return params
+    return {**params, "arguments": {**arguments, "seed": seed}}
+
+
+def _label(request: Dict[str, Any]) -> str:
+    """The method, plus the tool name for tools/call, for per-method latency figures."""
+    method = str(request.get("method"))
+    if method == "tools/call":
+        return f"{method} {(request.get('params') or {}).get('name')}"
+    return method
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def at(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {"count": len(ordered), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": ordered[-1]}
+
+
+class Replay:
+    def __init__(self, records: List[Dict[str, Any]], connect: Callable[[], Awaitable[AsyncClient]],
+                 speed: Optional[float] = 1.0, window: int = 64, timeout: float = 60.0):
+        self.records = records
+        self.connect = connect
+        self.speed = speed
+        self.window = window
+        self.timeout = timeout
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.recorded_latencies: Dict[str, List[float]] = defaultdict(list)
+        self.verified = 0
+        self.shed = 0
+        self.failed = 0
+        self.mismatches: List[str] = []
+        self.mismatch_count = 0
+        self._started = 0.0
+
+    async def _wait_until(self, record: Dict[str, Any]):
+        if self.speed:
+            delay = (record["t"] - self.records[0]["t"]) / self.speed - (time.perf_counter() - self._started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def _check(self, record: Dict[str, Any], response: Dict[str, Any], seconds: float):
+        request = record["request"]
+        method = _label(request)
+        self.latencies[method].append(seconds * 1000)
+        if record.get("ms") is not None:
+            self.recorded_latencies[method].append(record["ms"])
+        if (response.get("error") or {}).get("code") == OVERLOADED:
+            self.shed += 1
+            return
+        problem = compare(request, record.get("response"), response)
+        if problem is None:
+            self.verified += 1
+            return
+        self.mismatch_count += 1
+        if len(self.mismatches) < MISMATCH_EXAMPLES:
+            self.mismatches.append(f"{method} (session {record.get('session')}): {problem}")
+
+    async def _send(self, client: AsyncClient, record: Dict[str, Any], slots: asyncio.Semaphore):
+        try:
+            request = record["request"]
+            params = _with_recorded_seed(request, record.get("response"))
+            started = time.perf_counter()
+            try:
+                response = await client.request(request["method"], params, self.timeout)
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                self.failed += 1
+                self.mismatch_count += 1
+                if len(self.mismatches) < MISMATCH_EXAMPLES:
+                    self.mismatches.append(f"{_label(request)}: no response ({type(e).__name__})")
+                return
+            self._check(record, response, time.perf_counter() - started)
+        finally:
+            slots.release()
+
+    async def _initialize(self, client: AsyncClient, record: Dict[str, Any]):
+        params = record["request"].get("params") or {}
+        experimental = (params.get("capabilities") or {}).get("experimental") or {}
+        started = time.perf_counter()
+        response = await client.initialize(params.get("clientInfo"), experimental.get("encodings"),
+                                           self.timeout, experimental.get("compact") is True)
+        self._check(record, response, time.perf_counter() - started)
+
+    async def _session(self, records: List[Dict[str, Any]]):
+        await self._wait_until(records[0])
+        client = await self.connect()
+        slots = asyncio.Semaphore(self.window)
+        pending = set()
+        try:
+            for record in records:
+                await self._wait_until(record)
+                if record["request"].get("method") == "initialize":
+                    await asyncio.gather(*pending)
+                    await self._initialize(client, record)
+                    continue
+                await slots.acquire()
+                task = asyncio.create_task(self._send(client, record, slots))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            await asyncio.gather(*pending)
+        finally:
+            await client.close()
+
+    async def run(self) -> Dict[str, Any]:
+        """Replay every session concurrently and return the report."""
+        sessions: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+        for record in self.records:
+            if "id" in record["request"]:
+                sessions[record.get("session")].append(record)
+        self._started = time.perf_counter()
+        await asyncio.gather(*(self._session(records) for records in sessions.values()))
+        elapsed = time.perf_counter() - self._started
+        requests = sum(len(samples) for samples in self.latencies.values()) + self.failed
+        return {
+            "requests": requests,
+            "sessions": len(sessions),
+            "seconds": elapsed,
+            "recorded_seconds": self.records[-1]["t"] - self.records[0]["t"] if self.records else 0.0,
+            "requests_per_second": requests / elapsed if elapsed > 0 else 0.0,
+            "verified": self.verified,
+            "shed": self.shed,
+            "mismatches": self.mismatch_count,
+            "mismatch_examples": self.mismatches,
+            "latency_ms": percentiles([ms for samples in self.latencies.values() for ms in samples]),
+            "methods": {
+                method: {"replayed_ms": percentiles(samples),
+                         "recorded_server_ms": percentiles(self.recorded_latencies.get(method, []))}
+                for method, samples in sorted(self.latencies.items())
+            },
+        }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    def row(name: str, stats: Dict[str, float]) -> str:
+        if not stats:
+            return f"  {name:<28} -"
+        return (f"  {name:<28} {stats['count']:>8} {stats['p50']:>9.2f} {stats['p90']:>9.2f} "
+                f"{stats['p99']:>9.2f} {stats['max']:>9.2f}")
+
+    lines = [
+        f"Replayed {report['requests']} requests from {report['sessions']} sessions in {report['seconds']:.2f}s "
+        f"(recorded over {report['recorded_seconds']:.2f}s, {report['requests_per_second']:.0f} req/s)",
+        f"Verified {report['verified']}, mismatched {report['mismatches']}, shed by the server {report['shed']}",
+        "",
+        f"  {'latency (ms)':<28} {'count':>8} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}",
+        row("all (client round trip)", report["latency_ms"]),
+    ]
+    for method, stats in report["methods"].items():
+        lines.append(row(method, stats["replayed_ms"]))
+        lines.append(row("  recorded (server side)", stats["recorded_server_ms"]))
+    if report["mismatch_examples"]:
+        lines += ["", "First mismatches:"] + [f"  {example}" for example in report["mismatch_examples"]]
+    return "\n".join(lines)
+
+
+def parse_speed(value: str) -> Optional[float]:
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x"))
+    if not speed > 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay recorded calculator traffic and verify the responses")
+    parser.add_argument("recording", help="JSONL file written by calculator_server.py --record")
+    parser.add_argument("--speed", type=parse_speed, default=1.0,
+                        help="Replay speed: 1 (recorded pacing), N (N times faster) or max (default 1)")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--tcp", metavar="HOST:PORT", help="Replay against a running TCP server")
+    target.add_argument("--unix", metavar="PATH", help="Replay against a running Unix-socket server")
+    parser.add_argument("--server-args", default="",
+                        help="Extra arguments for the local server started when no target is given")
+    parser.add_argument("--window", type=int, default=64, help="Requests in flight per session at max speed")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for each response")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON to PATH")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    records = load_recording(args.recording)
+    if not records:
+        print(f"No records in {args.recording}", file=sys.stderr)
+        return 1
+    server = None
+    with tempfile.TemporaryDirectory() as directory:
+        if args.tcp or args.unix:
+            host, _, port = (args.tcp or "").rpartition(":")
+        else:
+            ready_file = os.path.join(directory, "ready.json")
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "calculator_server.py"),
+                 "--tcp", "127.0.0.1:0", "--ready-file", ready_file] + shlex.split(args.server_args),
+                stdin=subprocess.DEVNULL
+            )
+            host, _, port = wait_for_ready_file(ready_file, timeout=30, process=server)["address"].rpartition(":")
+
+        def connect() -> Awaitable[AsyncClient]:
+            if args.unix:
+                return AsyncClient.connect(path=args.unix)
+            return AsyncClient.connect(host, int(port))
+
+        try:
+            report = asyncio.run(Replay(records, connect, args.speed, args.window, args.timeout).run())
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Serving layer for the calculator servers built on the ``mcp`` SDK
+(``simple_server.py`` and ``simple_mcp_server.py``).
+
+The SDK's ``list_tools``/``call_tool`` decorators do more work per request
+than these servers need. They build fresh ``Tool`` and ``ListToolsResult``
+models on every ``tools/list`` and re-check each tool's input schema on every
+call. They also run the tool function inline on the event loop. ``ToolServer``
+installs its own handlers on an ``mcp.server.Server`` instead, bringing these
+servers in line with the hand-rolled ``calculator_server.py``:
+
+* tool models and the ``tools/list`` result are built and validated once, and
+  each input schema is compiled to a validator once
+* tools added with ``heavy=True`` run in a process pool, so a long computation
+  does not hold up other requests
+* at most ``max_concurrency`` tool calls run at once, and later ones wait
+  their turn. The SDK handles each request in its own task and would
+  otherwise start them all.
+* the same request counters and latency histogram as the hand-rolled server
+  (``metrics.py``), from ``metrics_snapshot()`` and, with ``metrics_tool=True``,
+  a ``server_metrics`` tool. It is off by default so that ``tools/list`` offers
+  a model only the tools it was given.
+
+Tool functions take the arguments dict and return ``(text, structured)``.
+They raise ``ToolError`` for an expected failure. Heavy tools must be
+module-level functions, so the pool can pickle them.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent import futures
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mcp import types
+from mcp.server import Server
+from mcp.server.stdio import stdio_server
+
+from lazy_imports import optional_import
+from metrics import Metrics, merge_snapshots, summarize
+
+# The SDK depends on jsonschema, but validate only if it is there.
+jsonschema = optional_import("jsonschema")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 64
+
+ToolFunction = Callable[[Dict[str, Any]], Tuple[str, Optional[Dict[str, Any]]]]
+
+
+class ToolError(Exception):
+    """A tool call that failed in an expected way; its message is returned to the client as the result text."""
+
+
+def _error_result(text: str) -> types.CallToolResult:
+    return types.CallToolResult(content=[types.TextContent(type="text", text=text)], isError=True)
+
+
+class ToolServer:
+    """An ``mcp.server.Server`` with a fixed, pre-built tool set."""
+
+    def __init__(self, name: str, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 pool_workers: Optional[int] = None, metrics_tool: bool = False):
+        self.server = Server(name)
+        self.metrics = Metrics()
+        self.pool_workers = pool_workers or os.cpu_count() or 1
+        self.tools: List[types.Tool] = []
+        self._functions: Dict[str, ToolFunction] = {}
+        self._heavy: Dict[str, bool] = {}
+        self._validators: Dict[str, Any] = {}
+        self._list_result: Optional[types.ServerResult] = None
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._executor: Optional[futures.ProcessPoolExecutor] = None
+        # The handlers the SDK's decorators would install, minus their per-request model building.
+        self.server.request_handlers[types.ListToolsRequest] = self._list_tools
+        self.server.request_handlers[types.CallToolRequest] = self._call_tool
+        if metrics_tool:
+            self.add_tool({
+                "name": "server_metrics",
+                "description": "Request counts and latency percentiles of this server",
+                "inputSchema": {"type": "object", "properties": {}},
+            }, self._metrics_tool)
+
+    def add_tool(self, definition: Dict[str, Any], function: ToolFunction, heavy: bool = False):
+        """Serve ``function`` as the tool described by ``definition`` (name, description, inputSchema, ...)."""
+        tool = types.Tool.model_validate(definition)
+        if jsonschema is not None:
+            validator_class = jsonschema.validators.validator_for(tool.inputSchema)
+            validator_class.check_schema(tool.inputSchema)
+            self._validators[tool.name] = validator_class(tool.inputSchema)
+        self.tools = [existing for existing in self.tools if existing.name != tool.name] + [tool]
+        self._functions[tool.name] = function
+        self._heavy[tool.name] = heavy
+        self._list_result = types.ServerResult(types.ListToolsResult(tools=self.tools))
+
+    def _get_executor(self) -> futures.ProcessPoolExecutor:
+        """Create the worker pool for heavy tools on first use."""
+        if self._executor is None:
+            self._executor = futures.ProcessPoolExecutor(max_workers=self.pool_workers)
+        return self._executor
+
+    def shutdown(self):
+        """Release the worker pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def _observe(self, method: str, started: float, error: bool):
+        self.metrics.increment("requests")
+        self.metrics.increment(f"method:{method}")
+        if error:
+            self.metrics.increment("errors")
+        self.metrics.observe_latency(time.perf_counter() - started)
+
+    async def _list_tools(self, request: Optional[types.ListToolsRequest]) -> types.ServerResult:
+        self._observe("tools/list", time.perf_counter(), False)
+        return self._list_result
+
+    async def _call_tool(self, request: types.CallToolRequest) -> types.ServerResult:
+        started = time.perf_counter()
+        self._in_flight += 1
+        try:
+            async with self._limit:
+                result = await self._run(request.params.name, request.params.arguments or {})
+        finally:
+            self._in_flight -= 1
+        self._observe("tools/call", started, bool(result.isError))
+        return types.ServerResult(result)
+
+    async def _run(self, name: str, arguments: Dict[str, Any]) -> types.CallToolResult:
+        function = self._functions.get(name)
+        if function is None:
+            return _error_result(f"Error: Unknown tool '{name}'")
+        validator = self._validators.get(name)
+        if validator is not None:
+            problem = next(iter(validator.iter_errors(arguments)), None)
+            if problem is not None:
+                return _error_result(f"Error: Invalid arguments: {problem.message}")
+        try:
+            if self._heavy[name]:
+                loop = asyncio.get_running_loop()
+                text, structured = await loop.run_in_executor(self._get_executor(), function, arguments)
+            else:
+                text, structured = function(arguments)
+        except ToolError as e:
+            return _error_result(f"Error: {str(e)}")
+        except Exception as e:
+            return _error_result(f"Error executing tool: {str(e)}")
+        return types.CallToolResult(content=[types.TextContent(type="text", text=text)],
+                                    structuredContent=structured)
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        self.metrics.set_gauge("in_flight", self._in_flight)
+        return summarize(merge_snapshots([self.metrics.snapshot()]))
+
+    def _metrics_tool(self, arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        snapshot = self.metrics_snapshot()
+        return json.dumps(snapshot), snapshot
+
+    async def run_stdio(self):
+        """Serve over stdio until the client closes the connection."""
+        if any(self._heavy.values()):
+            # Fork the workers now: once the SDK's stdin reader thread is blocked holding the
+            # stdin lock, a forked worker deadlocks closing its copy of sys.stdin on startup.
+            self._get_executor().submit(int).result()
+        try:
+            async with stdio_server() as (read_stream, write_stream):
+                # Launchers can wait for this line on stderr instead of sleeping.
+                logger.info("%s ready on stdio", self.server.name)
+                await self.server.run(read_stream, write_stream, self.server.create_initialization_options())
+        finally:
+            self.shutdown()
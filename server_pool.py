@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+A shared pool of warm calculator server subprocesses.
+
+One ``ServerPool`` serves any number of callers (for example every session of
+the Streamlit dashboard) from a bounded set of stdio servers:
+
+- ``min_size`` members are started up front and kept running.
+- Each request goes to the member with the fewest requests outstanding. When
+  every member is busy, the pool grows, up to ``max_size``.
+- Every ``health_interval`` seconds, idle members are pinged. A member whose
+  process exited, whose connection dropped, or that misses a ping is replaced.
+- Members above ``min_size`` that sat idle for ``idle_timeout`` seconds are
+  shut down.
+
+Members are interchangeable, so a request must not rely on state left by an
+earlier one. In particular, pass an ``output`` segment to ``array_elementwise``
+rather than releasing a server-created one later, since ``shm/release`` may
+reach a different member.
+
+Members read their requests from a pipe, so they exit by themselves if the
+process holding the pool dies.
+
+With ``zygote=PATH``, members are forked from a running
+``calculator_server.py --zygote PATH`` rather than spawned, so growing the pool
+or replacing a member takes milliseconds. ``command`` is then unused.
+"""
+
+import asyncio
+import sys
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from mcp_client import AsyncClient, Call, LoopThread
+
+
+class _Member:
+    def __init__(self, client: AsyncClient):
+        self.client = client
+        self.outstanding = 0
+        self.started = time.monotonic()
+        self.last_used = self.started
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.client.process.pid if self.client.process else None
+
+    @property
+    def alive(self) -> bool:
+        return self.client.connected and self.client.process.returncode is None
+
+
+class ServerPool:
+    """Least-outstanding-requests load balancing over warm server subprocesses."""
+
+    def __init__(self, command: Sequence[str], min_size: int = 2, max_size: Optional[int] = None,
+                 idle_timeout: float = 300.0, health_interval: float = 10.0, ping_timeout: float = 5.0,
+                 startup_timeout: float = 15.0, client_info: Optional[Dict[str, Any]] = None,
+                 cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None, zygote: Optional[str] = None):
+        if min_size < 1:
+            raise ValueError("min_size must be at least 1")
+        self.command = list(command)
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size or min_size)
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.startup_timeout = startup_timeout
+        self.client_info = client_info or {"name": "server-pool", "version": "1.0"}
+        self.cwd = cwd
+        self.env = env
+        self.zygote = zygote
+        self.server_info: Optional[Dict[str, Any]] = None
+        self.restarts = 0
+        self._members: List[_Member] = []
+        self._spawning = 0
+        self._growing: Set[asyncio.Task] = set()
+        self._closed = False
+        self._thread = LoopThread("server-pool")
+        try:
+            self._thread.run(self._start())
+        except BaseException:
+            self._thread.run(self._close_members())
+            self._thread.stop()
+            raise
+
+    async def _start(self):
+        await asyncio.gather(*(self._grow() for _ in range(self.min_size)))
+        self._maintenance = asyncio.create_task(self._maintain())
+
+    def _grow(self) -> "asyncio.Task":
+        """Start one more member; the returned task resolves once it is initialized and in service."""
+        # Counted now, not when the task first runs, so a burst of requests cannot overshoot max_size.
+        self._spawning += 1
+        task = asyncio.create_task(self._spawn())
+        self._growing.add(task)
+        task.add_done_callback(self._growing.discard)
+        return task
+
+    async def _spawn(self) -> _Member:
+        try:
+            if self.zygote is not None:
+                client = await AsyncClient.fork(self.zygote)
+            else:
+                client = await AsyncClient.spawn(self.command, cwd=self.cwd, env=self.env)
+            try:
+                response = await client.initialize(self.client_info, timeout=self.startup_timeout)
+                if "error" in response:
+                    raise RuntimeError(f"Server refused initialize: {response['error'].get('message')}")
+            except BaseException:
+                await client.close()
+                raise
+        finally:
+            self._spawning -= 1
+        self.server_info = client.server_info
+        member = _Member(client)
+        if self._closed:
+            await client.close()
+            raise ConnectionError("Server pool is closed")
+        self._members.append(member)
+        return member
+
+    async def _acquire(self) -> _Member:
+        if self._closed:
+            raise ConnectionError("Server pool is closed")
+        members = [member for member in self._members if member.alive]
+        while not members:
+            # Wait for a member to come up rather than starting one per waiting request.
+            if not self._growing:
+                self._grow()
+            done, _ = await asyncio.wait(list(self._growing), return_when=asyncio.FIRST_COMPLETED)
+            members = [member for member in self._members if member.alive]
+            failed = [task.exception() for task in done if not task.cancelled() and task.exception()]
+            if not members and failed:
+                raise failed[0]
+            if self._closed:
+                raise ConnectionError("Server pool is closed")
+        member = min(members, key=lambda candidate: candidate.outstanding)
+        if member.outstanding and len(self._members) + self._spawning < self.max_size:
+            self._grow().add_done_callback(_log_failure)
+        return member
+
+    async def _remove(self, member: _Member, reason: str):
+        if member not in self._members:
+            return
+        self._members.remove(member)
+        if reason:
+            _log(f"server {member.pid} {reason}; replacing it")
+            self.restarts += 1
+        await member.client.close()
+
+    async def _request(self, method: str, params: Optional[Dict[str, Any]], timeout: Optional[float]) -> Dict[str, Any]:
+        member = await self._acquire()
+        member.outstanding += 1
+        try:
+            return await member.client.request(method, params, timeout)
+        except ConnectionError:
+            if not self._closed:
+                await self._remove(member, "lost its connection")
+            raise
+        finally:
+            member.outstanding -= 1
+            member.last_used = time.monotonic()
+
+    async def _check(self, member: _Member):
+        if not member.alive:
+            await self._remove(member, "exited")
+            return
+        if member.outstanding:
+            return  # stdio servers answer in order, so a ping would wait behind real work
+        try:
+            await member.client.ping(self.ping_timeout)
+        except Exception as e:
+            await self._remove(member, f"failed a health check ({e or type(e).__name__})")
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self._check(member) for member in list(self._members)))
+            now = time.monotonic()
+            for member in sorted(self._members, key=lambda candidate: candidate.last_used):
+                if len(self._members) <= self.min_size:
+                    break
+                if not member.outstanding and now - member.last_used > self.idle_timeout:
+                    await self._remove(member, "")
+            missing = self.min_size - len(self._members) - self._spawning
+            for result in await asyncio.gather(*(self._grow() for _ in range(max(0, missing))),
+                                               return_exceptions=True):
+                if isinstance(result, BaseException):
+                    _log(f"could not start a server: {result}")
+
+    async def _close_members(self):
+        self._closed = True
+        for task in list(self._growing):
+            task.cancel()
+        await asyncio.gather(*self._growing, return_exceptions=True)
+        members, self._members = self._members, []
+        await asyncio.gather(*(member.client.close() for member in members))
+
+    async def _close(self):
+        self._maintenance.cancel()
+        await self._close_members()
+
+    def submit(self, method: str, params: Optional[Dict[str, Any]] = None,
+               timeout: Optional[float] = None) -> Future:
+        """Send a request without waiting; the returned future resolves to its response."""
+        return self._thread.submit(self._request(method, params, timeout))
+
+    def request(self, method: str, params: Optional[Dict[str, Any]] = None,
+                timeout: Optional[float] = None) -> Dict[str, Any]:
+        return self._thread.run(self._request(method, params, timeout))
+
+    def batch(self, calls: Sequence[Call], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Spread ``(method, params)`` requests over the pool; responses come back in call order."""
+        async def run_all():
+            return list(await asyncio.gather(*(self._request(method, params, timeout) for method, params in calls)))
+        return self._thread.run(run_all())
+
+    def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None,
+                  timeout: Optional[float] = None) -> Dict[str, Any]:
+        return self.request("tools/call", {"name": name, "arguments": arguments or {}}, timeout)
+
+    def list_tools(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        response = self.request("tools/list", timeout=timeout)
+        if "error" in response:
+            raise RuntimeError(response["error"].get("message"))
+        return response["result"]["tools"]
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, restart count and each member's pid, load and idle time."""
+        async def snapshot():
+            now = time.monotonic()
+            return {
+                "members": [{"pid": member.pid, "outstanding": member.outstanding,
+                             "idle_seconds": round(now - member.last_used, 3),
+                             "uptime_seconds": round(now - member.started, 3)} for member in self._members],
+                "starting": self._spawning,
+                "restarts": self.restarts,
+            }
+        return self._thread.run(snapshot())
+
+    def close(self):
+        """Stop every member and the pool's event-loop thread."""
+        if self._thread.stopped:
+            return
+        try:
+            self._thread.run(self._close())
+        finally:
+            self._thread.stop()
+
+    def __enter__(self) -> "ServerPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _log(message: str):
+    print(f"server_pool: {message}", file=sys.stderr)
+
+
+def _log_failure(task: "asyncio.Task"):
+    if not task.cancelled() and task.exception() is not None:
+        _log(f"could not start a server: {task.exception()}")
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Supervisor for the servers listed in ``mcp_config.json``.
+
+``python start_server.py --supervise [name ...]`` runs every configured server
+(or the named ones) side by side and keeps them up:
+
+* all servers start in parallel, each in its own process group
+* a server that exits with an error is restarted, backing off exponentially
+  while it keeps crashing within ``MIN_HEALTHY_SECONDS`` of starting
+* address-space and CPU-time limits are applied with ``setrlimit`` before the
+  server's command runs
+* a server whose resident set grows past its ``maxRssMB`` is replaced with a
+  fresh process (a leak then costs a restart rather than the host)
+* every server's stderr is copied to the supervisor's stderr (and
+  ``--log-file``) with a ``[name pid]`` prefix; the last lines are kept for
+  the ``supervisor/logs`` method
+* a Unix control socket answers newline-delimited JSON-RPC, so
+  ``mcp_client.Client.connect(path=...)`` can query and steer it
+
+Per-server settings live in an optional ``"supervisor"`` block of the server's
+configuration, and the command-line limits apply to servers that do not set
+their own::
+
+    "supervisor": {"maxRssMB": 512, "memoryLimitMB": 2048,
+                   "cpuLimitSeconds": 3600, "restart": "on-failure"}
+
+``restart`` is ``on-failure`` (the default), ``always`` or ``never``. Servers
+that speak stdio are given a stdin pipe the supervisor holds open, so they stay
+warm but unreachable; give a server ``--tcp``, ``--unix`` or ``--http`` in its
+``args`` to serve clients through the supervisor.
+
+Control methods: ``supervisor/status``, ``supervisor/logs`` (``name``,
+``lines``), ``supervisor/start``, ``supervisor/stop`` and ``supervisor/restart``
+(``name``; restart without a name restarts everything) and
+``supervisor/shutdown``.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, TextIO
+
+from lazy_imports import optional_import
+from workers import MAX_RESTART_DELAY, MIN_HEALTHY_SECONDS
+
+# setrlimit is POSIX-only; elsewhere servers run without limits.
+resource = optional_import("resource")
+
+DEFAULT_CONTROL_SOCKET = ".mcp_supervisor.sock"
+# stderr lines kept per server for supervisor/logs.
+LOG_LINES = 500
+# Seconds between RSS checks.
+CHECK_INTERVAL = 2.0
+# How long a server may take to exit after SIGTERM before it is killed.
+STOP_TIMEOUT = 10.0
+INITIAL_RESTART_DELAY = 0.5
+RESTART_POLICIES = ("on-failure", "always", "never")
+
+
+def _log(message: str):
+    print(f"[supervisor {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of ``pid`` from /proc, or None where that is unavailable."""
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ManagedServer:
+    """One configured server and the task that keeps it running."""
+
+    def __init__(self, name: str, config: Dict[str, Any], defaults: Dict[str, Any],
+                 log_file: Optional[TextIO] = None):
+        settings = dict(defaults)
+        settings.update(config.get("supervisor", {}))
+        restart = settings.get("restart", "on-failure")
+        if restart not in RESTART_POLICIES:
+            raise ValueError(f"{name}: restart must be one of {', '.join(RESTART_POLICIES)}")
+        self.name = name
+        self.command = [config.get("command", "python")] + list(config.get("args", []))
+        self.cwd = os.path.abspath(config.get("cwd", "."))
+        self.restart = restart
+        self.max_rss_mb = settings.get("maxRssMB")
+        self.memory_limit_mb = settings.get("memoryLimitMB")
+        self.cpu_limit_seconds = settings.get("cpuLimitSeconds")
+        self.log: Deque[str] = deque(maxlen=LOG_LINES)
+        self.log_file = log_file
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.state = "stopped"
+        self.ready = False
+        self.started: Optional[float] = None
+        self.restarts = 0
+        self.recycles = 0
+        self.last_exit: Optional[int] = None
+        self.restart_delay = INITIAL_RESTART_DELAY
+        self.wanted = False
+        self._replace_reason: Optional[str] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _limit_resources(self):
+        """Runs in the child between fork and exec."""
+        if self.memory_limit_mb:
+            limit = int(self.memory_limit_mb * 1024 * 1024)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if self.cpu_limit_seconds:
+            # SIGXCPU at the soft limit, SIGKILL a little later if it is ignored.
+            soft = int(self.cpu_limit_seconds)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + 5))
+
+    async def _launch(self):
+        limits = (self.memory_limit_mb or self.cpu_limit_seconds) and resource is not None
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            cwd=self.cwd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=self._limit_resources if limits else None,
+            # Its own process group, so Ctrl+C reaches only the supervisor, which stops servers in order.
+            start_new_session=True,
+        )
+        self.started = time.monotonic()
+        self.ready = False
+        self.state = "running"
+
+    async def _pump_stderr(self, process: asyncio.subprocess.Process):
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                return
+            text = line.decode("utf-8", "replace").rstrip()
+            if " ready on " in text:
+                self.ready = True
+            entry = f"[{self.name} {process.pid}] {text}"
+            self.log.append(entry)
+            print(entry, file=sys.stderr, flush=True)
+            if self.log_file is not None:
+                self.log_file.write(f"{time.strftime('%Y-%m-%dT%H:%M:%S')} {entry}\n")
+                self.log_file.flush()
+
+    async def _backoff(self):
+        self.state = "backoff"
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), self.restart_delay)
+        except asyncio.TimeoutError:
+            pass
+        self.restart_delay = min(MAX_RESTART_DELAY, self.restart_delay * 2)
+
+    async def _run(self):
+        while self.wanted:
+            try:
+                await self._launch()
+            except OSError as e:
+                _log(f"{self.name}: could not start {self.command[0]!r}: {e}")
+                await self._backoff()
+                continue
+            process = self.process
+            _log(f"{self.name}: started pid {process.pid}")
+            pump = asyncio.create_task(self._pump_stderr(process))
+            code = await process.wait()
+            try:
+                # Whatever it wrote before exiting; a grandchild holding stderr open must not stall the restart.
+                await asyncio.wait_for(pump, 1.0)
+            except asyncio.TimeoutError:
+                pass
+            lifetime = time.monotonic() - self.started
+            self.last_exit = code
+            self.process = None
+            if not self.wanted:
+                break
+            reason, self._replace_reason = self._replace_reason, None
+            if reason is not None:
+                _log(f"{self.name}: pid {process.pid} {reason}; starting a replacement")
+                continue
+            if self.restart == "never" or (code == 0 and self.restart == "on-failure"):
+                _log(f"{self.name}: pid {process.pid} exited with {code} after {lifetime:.1f}s")
+                self.wanted = False
+                break
+            self.restarts += 1
+            _log(f"{self.name}: pid {process.pid} exited with {code} after {lifetime:.1f}s; restarting")
+            if lifetime < MIN_HEALTHY_SECONDS:
+                await self._backoff()
+            else:
+                self.restart_delay = INITIAL_RESTART_DELAY
+        self.state = "exited" if self.last_exit is not None else "stopped"
+
+    def start(self):
+        """Keep the server running from now on (no-op if it already is)."""
+        self.wanted = True
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self.restart_delay = INITIAL_RESTART_DELAY
+            self._task = asyncio.create_task(self._run())
+
+    async def _terminate(self, process: asyncio.subprocess.Process):
+        if process.stdin is not None:
+            process.stdin.close()
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            _log(f"{self.name}: pid {process.pid} ignored SIGTERM; killing it")
+            process.kill()
+
+    async def replace(self, reason: str):
+        """Stop the current process; the run task starts a fresh one straight away."""
+        process = self.process
+        if process is None or not self.wanted:
+            self.start()
+            return
+        self._replace_reason = reason
+        await self._terminate(process)
+
+    async def recycle_if_bloated(self):
+        process = self.process
+        if not self.max_rss_mb or process is None or self._replace_reason is not None:
+            return
+        rss = rss_bytes(process.pid)
+        if rss is not None and rss > self.max_rss_mb * 1024 * 1024:
+            self.recycles += 1
+            await self.replace(f"reached {rss / 1048576:.0f} MB RSS (limit {self.max_rss_mb} MB)")
+
+    async def stop(self):
+        self.wanted = False
+        self._wake.set()
+        if self.process is not None:
+            await self._terminate(self.process)
+        if self._task is not None:
+            await self._task
+        self.state = "stopped"
+
+    def status(self) -> Dict[str, Any]:
+        process = self.process
+        rss = rss_bytes(process.pid) if process is not None else None
+        return {
+            "name": self.name,
+            "state": self.state,
+            "ready": self.ready and process is not None,
+            "pid": process.pid if process is not None else None,
+            "uptime_seconds": round(time.monotonic() - self.started, 3) if process is not None else None,
+            "rss_mb": round(rss / 1048576, 1) if rss is not None else None,
+            "restarts": self.restarts,
+            "recycles": self.recycles,
+            "last_exit": self.last_exit,
+            "limits": {"maxRssMB": self.max_rss_mb, "memoryLimitMB": self.memory_limit_mb,
+                       "cpuLimitSeconds": self.cpu_limit_seconds, "restart": self.restart},
+            "command": self.command,
+        }
+
+
+class ServerSupervisor:
+    """Runs a set of ``ManagedServer``s and the control socket."""
+
+    def __init__(self, servers: Dict[str, Dict[str, Any]], control_socket: str = DEFAULT_CONTROL_SOCKET,
+                 defaults: Optional[Dict[str, Any]] = None, log_path: Optional[str] = None):
+        self.server_configs = servers
+        self.control_socket = os.path.abspath(control_socket)
+        self.defaults = {key: value for key, value in (defaults or {}).items() if value is not None}
+        self.log_path = log_path
+        self.servers: Dict[str, ManagedServer] = {}
+        self.started = time.monotonic()
+        self._stopping: Optional[asyncio.Event] = None
+
+    async def _handle_control(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError as e:
+                    response = {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": f"Parse error: {e}"}}
+                else:
+                    if not isinstance(message, dict) or "id" not in message:
+                        continue
+                    response = {"jsonrpc": "2.0", "id": message["id"]}
+                    response.update(await self._dispatch(message.get("method"), message.get("params") or {}))
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: Any, params: Dict[str, Any]) -> Dict[str, Any]:
+        name = params.get("name")
+        if name is not None and name not in self.servers:
+            return {"error": {"code": -32602, "message": f"Unknown server '{name}'"}}
+        server = self.servers.get(name)
+        if method == "supervisor/status":
+            return {"result": {"pid": os.getpid(), "uptime_seconds": round(time.monotonic() - self.started, 3),
+                               "servers": [server.status() for server in self.servers.values()]}}
+        if method == "supervisor/logs":
+            if server is None:
+                return {"error": {"code": -32602, "message": "'name' is required"}}
+            count = int(params.get("lines", 50))
+            return {"result": {"lines": list(server.log)[-count:] if count > 0 else []}}
+        if method in ("supervisor/start", "supervisor/stop", "supervisor/restart"):
+            targets = [server] if server is not None else list(self.servers.values())
+            if server is None and method != "supervisor/restart":
+                return {"error": {"code": -32602, "message": "'name' is required"}}
+            for target in targets:
+                if method == "supervisor/start":
+                    target.start()
+                elif method == "supervisor/stop":
+                    await target.stop()
+                else:
+                    await target.replace("restarted on request")
+            return {"result": {}}
+        if method == "supervisor/shutdown":
+            self._stopping.set()
+            return {"result": {}}
+        return {"error": {"code": -32601, "message": f"Method not found: {method}"}}
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            await asyncio.gather(*(server.recycle_if_bloated() for server in self.servers.values()))
+
+    async def run(self) -> int:
+        if resource is None and any(key in self.defaults for key in ("memoryLimitMB", "cpuLimitSeconds")):
+            _log("resource limits are not supported on this platform; ignoring them")
+        log_file = open(self.log_path, "a", encoding="utf-8") if self.log_path else None
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self._stopping.set)
+        if os.path.exists(self.control_socket):
+            os.unlink(self.control_socket)
+        control = await asyncio.start_unix_server(self._handle_control, path=self.control_socket)
+        monitor = asyncio.create_task(self._monitor())
+        try:
+            for name, config in self.server_configs.items():
+                self.servers[name] = ManagedServer(name, config, self.defaults, log_file)
+            for server in self.servers.values():
+                server.start()
+            _log(f"supervising {', '.join(self.servers)}; control socket {self.control_socket}")
+            await self._stopping.wait()
+        finally:
+            _log("stopping servers")
+            monitor.cancel()
+            control.close()
+            await asyncio.gather(*(server.stop() for server in self.servers.values()))
+            if os.path.exists(self.control_socket):
+                os.unlink(self.control_socket)
+            if log_file is not None:
+                log_file.close()
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(signum)
+        _log("stopped")
+        return 0
+
+
+def supervise(servers: Dict[str, Dict[str, Any]], **options: Any) -> int:
+    """Supervise ``servers`` (name -> mcp_config.json entry) until SIGTERM, Ctrl+C or supervisor/shutdown."""
+    return asyncio.run(ServerSupervisor(servers, **options).run())
+
+
+def format_status(status: Dict[str, Any]) -> List[str]:
+    """Human-readable lines for a ``supervisor/status`` result."""
+    lines = [f"supervisor pid {status['pid']}, up {status['uptime_seconds']:.0f}s"]
+    for server in status["servers"]:
+        state = "ready" if server["ready"] else server["state"]
+        rss = f"{server['rss_mb']} MB" if server["rss_mb"] is not None else "-"
+        lines.append(f"  {server['name']:<16} {state:<8} pid {server['pid'] or '-':<8} rss {rss:<10} "
+                     f"restarts {server['restarts']}  recycles {server['recycles']}  last exit {server['last_exit']}")
+    return lines
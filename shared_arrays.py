@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Zero-copy exchange of large numeric arrays through shared memory.
+
+A client on the same host places an array in a named
+``multiprocessing.shared_memory`` segment and sends a small descriptor in
+place of the values::
+
+    {"shm": "psm_1a2b3c", "dtype": "float64", "shape": [1000000]}
+
+The server maps the segment and works on it in place, writing results into a
+segment as well, so only the descriptor crosses the pipe.
+
+Ownership is explicit. A segment belongs to the process that created it, and
+only its owner unlinks it (``SharedArray.unlink``, or leaving a ``with`` block).
+For array tools, the client owns its inputs and may pass an ``output``
+segment that it also owns. If it does not, the server creates the output and
+hands it off. The client then copies the values and calls ``shm/release``.
+
+Every segment a process owns is recorded. ``owned_segments`` lists them,
+``sweep`` unlinks hand-offs nobody released, and at exit any segment still
+owned is reported on stderr and unlinked.
+"""
+
+import atexit
+import math
+import sys
+import threading
+import time
+from array import array
+from itertools import repeat
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dataset_io import DTYPES, ELEMENTWISE
+from lazy_imports import is_loaded, optional_import
+
+# NumPy is optional (memoryview casts and loops are the fallback) and imported on first use.
+np = optional_import("numpy")
+
+# Seconds a handed-off segment may go unreleased before sweep() reclaims it.
+HANDOFF_MAX_AGE = 300.0
+
+# name -> {"bytes", "created", "handed_off"} for segments this process owns.
+# Tools run in worker threads, so every access holds _OWNED_LOCK.
+_OWNED: Dict[str, Dict[str, Any]] = {}
+_OWNED_LOCK = threading.Lock()
+
+
+def _itemsize(dtype: str) -> int:
+    return array(DTYPES[dtype][0]).itemsize
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Map an existing segment without taking responsibility for unlinking it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach registers with the resource tracker,
+        # which would unlink the owner's segment when this process exits.
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+class SharedArray:
+    """A numeric array stored in a named shared-memory segment."""
+
+    def __init__(self, segment: shared_memory.SharedMemory, dtype: str, shape: Tuple[int, ...], owner: bool):
+        self.segment = segment
+        self.dtype = dtype
+        self.shape = shape
+        self.count = math.prod(shape)
+        self.owner = owner
+        code, descr = DTYPES[dtype]
+        nbytes = self.count * _itemsize(dtype)
+        if nbytes > segment.size:
+            segment.close()
+            raise ValueError(f"Segment '{segment.name}' holds {segment.size} bytes, descriptor needs {nbytes}")
+        if np is not None:
+            self.view = np.ndarray(shape, dtype=descr, buffer=segment.buf)
+        elif sys.byteorder != "little":
+            segment.close()
+            raise ValueError("Shared arrays without NumPy require a little-endian host")
+        else:
+            self.view = segment.buf[:nbytes].cast(code)
+
+    @classmethod
+    def create(cls, dtype: str, shape: Sequence[int]) -> "SharedArray":
+        """Allocate a new segment owned by this process."""
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported dtype '{dtype}' (expected one of {', '.join(DTYPES)})")
+        shape = tuple(int(n) for n in shape)
+        segment = shared_memory.SharedMemory(create=True, size=max(1, math.prod(shape) * _itemsize(dtype)))
+        with _OWNED_LOCK:
+            _OWNED[segment.name] = {"bytes": segment.size, "created": time.time(), "handed_off": False}
+        return cls(segment, dtype, shape, owner=True)
+
+    @classmethod
+    def from_values(cls, values: Any, dtype: str = "float64") -> "SharedArray":
+        """Copy a sequence (list, ``array.array`` or NumPy array) into a new segment."""
+        shape = tuple(values.shape) if is_loaded(np) and isinstance(values, np.ndarray) else (len(values),)
+        shared = cls.create(dtype, shape)
+        if np is not None:
+            shared.view[...] = values
+        else:
+            shared.view[:] = array(DTYPES[dtype][0], values)
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor: Dict[str, Any]) -> "SharedArray":
+        """Map a segment described by a peer; this process does not own it."""
+        dtype = descriptor.get("dtype", "float64")
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported dtype '{dtype}' (expected one of {', '.join(DTYPES)})")
+        shape = tuple(int(n) for n in descriptor.get("shape", ()))
+        try:
+            segment = _attach(str(descriptor["shm"]))
+        except FileNotFoundError:
+            raise ValueError(f"No shared memory segment named '{descriptor['shm']}'")
+        return cls(segment, dtype, shape or (segment.size // _itemsize(dtype),), owner=False)
+
+    @property
+    def descriptor(self) -> Dict[str, Any]:
+        return {"shm": self.segment.name, "dtype": self.dtype, "shape": list(self.shape)}
+
+    def tolist(self) -> List[Any]:
+        return self.view.tolist()
+
+    def close(self):
+        """Unmap this process's view. The segment itself stays until its owner unlinks it."""
+        view, self.view = self.view, None
+        if isinstance(view, memoryview):
+            view.release()
+        del view
+        try:
+            self.segment.close()
+        except BufferError:
+            pass  # a caller still holds the view; it is unmapped once dropped
+
+    def unlink(self):
+        """Destroy the segment. Only its owner may do this."""
+        if not self.owner:
+            raise ValueError(f"Segment '{self.segment.name}' is owned by another process")
+        self.close()
+        release(self.segment.name)
+
+    def __enter__(self) -> "SharedArray":
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
+
+
+def hand_off(shared: SharedArray) -> Dict[str, Any]:
+    """Give a segment this process created to a peer; it stays recorded until released."""
+    with _OWNED_LOCK:
+        _OWNED[shared.segment.name]["handed_off"] = True
+    descriptor = shared.descriptor
+    shared.close()
+    return descriptor
+
+
+def release(name: str) -> bool:
+    """Unlink a segment this process owns; False if it does not own one by that name."""
+    with _OWNED_LOCK:
+        if _OWNED.pop(name, None) is None:
+            return False
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return True
+    segment.close()
+    segment.unlink()  # also unregisters it from the resource tracker
+    return True
+
+
+def owned_segments() -> List[Dict[str, Any]]:
+    now = time.time()
+    with _OWNED_LOCK:
+        return [{"name": name, "bytes": info["bytes"], "age_seconds": now - info["created"],
+                 "handed_off": info["handed_off"]} for name, info in _OWNED.items()]
+
+
+def sweep(max_age: float) -> List[str]:
+    """Unlink handed-off segments older than ``max_age`` seconds that were never released."""
+    stale = [info for info in owned_segments() if info["handed_off"] and info["age_seconds"] > max_age]
+    reclaimed = []
+    for info in stale:
+        if release(info["name"]):  # unless a client released it meanwhile
+            print(f"shared_arrays: reclaiming unreleased segment {info['name']} ({info['bytes']} bytes)",
+                  file=sys.stderr)
+            reclaimed.append(info["name"])
+    return reclaimed
+
+
+@atexit.register
+def _report_leaks():
+    for info in owned_segments():
+        if not info["handed_off"]:
+            print(f"shared_arrays: segment {info['name']} ({info['bytes']} bytes) was never unlinked",
+                  file=sys.stderr)
+        release(info["name"])
+
+
+def elementwise(operation: str, descriptor: Dict[str, Any], operand: Optional[float] = None,
+                operand_array: Optional[Dict[str, Any]] = None, output: Optional[Dict[str, Any]] = None,
+                max_age: float = HANDOFF_MAX_AGE) -> Dict[str, Any]:
+    """Apply ``operation`` to a shared array and a scalar or second shared array, writing float64 output."""
+    if operation not in ELEMENTWISE:
+        raise ValueError(f"Unknown elementwise operation '{operation}'")
+    if (operand is None) == (operand_array is None):
+        raise ValueError("Provide exactly one of 'operand' or 'operand_array'")
+    sweep(max_age)
+    left = SharedArray.attach(descriptor)
+    right = out = None
+    try:
+        if operand_array is not None:
+            right = SharedArray.attach(operand_array)
+            if right.count != left.count:
+                raise ValueError(f"Array lengths differ: {left.count} vs {right.count}")
+            operand = right.view
+            if operation == "divide" and (not operand.all() if np is not None else 0 in operand):
+                raise ZeroDivisionError("Cannot divide by zero")
+        else:
+            operand = float(operand)
+            if operation == "divide" and operand == 0:
+                raise ZeroDivisionError("Cannot divide by zero")
+        out = SharedArray.attach(output) if output is not None else SharedArray.create("float64", left.shape)
+        if out.dtype != "float64" or out.count != left.count:
+            raise ValueError(f"Output must be a float64 array of {left.count} values")
+        if np is not None:
+            getattr(np, operation)(left.view, operand, out=out.view.reshape(left.view.shape), casting="unsafe")
+        else:
+            values = operand if right is not None else repeat(operand)
+            out.view[:] = array("d", map(ELEMENTWISE[operation], left.view, values))
+        operand = values = None
+        result = hand_off(out) if out.owner else out.descriptor
+        return {"operation": operation, "count": left.count, "output": result}
+    except BaseException:
+        if out is not None and out.owner:
+            out.unlink()
+        raise
+    finally:
+        for shared in (left, right, out):
+            if shared is not None and shared.view is not None:
+                shared.close()
+
+
+def reduce(operation: str, descriptor: Dict[str, Any]) -> Dict[str, Any]:
+    """Sum, mean, min or max of a shared array."""
+    if operation not in ("sum", "mean", "min", "max"):
+        raise ValueError(f"Unknown reduction '{operation}'")
+    shared = SharedArray.attach(descriptor)
+    try:
+        values = shared.view
+        if shared.count == 0 and operation != "sum":
+            raise ValueError(f"Cannot compute {operation} of an empty array")
+        if np is not None:
+            value = getattr(values, operation)().item() if shared.count else 0.0
+        elif operation in ("sum", "mean"):
+            value = math.fsum(values) / (shared.count if operation == "mean" else 1)
+        else:
+            value = (min if operation == "min" else max)(values)
+        values = None
+        return {"operation": operation, "count": shared.count, "value": value}
+    finally:
+        shared.close()
@@ -5,113 +5,53 @@ A basic MCP server that provides an addition operation tool.
 """
 
 import asyncio
-import json
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Tuple
 
-from mcp.server import Server
-from mcp.server.models import InitializationOptions
-from mcp.server.stdio import stdio_server
-from mcp.types import (
-    CallToolRequest,
-    CallToolResult,
-    ListToolsRequest,
-    ListToolsResult,
-    Tool,
-    TextContent,
-)
+from sdk_server import ToolServer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create MCP server instance
-server = Server("simple-mcp-server")
-
-@server.list_tools()
-async def handle_list_tools() -> ListToolsResult:
-    """Handle list_tools requests."""
-    tools = [
-        Tool(
-            name="addition",
-            description="Adds two numbers together",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "a": {
-                        "type": "number",
-                        "description": "First number to add"
-                    },
-                    "b": {
-                        "type": "number", 
-                        "description": "Second number to add"
-                    }
-                },
-                "required": ["a", "b"]
+ADDITION_TOOL = {
+    "name": "addition",
+    "description": "Adds two numbers together",
+    "inputSchema": {
+        "type": "object",
+        "properties": {
+            "a": {
+                "type": "number",
+                "description": "First number to add"
+            },
+            "b": {
+                "type": "number",
+                "description": "Second number to add"
             }
-        )
-    ]
-    return ListToolsResult(tools=tools)
+        },
+        "required": ["a", "b"]
+    }
+}
+
+
+def addition(arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    a = arguments["a"]
+    b = arguments["b"]
+    # Convert to float to handle both integers and decimals
+    result = float(a) + float(b)
+    return f"The sum of {a} and {b} is: {result}", {"result": result}
+
+
+# Create MCP server instance
+server = ToolServer("simple-mcp-server")
+server.add_tool(ADDITION_TOOL, addition)
 
-@server.call_tool()
-async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> CallToolResult:
-    """Handle call_tool requests."""
-    if name == "addition":
-        try:
-            a = arguments.get("a")
-            b = arguments.get("b")
-            
-            if a is None or b is None:
-            return CallToolResult(
-                content=[
-                    TextContent(
-                        type="text",
-                        text="Error: Both 'a' and 'b' parameters are required"
-                    )
-                ]
-            )
-            
-            # Convert to float to handle both integers and decimals
-            result = float(a) + float(b)
-            
-            return CallToolResult(
-                content=[
-                    TextContent(
-                        type="text",
-                        text=f"The sum of {a} and {b} is: {result}"
-                    )
-                ]
-            )
-        except (ValueError, TypeError) as e:
-            return CallToolResult(
-                content=[
-                    TextContent(
-                        type="text",
-                        text=f"Error: Invalid input. Please provide valid numbers. {str(e)}"
-                    )
-                ]
-            )
-    else:
-        return CallToolResult(
-            content=[
-                TextContent(
-                    type="text",
-                    text=f"Error: Unknown tool '{name}'"
-                )
-            ]
-        )
 
 async def main():
     """Main function to run the MCP server."""
     logger.info("Starting Simple MCP Server...")
-    
-    # Run the server using stdio transport
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            server.create_initialization_options()
-        )
+    await server.run_stdio()
+
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
@@ -1,117 +1,127 @@
 #!/usr/bin/env python3
 """
-Simple MCP Server - Minimal Working Version
+Simple MCP Server - the calculator on the mcp SDK
+
+Serves the arithmetic and random sampling tools of ``calculator_server.py``
+(same schemas and structured results) through ``sdk_server.ToolServer``, so
+the two backends can be compared like for like (``benchmark.py backends``).
 """
 
+import argparse
 import asyncio
 import json
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
-from mcp.server import Server
-from mcp.server.stdio import stdio_server
-from mcp.types import (
-    CallToolResult,
-    ListToolsResult,
-    Tool,
-    TextContent,
-)
+from tool_schemas import TOOLS
+from random_tools import monte_carlo, random_samples
+from sdk_server import DEFAULT_MAX_CONCURRENCY, ToolError, ToolServer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create MCP server instance
-server = Server("simple-calculator")
-
-@server.list_tools()
-async def handle_list_tools() -> ListToolsResult:
-    """Handle list_tools requests."""
-    tools = [
-        Tool(
-            name="add",
-            description="Add two numbers together",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "a": {
-                        "type": "number",
-                        "description": "First number"
-                    },
-                    "b": {
-                        "type": "number", 
-                        "description": "Second number"
-                    }
-                },
-                "required": ["a", "b"]
-            }
-        ),
-        Tool(
-            name="multiply",
-            description="Multiply two numbers",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "a": {
-                        "type": "number",
-                        "description": "First number"
-                    },
-                    "b": {
-                        "type": "number", 
-                        "description": "Second number"
-                    }
-                },
-                "required": ["a", "b"]
-            }
-        )
-    ]
-    return ListToolsResult(tools=tools)
-
-@server.call_tool()
-async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> CallToolResult:
-    """Handle call_tool requests."""
+
+def _operands(arguments: Dict[str, Any]) -> Tuple[float, float]:
+    return float(arguments["a"]), float(arguments["b"])
+
+
+def add(arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    a, b = _operands(arguments)
+    result = a + b
+    return f"Adding {a} + {b} = {result}", {"result": result}
+
+
+def subtract(arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    a, b = _operands(arguments)
+    result = a - b
+    return f"Subtracting {a} - {b} = {result}", {"result": result}
+
+
+def multiply(arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    a, b = _operands(arguments)
+    result = a * b
+    return f"Multiplying {a} × {b} = {result}", {"result": result}
+
+
+def divide(arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    a, b = _operands(arguments)
+    if b == 0:
+        raise ToolError("Cannot divide by zero")
+    result = a / b
+    return f"Dividing {a} ÷ {b} = {result}", {"result": result}
+
+
+def _random(distribution: str, arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    keys = ("count", "seed", "output_path", "low", "high", "mean", "std")
     try:
-        a = float(arguments.get("a", 0))
-        b = float(arguments.get("b", 0))
-        
-        if name == "add":
-            result = a + b
-            message = f"Adding {a} + {b} = {result}"
-        elif name == "multiply":
-            result = a * b
-            message = f"Multiplying {a} × {b} = {result}"
-        else:
-            message = f"Unknown tool: {name}"
-            
-        return CallToolResult(
-            content=[
-                TextContent(
-                    type="text",
-                    text=message
-                )
-            ]
-        )
-    except Exception as e:
-        return CallToolResult(
-            content=[
-                TextContent(
-                    type="text",
-                    text=f"Error: {str(e)}"
-                )
-            ]
-        )
+        report = random_samples(distribution, **{key: arguments[key] for key in keys if key in arguments})
+    except ValueError as e:
+        raise ToolError(str(e))
+    if "values" in report:
+        return json.dumps({"seed": report["seed"], "values": report["values"]}), report
+    return f"Wrote {report['count']} {distribution} samples to {report['output_path']} (seed {report['seed']})", report
+
+
+def random_uniform(arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    return _random("uniform", arguments)
+
+
+def random_normal(arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    return _random("normal", arguments)
+
+
+def monte_carlo_tool(arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    keys = ("expression", "variables", "samples", "seed", "confidence")
+    try:
+        summary = monte_carlo(**{key: arguments[key] for key in keys if key in arguments})
+    except ValueError as e:
+        raise ToolError(str(e))
+    margin = summary["ci_high"] - summary["mean"]
+    return (
+        f"Monte Carlo estimate of {arguments['expression']} = {summary['mean']} ± {margin} "
+        f"({summary['confidence']:.0%} CI [{summary['ci_low']}, {summary['ci_high']}], "
+        f"{summary['valid_samples']} samples, seed {summary['seed']})"
+    ), summary
+
+
+# Tool name -> (function, heavy). Heavy tools run in the server's process pool.
+FUNCTIONS = {
+    "add": (add, False),
+    "subtract": (subtract, False),
+    "multiply": (multiply, False),
+    "divide": (divide, False),
+    "random_uniform": (random_uniform, True),
+    "random_normal": (random_normal, True),
+    "monte_carlo": (monte_carlo_tool, True),
+}
+
+
+def create_server(max_concurrency: int = DEFAULT_MAX_CONCURRENCY, pool_workers: int = None,
+                  metrics_tool: bool = False) -> ToolServer:
+    """Build the server with the calculator's definitions of the tools in ``FUNCTIONS``."""
+    server = ToolServer("simple-calculator", max_concurrency=max_concurrency, pool_workers=pool_workers,
+                        metrics_tool=metrics_tool)
+    for tool in TOOLS:
+        if tool["name"] in FUNCTIONS:
+            function, heavy = FUNCTIONS[tool["name"]]
+            server.add_tool(tool, function, heavy=heavy)
+    return server
+
 
 async def main():
     """Main function to run the MCP server."""
+    parser = argparse.ArgumentParser(description="Calculator MCP server on the mcp SDK (stdio)")
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="Most tool calls run at once; later ones wait (default %(default)s)")
+    parser.add_argument("--pool-workers", type=int, default=None,
+                        help="Processes for the random and Monte Carlo tools (default: CPU count)")
+    parser.add_argument("--metrics-tool", action="store_true",
+                        help="Also offer a server_metrics tool with request counts and latency percentiles")
+    args = parser.parse_args()
     logger.info("Starting Simple MCP Calculator Server...")
-    
-    # Run the server using stdio transport
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            server.create_initialization_options()
-        )
+    await create_server(args.max_concurrency, args.pool_workers, args.metrics_tool).run_stdio()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
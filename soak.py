@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Soak test for the calculator server: catch slow leaks and latency drift.
+
+::
+
+    python soak.py --requests 2000000                  # a stdio server, as agents run it
+    python soak.py --transport tcp --seconds 3600 --concurrency 64
+    python soak.py --requests 5000000 --server-args "--record /dev/null"
+
+One long-lived server is driven with a weighted mix of requests (``MIX``):
+
+- arithmetic whose results are checked;
+- tool errors, such as division by zero, bad arguments and unknown tools;
+- unknown methods;
+- malformed JSON lines, which must not disturb the requests around them;
+- huge lines, padded to ``--huge-bytes``;
+- cancellations, which are heavy calls abandoned after a fraction of a
+  millisecond so the client sends ``notifications/cancelled``.
+
+Every ``--sample-every`` seconds the soak reads the server's RSS and open file
+descriptors from /proc and the latency percentiles of the requests since the
+last sample. After the first ``--warmup`` of the run (caches and pools filling
+up), it fits a least-squares line to each series against the request count.
+The run fails if a slope exceeds its limit, given per million requests:
+
+- ``--max-rss-slope``: MB of RSS;
+- ``--max-fd-slope``: file descriptors;
+- ``--max-p99-slope``: milliseconds of p99 latency.
+
+Slopes are only enforced once at least ``--min-slope-requests`` requests
+(default 100,000) follow the warm-up. Over a shorter run, start-up growth would
+be extrapolated to a million requests, so the slopes are reported but do not
+fail the run.
+
+It also fails if a checked response is wrong, a request gets no answer, or the
+server exits. Overload rejections are counted but are not failures. The exit
+status is 1 on failure, so a release pipeline can run it.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from admission import OVERLOADED
+from mcp_client import AsyncClient, wait_for_ready_file
+from replay import percentiles
+from server_supervisor import rss_bytes
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calculator_server.py")
+# Relative frequency of each kind of traffic.
+MIX = {
+    "add": 40, "multiply": 10, "divide": 10, "divide_by_zero": 5, "bad_arguments": 5, "unknown_tool": 3,
+    "unknown_method": 2, "tools_list": 2, "ping": 5, "random": 10, "malformed": 5, "cancel": 2, "huge": 0.2,
+}
+MALFORMED = [b'{"jsonrpc": "2.0", "id": \n', b"not json at all\n", b"\xff\xfe\xfd\n", b"[1, 2\n", b"42\n", b"[]\n"]
+# Seconds a cancelled call is given before the client abandons it.
+CANCEL_AFTER = 0.0005
+# Wrong responses described in full in the report.
+EXAMPLES = 5
+
+
+def fd_count(pid: int) -> Optional[int]:
+    """Open file descriptors of ``pid``, or None where /proc is unavailable."""
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return None
+
+
+def slope(points: List[Tuple[float, float]]) -> Optional[float]:
+    """Least-squares slope of y over x, or None with fewer than three points."""
+    if len(points) < 3:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+class Soak:
+    def __init__(self, client: AsyncClient, pid: int, args: argparse.Namespace):
+        self.client = client
+        self.pid = pid
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.kinds = list(MIX)
+        self.weights = [MIX[kind] for kind in self.kinds]
+        self.sent = 0
+        self.counts: Counter = Counter()
+        self.wrong = 0
+        self.examples: List[str] = []
+        self.unanswered = 0
+        self.shed = 0
+        self.window: List[float] = []
+        self.samples: List[Dict[str, Any]] = []
+        self._started = 0.0
+        self._stop = False
+
+    def _finished(self) -> bool:
+        if self._stop or not self.client.connected:
+            return True
+        if self.args.seconds and time.perf_counter() - self._started >= self.args.seconds:
+            return True
+        return bool(self.args.requests) and self.sent >= self.args.requests
+
+    def _wrong(self, kind: str, problem: str):
+        self.wrong += 1
+        if len(self.examples) < EXAMPLES:
+            self.examples.append(f"{kind}: {problem}")
+
+    async def _call(self, kind: str, name: str, arguments: Dict[str, Any],
+                    timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request("tools/call", {"name": name, "arguments": arguments},
+                                                 timeout or self.args.timeout)
+        except asyncio.TimeoutError:
+            if timeout is None:
+                self.unanswered += 1
+                self._wrong(kind, "no response")
+            return None
+        self.window.append((time.perf_counter() - started) * 1000)
+        if (response.get("error") or {}).get("code") == OVERLOADED:
+            self.shed += 1  # admission control doing its job, e.g. behind a pile of cancelled heavy calls
+            return None
+        if "error" in response:
+            self._wrong(kind, f"JSON-RPC error {response['error']}")
+            return None
+        return response["result"]
+
+    async def _one(self, kind: str):
+        a, b = self.random.randint(-10**6, 10**6), self.random.randint(1, 1000)
+        if kind in ("add", "multiply", "divide", "huge"):
+            name = "add" if kind == "huge" else kind
+            arguments: Dict[str, Any] = {"a": a, "b": b}
+            if kind == "huge":
+                arguments["padding"] = "x" * self.args.huge_bytes
+            result = await self._call(kind, name, arguments)
+            expected = {"add": a + b, "multiply": a * b, "divide": a / b}[name]
+            value = (result or {}).get("structuredContent", {}).get("result")
+            if result is not None and (value is None or abs(value - expected) > 1e-9 * max(1.0, abs(expected))):
+                self._wrong(kind, f"{name}({a}, {b}) returned {result}")
+        elif kind in ("divide_by_zero", "bad_arguments", "unknown_tool"):
+            name, arguments = {"divide_by_zero": ("divide", {"a": a, "b": 0}),
+                               "bad_arguments": ("add", {"a": "not a number", "b": b}),
+                               "unknown_tool": ("no_such_tool", {})}[kind]
+            result = await self._call(kind, name, arguments)
+            if result is not None and not result.get("isError"):
+                self._wrong(kind, f"expected a tool error, got {result}")
+        elif kind == "random":
+            result = await self._call(kind, "random_uniform", {"count": 100, "seed": b})
+            if result is not None and len(result.get("structuredContent", {}).get("values", [])) != 100:
+                self._wrong(kind, f"expected 100 values, got {result}")
+        elif kind == "cancel":
+            await self._call(kind, "random_uniform", {"count": 200_000}, timeout=CANCEL_AFTER)
+        elif kind == "malformed":
+            await self.client.send_raw(self.random.choice(MALFORMED))
+        else:
+            method = {"unknown_method": "no/such_method", "tools_list": "tools/list", "ping": "ping"}[kind]
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, None, self.args.timeout)
+            except asyncio.TimeoutError:
+                self.unanswered += 1
+                self._wrong(kind, "no response")
+                return
+            self.window.append((time.perf_counter() - started) * 1000)
+            if kind == "unknown_method":
+                correct = (response.get("error") or {}).get("code") == -32601
+            else:
+                correct = "result" in response
+            if not correct:
+                self._wrong(kind, f"unexpected response {response}")
+
+    async def _worker(self):
+        while not self._finished():
+            kind = self.random.choices(self.kinds, self.weights)[0]
+            self.sent += 1
+            self.counts[kind] += 1
+            try:
+                await self._one(kind)
+            except ConnectionError:
+                self._stop = True
+
+    def _sample(self):
+        latency, self.window = percentiles(self.window), []
+        rss = rss_bytes(self.pid)
+        sample = {"seconds": round(time.perf_counter() - self._started, 1), "requests": self.sent,
+                  "rss_mb": round(rss / 1048576, 2) if rss is not None else None, "fds": fd_count(self.pid),
+                  "p50_ms": latency.get("p50"), "p99_ms": latency.get("p99")}
+        self.samples.append(sample)
+        if not self.args.quiet:
+            print(f"{sample['seconds']:>8.0f}s {sample['requests']:>10} requests  rss {sample['rss_mb']} MB  "
+                  f"fds {sample['fds']}  p50 {latency.get('p50', 0):.2f} ms  p99 {latency.get('p99', 0):.2f} ms",
+                  flush=True)
+
+    async def _sampler(self):
+        while True:
+            await asyncio.sleep(self.args.sample_every)
+            self._sample()
+
+    def _slopes(self) -> Tuple[Dict[str, Optional[float]], int]:
+        """Growth of each series per million requests after the warm-up, and the requests the fits span."""
+        warm = [sample for sample in self.samples if sample["requests"] >= self.args.warmup * self.sent]
+        slopes = {}
+        for key in ("rss_mb", "fds", "p99_ms"):
+            fitted = slope([(sample["requests"] / 1e6, sample[key]) for sample in warm if sample[key] is not None])
+            slopes[key] = None if fitted is None else round(fitted, 4)
+        return slopes, warm[-1]["requests"] - warm[0]["requests"] if warm else 0
+
+    async def run(self) -> Dict[str, Any]:
+        self._started = time.perf_counter()
+        self._sample()
+        sampler = asyncio.create_task(self._sampler())
+        try:
+            await asyncio.gather(*(self._worker() for _ in range(self.args.concurrency)))
+        finally:
+            sampler.cancel()
+        failures = []
+        alive = self.client.connected
+        if alive:
+            # Let the server catch up on abandoned calls before the last reading.
+            try:
+                await self.client.request("ping", None, self.args.timeout)
+            except asyncio.TimeoutError:
+                failures.append(f"the server did not answer a final ping within {self.args.timeout:g}s")
+            except ConnectionError:
+                alive = False
+        self._sample()
+        elapsed = time.perf_counter() - self._started
+        slopes, slope_requests = self._slopes()
+        enforced = slope_requests >= self.args.min_slope_requests
+        limits = {"rss_mb": self.args.max_rss_slope, "fds": self.args.max_fd_slope, "p99_ms": self.args.max_p99_slope}
+        if enforced:
+            failures += [f"{key} grew {value:g} per million requests (limit {limits[key]:g})"
+                         for key, value in slopes.items() if value is not None and value > limits[key]]
+        if not alive:
+            failures.append("the server exited or closed the connection")
+        if self.wrong:
+            failures.append(f"{self.wrong} wrong or missing responses")
+        return {
+            "requests": self.sent, "seconds": elapsed, "requests_per_second": self.sent / elapsed if elapsed else 0.0,
+            "kinds": dict(self.counts), "wrong": self.wrong, "unanswered": self.unanswered,
+            "shed": self.shed,
+            "wrong_examples": self.examples, "slopes_per_million": slopes, "limits": limits,
+            "slope_requests": slope_requests, "slopes_enforced": enforced,
+            "samples": self.samples, "failures": failures,
+        }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    slopes = report["slopes_per_million"]
+    lines = [
+        f"Soaked {report['requests']} requests in {report['seconds']:.0f}s ({report['requests_per_second']:.0f} req/s)",
+        "Mix: " + ", ".join(f"{kind} {count}" for kind, count in sorted(report["kinds"].items())),
+        f"Wrong {report['wrong']} (no answer {report['unanswered']}), shed by the server {report['shed']}",
+        "Growth per million requests after warm-up: " + ", ".join(
+            f"{key} {'-' if value is None else f'{value:+g}'} (limit {report['limits'][key]:g})"
+            for key, value in slopes.items()),
+    ]
+    if not report["slopes_enforced"]:
+        lines.append(f"  (not enforced: only {report['slope_requests']} requests after warm-up, "
+                     "see --min-slope-requests)")
+    lines += [f"  {example}" for example in report["wrong_examples"]]
+    lines.append("FAILED: " + "; ".join(report["failures"]) if report["failures"] else "PASSED")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Drive one calculator server with mixed traffic and watch for drift")
+    parser.add_argument("--requests", type=int, default=1_000_000, help="Requests to send (0: no limit)")
+    parser.add_argument("--seconds", type=float, default=0, help="Stop after this long (0: no limit)")
+    parser.add_argument("--transport", choices=["stdio", "tcp"], default="stdio", help="How to run the server")
+    parser.add_argument("--server-args", default="", help="Extra arguments for the server")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--sample-every", type=float, default=5.0, help="Seconds between RSS/fd/latency samples")
+    parser.add_argument("--warmup", type=float, default=0.1,
+                        help="Fraction of the run left out of the slope fits (default 0.1)")
+    parser.add_argument("--min-slope-requests", type=int, default=100_000,
+                        help="Requests needed after the warm-up before slope limits apply (default 100000)")
+    parser.add_argument("--max-rss-slope", type=float, default=4.0, help="MB of RSS growth per million requests")
+    parser.add_argument("--max-fd-slope", type=float, default=1.0, help="File descriptors per million requests")
+    parser.add_argument("--max-p99-slope", type=float, default=1.0, help="ms of p99 growth per million requests")
+    parser.add_argument("--huge-bytes", type=int, default=1024 * 1024, help="Padding of the huge requests")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for each response")
+    parser.add_argument("--seed", type=int, help="Seed for the traffic mix, to repeat a run")
+    parser.add_argument("--quiet", action="store_true", help="Only print the final report")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report, with every sample, as JSON to PATH")
+    return parser.parse_args(argv)
+
+
+async def soak(args: argparse.Namespace) -> Dict[str, Any]:
+    server = None
+    with tempfile.TemporaryDirectory() as directory:
+        if args.transport == "stdio":
+            client = await AsyncClient.spawn([sys.executable, SERVER_SCRIPT] + shlex.split(args.server_args))
+            pid = client.process.pid
+        else:
+            ready_file = os.path.join(directory, "ready.json")
+            server = subprocess.Popen([sys.executable, SERVER_SCRIPT, "--tcp", "127.0.0.1:0", "--ready-file",
+                                       ready_file] + shlex.split(args.server_args), stdin=subprocess.DEVNULL)
+            try:
+                ready = await asyncio.to_thread(wait_for_ready_file, ready_file, timeout=30, process=server)
+                host, _, port = ready["address"].rpartition(":")
+                client = await AsyncClient.connect(host, int(port))
+            except BaseException:
+                server.terminate()
+                raise
+            pid = server.pid
+        try:
+            await client.initialize({"name": "soak", "version": "1.0"}, timeout=30)
+            return await Soak(client, pid, args).run()
+        finally:
+            await client.close()
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if not args.requests and not args.seconds:
+        print("Give --requests or --seconds, or the soak never ends", file=sys.stderr)
+        return 2
+    report = asyncio.run(soak(args))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
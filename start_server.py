@@ -2,11 +2,15 @@
 """
 MCP Calculator Server Starter
 Start the MCP server using the configuration file.
+
+With --supervise, run every configured server (or the named ones) under
+server_supervisor, which restarts crashed servers, recycles servers that
+outgrow their memory budget and answers status queries on a control socket.
 """
 
+import argparse
 import json
 import subprocess
-import sys
 import os
 from pathlib import Path
 
@@ -78,46 +82,106 @@ def start_server(server_name="calculator"):
         print(f"❌ Error starting server: {e}")
         return False
 
+def select_servers(names):
+    """The configured servers to supervise: all of them, or the named ones."""
+    config = load_config()
+    if not config:
+        return None
+    servers = config.get("mcpServers", {})
+    unknown = [name for name in names if name not in servers]
+    if unknown:
+        print(f"❌ Unknown servers: {', '.join(unknown)}")
+        print(f"Available servers: {list(servers.keys())}")
+        return None
+    return {name: servers[name] for name in names} if names else servers
+
+def show_status(control_socket):
+    """Print the status of a running supervisor."""
+    from mcp_client import Client
+    from server_supervisor import format_status
+
+    try:
+        with Client.connect(path=control_socket) as client:
+            response = client.request("supervisor/status", timeout=5)
+    except OSError as e:
+        print(f"❌ No supervisor on {control_socket}: {e}")
+        return 1
+    for line in format_status(response["result"]):
+        print(line)
+    return 0
+
+def parse_args(argv=None):
+    from server_supervisor import DEFAULT_CONTROL_SOCKET
+
+    parser = argparse.ArgumentParser(
+        description="Start MCP servers from mcp_config.json",
+        epilog="Examples:\n"
+               "  python start_server.py                      # Start the calculator server\n"
+               "  python start_server.py --supervise          # Supervise every configured server\n"
+               "  python start_server.py --supervise calculator --max-rss 512\n"
+               "  python start_server.py --status             # Ask a running supervisor for status",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("servers", nargs="*", metavar="server_name",
+                        help="Server to start (default: calculator); with --supervise, any number (default: all)")
+    parser.add_argument("--supervise", action="store_true",
+                        help="Run the servers under a supervisor that restarts and recycles them")
+    parser.add_argument("--status", action="store_true", help="Print the status of a running supervisor and exit")
+    parser.add_argument("--control-socket", default=DEFAULT_CONTROL_SOCKET, metavar="PATH",
+                        help=f"Supervisor control socket (default: {DEFAULT_CONTROL_SOCKET})")
+    parser.add_argument("--max-rss", type=float, metavar="MB",
+                        help="Replace a server once its resident memory exceeds this")
+    parser.add_argument("--memory-limit", type=float, metavar="MB", help="Address-space limit (RLIMIT_AS) per server")
+    parser.add_argument("--cpu-limit", type=int, metavar="SECONDS", help="CPU-time limit (RLIMIT_CPU) per server process")
+    parser.add_argument("--log-file", metavar="PATH", help="Also append every server's stderr to this file")
+    args = parser.parse_args(argv)
+    if len(args.servers) > 1 and not args.supervise:
+        parser.error("starting several servers requires --supervise")
+    return args
+
 def main():
     """Main function."""
+    args = parse_args()
+    if args.status:
+        return show_status(args.control_socket)
+
     print("🧮 MCP Calculator Server Starter")
     print("=" * 40)
-    
-    # Check for help argument
-    if len(sys.argv) > 1 and sys.argv[1] in ["-h", "--help", "help"]:
-        print("Usage: python start_server.py [server_name]")
-        print("\nOptions:")
-        print("  server_name    Name of the server to start (default: calculator)")
-        print("  -h, --help     Show this help message")
-        print("\nExamples:")
-        print("  python start_server.py              # Start default calculator server")
-        print("  python start_server.py calculator   # Start calculator server explicitly")
-        return 0
-    
-    # Check if server name is provided as argument
-    server_name = "calculator"
-    if len(sys.argv) > 1:
-        server_name = sys.argv[1]
-    
+
+    if args.supervise:
+        servers = select_servers(args.servers)
+        if not servers:
+            return 1
+        from server_supervisor import supervise
+
+        print(f"🛡️ Supervising: {', '.join(servers)}")
+        print(f"🔌 Control socket: {args.control_socket} (python start_server.py --status)")
+        print("🛑 Press Ctrl+C to stop all servers\n")
+        return supervise(servers, control_socket=args.control_socket, log_path=args.log_file, defaults={
+            "maxRssMB": args.max_rss, "memoryLimitMB": args.memory_limit, "cpuLimitSeconds": args.cpu_limit,
+        })
+
+    server_name = args.servers[0] if args.servers else "calculator"
+
     # Show configuration info first
     config = load_config()
     if config:
         servers = config.get("mcpServers", {})
-        print(f"📋 Available servers in configuration:")
+        print("📋 Available servers in configuration:")
         for name, server_config in servers.items():
             info = server_config.get("serverInfo", {})
             print(f"   • {name}: {info.get('name', 'Unknown')} v{info.get('version', '?')}")
         print()
-    
+
     # Start the specified server
     success = start_server(server_name)
-    
+
     if success:
         print("✅ Server started successfully!")
     else:
         print("❌ Failed to start server!")
         return 1
-    
+
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Incremental JSON parsing for very large messages.
+
+``json.loads`` needs the whole message in memory, as bytes and then again as
+text. It also turns a numeric array into a list of boxed Python numbers, about
+32 bytes per element against the 8 of a packed double. A request carrying a few
+million numbers therefore peaks at several times its own size. Messages of at
+least ``STREAM_THRESHOLD`` bytes are parsed here instead, chunk by chunk as they
+are read:
+
+* the raw line is never held whole; only the unparsed tail of the last chunk is
+  buffered
+* an array that starts with a number is read in bulk, a chunk at a time. Once it
+  reaches ``ARRAY_MIN`` elements it becomes an ``array.array`` of int64 (``'q'``,
+  all integers) or float64 (``'d'``), as binary frames already decode (see
+  ``framing``). Shorter arrays stay lists
+* everything else decodes as ``json.loads`` would
+
+Numbers inside bulk-read arrays go through ``int()`` and ``float()``. These also
+accept a few forms strict JSON rejects, such as ``+1``, ``.5`` and ``5.``. As
+in ``framing.pack_array``, an array mixing integers and floats, or holding
+integers beyond int64, is packed as float64. An array that turns out to mix
+numbers and other values after its first chunk becomes a list. Integers that
+were already packed as float64 are restored exactly, so the list matches what
+``json.loads`` gives.
+
+``Parser`` is push-driven, so it serves both a blocking stream (``read_line``,
+for stdio) and an asyncio one (``read_line_async``, for sockets).
+"""
+
+import asyncio
+import json
+import re
+from array import array
+from typing import Any, BinaryIO, Dict, Generator, List, Optional, Union
+
+from framing import pack_array
+
+# Messages at least this long are parsed while they are read (0: never).
+STREAM_THRESHOLD = 1024 * 1024
+# Numeric arrays at least this long become array.array rather than lists.
+ARRAY_MIN = 1024
+# Bytes read at a time once a message is being streamed.
+CHUNK_BYTES = 64 * 1024
+
+_NON_WHITESPACE = re.compile(rb"[^ \t\n\r]")
+_TOKEN_END = re.compile(rb"[,\]} \t\n\r]")
+# A string's body up to its closing quote or the end of the input; an escape split by a chunk boundary waits.
+_STRING_BODY = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+_NUMERIC_RUN = re.compile(rb"[-+.eE0-9, \t\n\r]*")
+_NOT_INTEGER = re.compile(rb"[.eE]")
+_NUMBER_BODY = b"0123456789+- \t\n\r"
+# Maps a count of '.', 'e' and 'E' in a number to 1 if it has none (an integer), else 0.
+_INTEGER_FLAG = bytes([1]) + bytes(255)
+# Integers beyond this magnitude may not survive a round trip through float64.
+_EXACT_FLOAT_INT = 2 ** 53
+_NUMBER_START = frozenset(b"-0123456789")
+
+_OPEN_OBJECT, _CLOSE_OBJECT, _OPEN_ARRAY, _CLOSE_ARRAY = b"{}[]"
+_QUOTE, _COLON, _COMMA = b'":,'
+
+_Step = Generator[None, None, Any]
+
+
+def _number(item: bytes) -> Any:
+    return float(item) if _NOT_INTEGER.search(item) else int(item)
+
+
+def _has_integer(segment: bytes) -> bool:
+    """Whether some comma-separated number in ``segment`` lacks a '.', 'e' or 'E'."""
+    # What is left is the separators and markers; an integer leaves two commas (or an end) side by side.
+    markers = segment.translate(None, _NUMBER_BODY)
+    return not markers or markers[:1] == b"," or markers[-1:] == b"," or b",," in markers
+
+
+class _Integers:
+    """Which items of an array packed as float64 were integers, to restore them if it becomes a list."""
+
+    __slots__ = ("flags", "exact")
+
+    def __init__(self):
+        self.flags = bytearray()  # 1 per integer item; items past its end are floats
+        self.exact: Dict[int, int] = {}  # integers float64 cannot hold exactly, by index
+
+    def mark(self, start: int, numbers: Any):
+        """Record the integers among ``numbers``, the items from index ``start`` on."""
+        self.flags.extend(bytes(start - len(self.flags)))
+        self.flags.extend(type(number) is int for number in numbers)
+        for offset, number in enumerate(numbers):
+            if type(number) is int and not -_EXACT_FLOAT_INT <= number <= _EXACT_FLOAT_INT:
+                self.exact[start + offset] = number
+
+    def mark_text(self, start: int, segment: bytes, items: List[bytes]):
+        """``mark`` for the unparsed numbers ``items``, split from ``segment``, without converting each one."""
+        self.flags.extend(bytes(start - len(self.flags)))
+        markers = segment.translate(None, _NUMBER_BODY).split(b",")
+        self.flags.extend(bytes(map(len, markers)).translate(_INTEGER_FLAG))
+        for offset, item in enumerate(items):
+            if len(item) >= 16 and self.flags[start + offset]:  # 2**53 has 16 digits
+                number = int(item)
+                if not -_EXACT_FLOAT_INT <= number <= _EXACT_FLOAT_INT:
+                    self.exact[start + offset] = number
+
+    def restore(self, values: array) -> List[Any]:
+        result = values.tolist()
+        index = self.flags.find(1)
+        while index != -1:
+            result[index] = self.exact.get(index) or int(result[index])
+            index = self.flags.find(1, index + 1)
+        return result
+
+
+class Parser:
+    """Decode one JSON document fed in chunks: ``feed`` each chunk, then ``close`` for the value.
+
+    Malformed input raises ``ValueError`` from ``feed`` or ``close``; the parser
+    cannot be used after that.
+    """
+
+    def __init__(self, array_min: int = ARRAY_MIN):
+        self.array_min = array_min
+        self._buffer = b""
+        self._pos = 0
+        self._eof = False
+        self._value: Any = None
+        self._done = False
+        self._steps = self._document()
+        next(self._steps)
+
+    def feed(self, data: bytes):
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        self._resume()
+
+    def close(self) -> Any:
+        """The decoded document, once all input has been fed."""
+        self._eof = True
+        self._resume()
+        return self._value
+
+    def _resume(self):
+        if self._done:
+            return
+        try:
+            next(self._steps)
+        except StopIteration as stop:
+            self._done = True
+            self._value = stop.value
+        except RecursionError:
+            raise ValueError("JSON nested too deeply") from None
+
+    def _more(self) -> _Step:
+        """Wait for the next chunk."""
+        if self._eof:
+            raise ValueError("Unexpected end of JSON input")
+        yield
+
+    def _peek(self) -> _Step:
+        """The next non-whitespace byte, without consuming it."""
+        while True:
+            match = _NON_WHITESPACE.search(self._buffer, self._pos)
+            if match:
+                self._pos = match.start()
+                return self._buffer[self._pos]
+            self._pos = len(self._buffer)
+            yield from self._more()
+
+    def _document(self) -> _Step:
+        value = yield from self._value_()
+        while True:
+            if _NON_WHITESPACE.search(self._buffer, self._pos):
+                raise ValueError("Extra data after JSON document")
+            self._pos = len(self._buffer)
+            if self._eof:
+                return value
+            yield
+
+    def _value_(self) -> _Step:
+        first = yield from self._peek()
+        if first == _OPEN_OBJECT:
+            return (yield from self._object())
+        if first == _OPEN_ARRAY:
+            return (yield from self._array())
+        if first == _QUOTE:
+            return (yield from self._string())
+        return (yield from self._scalar())
+
+    def _scalar(self) -> _Step:
+        """A number, true, false or null."""
+        while True:
+            end = _TOKEN_END.search(self._buffer, self._pos)
+            if end or self._eof:
+                break
+            yield
+        stop = end.start() if end else len(self._buffer)
+        token = self._buffer[self._pos:stop]
+        if not token:
+            raise ValueError("Expecting value")
+        self._pos = stop
+        return json.loads(token)
+
+    def _string(self) -> _Step:
+        parts: List[bytes] = [b'"']
+        self._pos += 1
+        while True:
+            end = _STRING_BODY.match(self._buffer, self._pos).end()
+            parts.append(self._buffer[self._pos:end])
+            self._pos = end
+            if end < len(self._buffer) and self._buffer[end] == _QUOTE:
+                self._pos += 1
+                parts.append(b'"')
+                return json.loads(b"".join(parts))
+            yield from self._more()
+
+    def _object(self) -> _Step:
+        self._pos += 1
+        result = {}
+        if (yield from self._peek()) == _CLOSE_OBJECT:
+            self._pos += 1
+            return result
+        while True:
+            if (yield from self._peek()) != _QUOTE:
+                raise ValueError("Expecting property name enclosed in double quotes")
+            key = yield from self._string()
+            if (yield from self._peek()) != _COLON:
+                raise ValueError("Expecting ':' delimiter")
+            self._pos += 1
+            result[key] = yield from self._value_()
+            delimiter = yield from self._peek()
+            self._pos += 1
+            if delimiter == _CLOSE_OBJECT:
+                return result
+            if delimiter != _COMMA:
+                raise ValueError("Expecting ',' delimiter")
+
+    def _array(self) -> _Step:
+        self._pos += 1
+        first = yield from self._peek()
+        if first == _CLOSE_ARRAY:
+            self._pos += 1
+            return []
+        if first in _NUMBER_START:
+            values, complete = yield from self._numbers()
+            if complete:
+                return values
+        else:
+            values = [(yield from self._value_())]
+        return (yield from self._items(values))
+
+    def _items(self, result: List[Any]) -> _Step:
+        """The rest of a list, from just after its last parsed element."""
+        while True:
+            delimiter = yield from self._peek()
+            self._pos += 1
+            if delimiter == _CLOSE_ARRAY:
+                return result
+            if delimiter != _COMMA:
+                raise ValueError("Expecting ',' delimiter")
+            result.append((yield from self._value_()))
+
+    def _numbers(self) -> _Step:
+        """Bulk-read an array of numbers: (values, True), or if something else turns up (list so far, False)."""
+        values: Any = []
+        integers = _Integers()
+        while True:
+            end = _NUMERIC_RUN.match(self._buffer, self._pos).end()
+            if end < len(self._buffer) and self._buffer[end] == _CLOSE_ARRAY:
+                values = self._extend(values, self._buffer[self._pos:end], integers)
+                self._pos = end + 1
+                return values, True
+            # Convert whole elements only: up to the last comma before the run ends.
+            cut = self._buffer.rfind(b",", self._pos, end)
+            if cut != -1:
+                values = self._extend(values, self._buffer[self._pos:cut], integers)
+                self._pos = cut + 1
+                if isinstance(values, list) and len(values) >= self.array_min:
+                    self._pos = cut  # an integer too large for float64: read the rest as an ordinary list
+                    return values, False
+            if end < len(self._buffer):
+                # Not a plain number: parse the rest as an ordinary list.
+                if isinstance(values, array):
+                    values = integers.restore(values) if values.typecode == "d" else values.tolist()
+                values.append((yield from self._value_()))
+                return values, False
+            yield from self._more()
+
+    def _extend(self, values: Any, segment: bytes, integers: _Integers) -> Any:
+        """``values`` plus the comma-separated numbers in ``segment``, noting in ``integers`` any packed as floats."""
+        items = segment.split(b",")
+        if isinstance(values, list):
+            values.extend(_number(item) for item in items)
+            if len(values) < self.array_min:
+                return values
+            try:
+                packed = pack_array(values, True)
+            except OverflowError:
+                return values
+            if packed.typecode == "d":
+                integers.mark(0, values)
+            return packed
+        if values.typecode == "q" and not _NOT_INTEGER.search(segment):
+            try:
+                values.extend(array("q", map(int, items)))
+                return values
+            except OverflowError:
+                pass
+        if values.typecode == "q":
+            integers.flags.extend(b"\x01" * len(values))  # int64 values fit float64 exactly up to 2**53
+            if values and (max(values) > _EXACT_FLOAT_INT or min(values) < -_EXACT_FLOAT_INT):
+                integers.exact.update((index, value) for index, value in enumerate(values)
+                                      if not -_EXACT_FLOAT_INT <= value <= _EXACT_FLOAT_INT)
+            values = array("d", values)
+        if _has_integer(segment):
+            integers.mark_text(len(values), segment, items)
+        values.extend(array("d", map(float, items)))
+        return values
+
+
+def loads(data: bytes, array_min: int = ARRAY_MIN) -> Any:
+    """``json.loads`` for a message already in memory, with large numeric arrays packed."""
+    parser = Parser(array_min)
+    parser.feed(data)
+    return parser.close()
+
+
+class Parsed:
+    """A message decoded while it was read; ``len()`` is its size in bytes, like the raw line's."""
+
+    __slots__ = ("value", "size", "error")
+
+    def __init__(self, value: Any, size: int, error: Optional[ValueError] = None):
+        self.value = value
+        self.size = size
+        self.error = error
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def decode_parsed(message: Parsed) -> Any:
+    """The ``decode`` for a ``Parsed`` message: its value, or the error that parsing it raised."""
+    if message.error is not None:
+        raise message.error
+    return message.value
+
+
+def _finish(parser: Parser, size: int, error: Optional[ValueError]) -> Parsed:
+    if error is None:
+        try:
+            return Parsed(parser.close(), size)
+        except ValueError as e:
+            error = e
+    return Parsed(None, size, error)
+
+
+def read_line(stream: BinaryIO, threshold: int = STREAM_THRESHOLD) -> Union[bytes, Parsed]:
+    """Read one newline-delimited message: the raw line if shorter than ``threshold``, otherwise ``Parsed``."""
+    line = stream.readline(threshold) if threshold > 0 else stream.readline()
+    if threshold <= 0 or len(line) < threshold or line.endswith(b"\n"):
+        return line
+    parser = Parser()
+    size, error = 0, None
+    while line:
+        size += len(line)
+        if error is None:
+            try:
+                parser.feed(line)
+            except ValueError as e:
+                error = e  # keep reading: the rest of the line belongs to this message
+        if line.endswith(b"\n"):
+            break
+        line = stream.readline(CHUNK_BYTES)
+    return _finish(parser, size, error)
+
+
+async def read_line_async(reader: asyncio.StreamReader, max_bytes: int) -> Union[bytes, Parsed]:
+    """``reader.readline()``, except that a line longer than the reader's limit is parsed as it arrives.
+
+    The reader's limit acts as the streaming threshold. A line longer than
+    ``max_bytes`` raises ``ValueError``.
+    """
+    try:
+        return await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        available = e.consumed
+    parser = Parser()
+    size, error = 0, None
+    while True:
+        if available:
+            chunk, last = await reader.readexactly(available), False
+        else:
+            try:
+                chunk = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                chunk = e.partial
+            except asyncio.LimitOverrunError as e:
+                available = e.consumed
+                continue
+            last = True
+        available = 0
+        size += len(chunk)
+        if size > max_bytes:
+            raise ValueError(f"Line exceeds {max_bytes} bytes")
+        if error is None:
+            try:
+                parser.feed(chunk)
+            except ValueError as e:
+                error = e
+        if last:
+            return _finish(parser, size, error)
@@ -5,108 +5,155 @@ A beautiful web interface to showcase the MCP server functionality.
 """
 
 import streamlit as st
-import subprocess
-import json
-import time
-import threading
-import queue
+import os
 import sys
 from pathlib import Path
 
+from batch_jobs import DEFAULT_IN_FLIGHT, BatchRun, parse_csv, parse_expressions, to_csv
+from mcp_client import result_text
+from server_pool import ServerPool
+
+# Seconds to wait for any single server response.
+REQUEST_TIMEOUT = 30
+
+# Server subprocesses shared by all browser sessions: this many stay warm, and
+# the pool grows to POOL_MAX_SIZE under load, then shrinks after POOL_IDLE_TIMEOUT.
+POOL_MIN_SIZE = int(os.environ.get("MCP_POOL_MIN_SIZE", 2))
+POOL_MAX_SIZE = int(os.environ.get("MCP_POOL_MAX_SIZE", os.cpu_count() or 2))
+POOL_IDLE_TIMEOUT = float(os.environ.get("MCP_POOL_IDLE_TIMEOUT", 300))
+
+# Batch page: rows shown live while a batch runs, and per page of the finished table.
+BATCH_PREVIEW_ROWS = 50
+BATCH_PAGE_ROWS = 500
+
+
+@st.cache_resource
+def get_server_pool():
+    """The calculator server pool, created once per Streamlit process."""
+    return ServerPool(
+        [sys.executable, "calculator_server.py"],
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        idle_timeout=POOL_IDLE_TIMEOUT,
+        client_info={"name": "streamlit-client", "version": "1.0"},
+    )
+
+
 class MCPClient:
     def __init__(self):
-        self.process = None
+        self.pool = None
         self.connected = False
-        
+
     def start_server(self):
-        """Start the MCP calculator server."""
+        """Attach this session to the shared MCP calculator server pool."""
         try:
-            self.process = subprocess.Popen(
-                [sys.executable, "calculator_server.py"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1
-            )
-            time.sleep(0.5)  # Wait for server to start
+            self.pool = get_server_pool()
             return True
         except Exception as e:
             st.error(f"Failed to start server: {e}")
             return False
     
-    def send_request(self, request):
+    def send_request(self, method, params=None):
         """Send a request to the MCP server and get response."""
-        if not self.process:
+        if not self.pool:
             return None
             
         try:
-            self.process.stdin.write(json.dumps(request) + "\n")
-            self.process.stdin.flush()
-            response = self.process.stdout.readline()
-            return json.loads(response) if response.strip() else None
+            return self.pool.request(method, params, timeout=REQUEST_TIMEOUT)
         except Exception as e:
             st.error(f"Communication error: {e}")
             return None
     
     def initialize(self):
         """Initialize the MCP server."""
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "streamlit-client", "version": "1.0"}
-            }
-        }
-        
-        response = self.send_request(init_request)
-        if response and "result" in response:
-            self.connected = True
-            return response["result"]["serverInfo"]
-        return None
+        if not self.pool:
+            return None
+        # Pool members are initialized when they start; report the server they run.
+        self.connected = True
+        return self.pool.server_info
     
     def list_tools(self):
         """Get available tools from the server."""
-        tools_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/list"
-        }
-        
-        response = self.send_request(tools_request)
+        response = self.send_request("tools/list")
         if response and "result" in response:
             return response["result"]["tools"]
         return []
     
     def call_tool(self, tool_name, arguments):
         """Call a specific tool with arguments."""
-        request = {
-            "jsonrpc": "2.0",
-            "id": 3,
-            "method": "tools/call",
-            "params": {
-                "name": tool_name,
-                "arguments": arguments
-            }
-        }
-        
-        response = self.send_request(request)
-        if response and "result" in response:
-            return response["result"]["content"][0]["text"]
-        elif response and "error" in response:
-            return f"Error: {response['error']['message']}"
-        return "No response received"
-    
+        response = self.send_request("tools/call", {"name": tool_name, "arguments": arguments})
+        return result_text(response)
+
     def close(self):
-        """Close the server connection."""
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
-            self.process = None
-            self.connected = False
+        """Detach this session; the shared pool keeps serving other sessions."""
+        self.pool = None
+        self.connected = False
+
+
+def _latency_summary(latency_ms):
+    if not latency_ms:
+        return "–"
+    return f"{latency_ms['p50']:.1f} / {latency_ms['p90']:.1f} / {latency_ms['p99']:.1f} ms"
+
+
+def render_batch_stats(progress):
+    """Rows done, errors, rows/sec and latency percentiles of a batch."""
+    cols = st.columns(4)
+    cols[0].metric("Rows", f"{progress.completed} / {progress.total}")
+    cols[1].metric("Errors", progress.errors)
+    cols[2].metric("Rows/sec", f"{progress.rows_per_second:,.0f}")
+    cols[3].metric("Latency p50 / p90 / p99", _latency_summary(progress.latency_ms))
+
+
+def render_batch_page(client):
+    """Run many calculations at once: pipelined against the server pool, with live progress."""
+    st.markdown("## 📦 Batch Calculations")
+    source = st.radio("Input", ["📄 Upload CSV", "✍️ Paste expressions"], horizontal=True)
+    if source == "📄 Upload CSV":
+        uploaded = st.file_uploader("CSV with operation, a, b columns (header optional)", type=["csv"])
+        rows = parse_csv(uploaded.getvalue().decode("utf-8-sig")) if uploaded else []
+    else:
+        text = st.text_area("One expression per line (numbers, + - * / and parentheses)",
+                            "100 + 50\n12 * (2 - 0.5)\n144 / 12\n10 / 0", height=200)
+        rows = parse_expressions(text)
+    in_flight = st.slider("Requests in flight", min_value=1, max_value=256, value=DEFAULT_IN_FLIGHT,
+                          help="Calls kept outstanding at once, spread over the server pool")
+    invalid = sum(row.error is not None for row in rows)
+    st.caption(f"{len(rows)} rows" + (f", {invalid} of which cannot be sent (reported as errors)" if invalid else ""))
+
+    if st.button("▶️ Run batch", type="primary", disabled=not rows):
+        progress_bar = st.progress(0.0, text="Starting...")
+        stats = st.empty()
+        preview = st.empty()
+        run = BatchRun(client.pool, rows, in_flight, REQUEST_TIMEOUT)
+        for progress in run:
+            # Redraw only fixed-size summaries; the full table is drawn once, page by page, at the end.
+            progress_bar.progress(progress.completed / progress.total,
+                                  text=f"{progress.completed} of {progress.total} rows")
+            with stats.container():
+                render_batch_stats(progress)
+            preview.dataframe(run.recent_results()[:BATCH_PREVIEW_ROWS], use_container_width=True)
+        preview.empty()
+        st.session_state.batch = {"progress": progress, "results": run.results, "csv": to_csv(run.results)}
+        st.rerun()
+
+    batch = st.session_state.get("batch")
+    if batch:
+        st.markdown("### Results")
+        progress = batch["progress"]
+        render_batch_stats(progress)
+        st.caption(f"Finished in {progress.elapsed:.2f}s")
+        st.download_button("⬇️ Download results (CSV)", batch["csv"], file_name="batch_results.csv",
+                           mime="text/csv")
+        only_errors = st.checkbox("Show only errors")
+        results = [result for result in batch["results"] if result is not None]
+        if only_errors:
+            results = [result for result in results if result["error"]]
+        pages = max(1, -(-len(results) // BATCH_PAGE_ROWS))
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+        start = (page - 1) * BATCH_PAGE_ROWS
+        st.dataframe(results[start:start + BATCH_PAGE_ROWS], use_container_width=True)
+
 
 def main():
     """Main Streamlit application."""
@@ -179,11 +226,11 @@ def main():
                 else:
                     st.error("❌ Failed to start server")
         
-        if st.button("🛑 Stop Server"):
+        if st.button("🔌 Disconnect"):
             st.session_state.client.close()
             st.session_state.server_info = None
             st.session_state.tools = []
-            st.success("✅ Server stopped")
+            st.success("✅ Disconnected")
             st.rerun()
         
         # Server status
@@ -193,9 +240,16 @@ def main():
             if st.session_state.server_info:
                 st.info(f"**Name:** {st.session_state.server_info['name']}")
                 st.info(f"**Version:** {st.session_state.server_info['version']}")
+            pool_stats = st.session_state.client.pool.stats()
+            st.info(f"**Servers:** {len(pool_stats['members'])} shared by all sessions "
+                    f"({pool_stats['restarts']} restarted)")
         else:
             st.error("🔴 Disconnected")
         
+        if st.session_state.client.connected:
+            st.markdown("## 🗂️ Page")
+            st.session_state.page = st.radio("Page", ["🧮 Calculator", "📦 Batch"], label_visibility="collapsed")
+        
         # About section
         st.markdown("## 📖 About")
         st.markdown("""
@@ -208,6 +262,7 @@ def main():
         - ➖ Subtraction  
         - ✖️ Multiplication
         - ➗ Division
+        - 📦 Batch runs from CSV or pasted expressions
         - 🛡️ Error handling
         """)
     
@@ -253,6 +308,9 @@ async def handle_request(self, request):
         return {"jsonrpc": "2.0", "id": request["id"], "result": result}
             ''', language='python')
     
+    elif st.session_state.get("page") == "📦 Batch":
+        render_batch_page(st.session_state.client)
+    
     else:
         # Server is connected, show calculator interface
         st.markdown("## 🔧 Available Tools")
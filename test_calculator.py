@@ -3,50 +3,641 @@
 Test Calculator MCP Server
 """
 
-import subprocess
+import asyncio
+import io
 import json
+import math
+import os
+import signal
+import socket
+import subprocess
 import sys
+import tempfile
+import threading
 import time
+from array import array
+
+from batch_jobs import BatchRun, parse_csv, parse_expressions, to_csv
+from framing import CODECS, compact_arrays, frame, negotiate, read_frame_sync, unpack_arrays
+from mcp_client import Client, result_text, structured_result, wait_for_ready_file
+from server_pool import ServerPool
+from shared_arrays import SharedArray
+from streaming_json import loads
+
+def check_supervisor():
+    """Supervise a TCP calculator from a scratch mcp_config.json; restart it over the control socket."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "mcp_config.json"), "w") as f:
+            json.dump({"mcpServers": {"calculator": {
+                "command": sys.executable, "args": ["calculator_server.py", "--tcp", "127.0.0.1:0"], "cwd": here,
+            }}}, f)
+        control_socket = os.path.join(directory, "control.sock")
+        supervisor = subprocess.Popen(
+            [sys.executable, os.path.join(here, "start_server.py"), "--supervise", "--control-socket", control_socket],
+            cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            with Client.connect(path=control_socket, wait=10) as control:
+                def wait_until_ready(previous_pid=None):
+                    deadline = time.monotonic() + 15
+                    while time.monotonic() < deadline:
+                        server = control.request("supervisor/status", timeout=5)["result"]["servers"][0]
+                        if server["ready"] and server["pid"] != previous_pid:
+                            return server["pid"]
+                        time.sleep(0.1)
+                    raise TimeoutError("supervised server did not become ready")
+
+                first = wait_until_ready()
+                control.request("supervisor/restart", {"name": "calculator"}, timeout=15)
+                second = wait_until_ready(first)
+                control.request("supervisor/shutdown", timeout=5)
+            supervisor.wait(timeout=15)
+            return f"calculator ready as pid {first}, restarted as pid {second}"
+        finally:
+            if supervisor.poll() is None:
+                supervisor.terminate()
+                supervisor.wait()
+
+def check_zygote():
+    """Fork two sessions from a zygote and make sure each answers, honours the zygote's flags and exits cleanly."""
+    with tempfile.TemporaryDirectory() as directory:
+        path, ready_file = os.path.join(directory, "zygote.sock"), os.path.join(directory, "ready.json")
+        zygote = subprocess.Popen([sys.executable, "calculator_server.py", "--zygote", path, "--ready-file", ready_file,
+                                   "--rate-limit", "1", "--rate-burst", "3"],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_ready_file(ready_file, timeout=30, process=zygote)
+            results, limited = [], []
+            for n in (1, 2):
+                with Client.fork(path) as session:
+                    session.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+                    results.append(result_text(session.call_tool("add", {"a": n, "b": 40}, timeout=10)))
+                    responses = session.batch([("tools/call", {"name": "add", "arguments": {"a": n, "b": 1}})] * 5,
+                                              timeout=10)
+                    limited.append(sum(response.get("error", {}).get("data", {}).get("reason") == "rate_limited"
+                                       for response in responses))
+                if session.process.returncode != 0:
+                    raise RuntimeError(f"forked session exited with {session.process.returncode}")
+            if not all(limited):
+                raise RuntimeError(f"forked sessions ignored the zygote's --rate-limit: {limited} calls limited")
+            return f"{results[-1]} ({len(results)} forked sessions, rate limited like the zygote)"
+        finally:
+            zygote.terminate()
+            zygote.wait()
+
+def check_admission():
+    """With one heavy lane and no queue, a burst of heavy calls is partly shed while light calls all succeed.
+
+    Shared-memory array tools and graphs with a heavy node count as heavy too.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        server = subprocess.Popen([sys.executable, "calculator_server.py", "--tcp", "127.0.0.1:0", "--ready-file",
+                                   ready_file, "--heavy-concurrency", "1", "--heavy-queue", "0"],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            host, _, port = wait_for_ready_file(ready_file, timeout=30, process=server)["address"].rpartition(":")
+            with Client.connect(host, int(port)) as client:
+                client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+                heavy = [("tools/call", {"name": "random_uniform", "arguments": {
+                    "count": 2_000_000, "seed": n, "output_path": os.path.join(directory, f"uniform-{n}.f64")}})
+                    for n in range(4)]
+                light = [("tools/call", {"name": "add", "arguments": {"a": n, "b": 1}}) for n in range(4)]
+                responses = client.batch(heavy + light, timeout=60)
+                shed = [response for response in responses[:4] if response.get("error", {}).get("code") == -32001]
+                if not shed or not all("result" in response for response in responses[4:]):
+                    raise RuntimeError(f"unexpected admission results: {responses}")
+                counters = client.request("server/metrics", timeout=10)["result"]["counters"]
+                with SharedArray.from_values([1.0] * 8) as values:
+                    graph = {"nodes": {"sample": {"tool": "random_uniform", "arguments": {"count": 2_000_000}}},
+                             "outputs": ["sample"]}
+                    behind = client.batch([heavy[0], ("tools/call", {"name": "compute_graph", "arguments": graph}),
+                                           ("tools/call", {"name": "array_reduce", "arguments": {
+                                               "array": values.descriptor, "operation": "sum"}})], timeout=60)
+                if [response.get("error", {}).get("code") for response in behind[1:]] != [-32001, -32001]:
+                    raise RuntimeError(f"graph and array calls were not admitted as heavy: {behind[1:]}")
+            return f"{len(shed)} of 4 heavy calls shed (retry after {shed[0]['error']['data']['retryAfterMs']} ms), " \
+                   f"4 of 4 light calls served; metrics count {counters.get('shed', 0)} shed; " \
+                   "heavy graphs and array tools shed alike"
+        finally:
+            server.terminate()
+            server.wait()
+
+def check_scheduling():
+    """An interactive heavy call overtakes another client's queued bulk calls; a chatty client is rate limited."""
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        server = subprocess.Popen([sys.executable, "calculator_server.py", "--tcp", "127.0.0.1:0", "--ready-file",
+                                   ready_file, "--heavy-concurrency", "1", "--heavy-queue", "16",
+                                   "--rate-limit", "2", "--rate-burst", "10"],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            host, _, port = wait_for_ready_file(ready_file, timeout=30, process=server)["address"].rpartition(":")
+            with Client.connect(host, int(port)) as bulk, Client.connect(host, int(port)) as interactive:
+                for client in (bulk, interactive):
+                    client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+                finished = []
+
+                def uniform(n, priority):
+                    return {"name": "random_uniform", "_meta": {"priority": priority}, "arguments": {
+                        "count": 2_000_000, "seed": n, "output_path": os.path.join(directory, f"uniform-{n}.f64")}}
+
+                jobs = [bulk.submit("tools/call", uniform(n, "bulk"), timeout=60) for n in range(6)]
+                for n, job in enumerate(jobs):
+                    job.add_done_callback(lambda _, n=n: finished.append(f"bulk-{n}"))
+                jobs[0].result()  # the rest are now queued behind the one running
+                urgent = interactive.submit("tools/call", uniform(6, "interactive"), timeout=60)
+                urgent.add_done_callback(lambda _: finished.append("interactive"))
+                if "result" not in urgent.result() or not all("result" in job.result() for job in jobs):
+                    raise RuntimeError(f"unexpected scheduling results: {urgent.result()}")
+                overtaken = len(jobs) - finished.index("interactive")
+                responses = interactive.batch([("tools/call", {"name": "add", "arguments": {"a": n, "b": 1}})
+                                               for n in range(15)], timeout=30)
+                limited = [response for response in responses
+                           if response.get("error", {}).get("data", {}).get("reason") == "rate_limited"]
+                if overtaken < 4 or not limited or "result" not in responses[0]:
+                    raise RuntimeError(f"unexpected scheduling order {finished} or rate limiting {responses}")
+            return f"interactive call overtook {overtaken} of 6 bulk calls; {len(limited)} of 15 rapid calls rate limited"
+        finally:
+            server.terminate()
+            server.wait()
+
+def check_structured_results():
+    """Tools return structuredContent matching their outputSchema; compact sessions get it without prose."""
+    with Client.spawn([sys.executable, "calculator_server.py"]) as verbose, \
+            Client.spawn([sys.executable, "calculator_server.py"]) as compact:
+        verbose.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+        compact.initialize({"name": "test-client", "version": "1.0"}, timeout=10, compact=True)
+        missing = [tool["name"] for tool in verbose.list_tools(timeout=10) if "outputSchema" not in tool]
+        if missing:
+            raise RuntimeError(f"tools without outputSchema: {missing}")
+        response = verbose.call_tool("add", {"a": 10, "b": 5}, timeout=10)
+        if structured_result(response) != {"result": 15.0} or "15.0" not in result_text(response):
+            raise RuntimeError(f"unexpected structured result: {response}")
+        response = compact.call_tool("add", {"a": 10, "b": 5}, timeout=10)
+        if response["result"]["content"] or structured_result(response) != {"result": 15.0}:
+            raise RuntimeError(f"unexpected compact result: {response}")
+        arguments = {"count": 1000, "seed": 7}
+        expected = structured_result(verbose.call_tool("random_uniform", arguments, timeout=10))["values"]
+        packed = compact.call_tool("random_uniform", arguments, timeout=10)
+        values = structured_result(packed)["values"]
+        if not isinstance(values, array) or values.tolist() != expected:
+            raise RuntimeError(f"compact array does not match: {packed}")
+        failed = compact.call_tool("divide", {"a": 1, "b": 0}, timeout=10)
+        if not failed["result"].get("isError") or result_text(failed) != "Error: Cannot divide by zero":
+            raise RuntimeError(f"unexpected tool error result: {failed}")
+    return f"1000 samples in {len(json.dumps(packed))} bytes compact vs {len(json.dumps(expected))} as a JSON list"
+
+def check_replay():
+    """Record a TCP server's traffic, then replay it at full speed against a fresh server and verify it."""
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        recording = os.path.join(directory, "traffic.jsonl")
+        server = subprocess.Popen([sys.executable, "calculator_server.py", "--tcp", "127.0.0.1:0", "--ready-file",
+                                   ready_file, "--record", recording],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            host, _, port = wait_for_ready_file(ready_file, timeout=30, process=server)["address"].rpartition(":")
+            with Client.connect(host, int(port)) as client:
+                client.initialize({"name": "test-client", "version": "1.0"}, timeout=10, compact=True)
+                client.batch([("tools/call", {"name": name, "arguments": {"a": n, "b": n % 3}})
+                              for n in range(50) for name in ("add", "divide")]
+                             + [("tools/call", {"name": "random_normal", "arguments": {"count": 20}})], timeout=30)
+        finally:
+            server.terminate()
+            server.wait()
+        report_path = os.path.join(directory, "report.json")
+        replay = subprocess.run([sys.executable, "replay.py", recording, "--speed", "max", "--json", report_path],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60)
+        with open(report_path) as f:
+            report = json.load(f)
+        if replay.returncode != 0 or report["verified"] != report["requests"] or report["requests"] != 102:
+            raise RuntimeError(f"replay did not verify: {report}")
+    return f"{report['requests']} recorded requests replayed and verified " \
+           f"(p99 {report['latency_ms']['p99']:.1f} ms round trip)"
+
+def check_tracing():
+    """Trace a TCP server's requests and check the propagated trace id and the per-phase spans."""
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    meta = {"traceparent": f"00-{trace_id}-{parent_id}-01"}
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        trace_path = os.path.join(directory, "trace.jsonl")
+        server = subprocess.Popen([sys.executable, "calculator_server.py", "--tcp", "127.0.0.1:0", "--ready-file",
+                                   ready_file, "--trace", trace_path],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            host, _, port = wait_for_ready_file(ready_file, timeout=30, process=server)["address"].rpartition(":")
+            with Client.connect(host, int(port)) as client:
+                client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+                client.request("tools/call", {"name": "add", "arguments": {"a": 1, "b": 2}, "_meta": meta},
+                               timeout=10)
+                client.request("tools/call", {"name": "random_uniform", "arguments": {"count": 200_000},
+                                              "_meta": meta}, timeout=30)
+        finally:
+            server.terminate()
+            server.wait()
+        with open(trace_path) as f:
+            traces = [json.loads(line) for line in f]
+    calls = {trace["tool"]: trace for trace in traces if trace["method"] == "tools/call"}
+    if len(traces) != 3 or set(calls) != {"add", "random_uniform"}:
+        raise RuntimeError(f"unexpected traces: {traces}")
+    phases = ["read", "parse", "validate", "queue", "compute", "serialize", "write"]
+    for tool, trace in calls.items():
+        names = [span["name"] for span in trace["spans"]]
+        if trace["traceId"] != trace_id or trace["parentId"] != parent_id or not set(phases) <= set(names):
+            raise RuntimeError(f"bad trace for {tool}: {trace}")
+    if "pool" not in [span["name"] for span in calls["random_uniform"]["spans"]]:
+        raise RuntimeError(f"no pool span: {calls['random_uniform']}")
+    pool = next(span["ms"] for span in calls["random_uniform"]["spans"] if span["name"] == "pool")
+    return f"{len(traces)} requests traced with the caller's trace id " \
+           f"(random_uniform: {calls['random_uniform']['ms']:.1f} ms, {pool:.1f} ms in the pool)"
+
+def check_diagnostics():
+    """Enable the admin methods on a live server with SIGUSR2, then profile it and inspect its memory."""
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        token_file = os.path.join(directory, "admin.token")
+        server = subprocess.Popen([sys.executable, "calculator_server.py", "--tcp", "127.0.0.1:0", "--ready-file",
+                                   ready_file, "--admin-token-file", token_file],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            ready = wait_for_ready_file(ready_file, timeout=30, process=server)
+            host, _, port = ready["address"].rpartition(":")
+            with Client.connect(host, int(port)) as admin, Client.connect(host, int(port)) as client:
+                admin.initialize({"name": "admin", "version": "1.0"}, timeout=10)
+                client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+                if admin.request("admin/memory", {}, timeout=10)["error"]["code"] != -32601:
+                    raise RuntimeError("admin methods answered before they were enabled")
+                os.kill(ready["pid"], signal.SIGUSR2)
+                deadline = time.monotonic() + 10
+                while not os.path.exists(token_file) and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                with open(token_file) as f:
+                    token = f.read().strip()
+                if admin.request("admin/memory", {"token": "wrong"}, timeout=10)["error"]["code"] != -32003:
+                    raise RuntimeError("admin methods accepted a wrong token")
+
+                def load():
+                    for n in range(300):
+                        client.request("tools/call", {"name": "add", "arguments": {"a": n, "b": 1}}, timeout=10)
+
+                admin.request("admin/tracemalloc/start", {"token": token}, timeout=10)
+                admin.request("admin/tracemalloc/snapshot", {"token": token}, timeout=30)
+                admin.request("admin/profile/start", {"token": token}, timeout=10)
+                load()
+                profile = admin.request("admin/profile/stop", {"token": token, "top": 50}, timeout=10)["result"]
+                worker = threading.Thread(target=load)
+                worker.start()
+                sample = admin.request("admin/sample", {"token": token, "seconds": 0.5, "intervalMs": 2},
+                                       timeout=30)["result"]
+                worker.join()
+                diff = admin.request("admin/tracemalloc/diff", {"token": token}, timeout=30)["result"]
+                admin.request("admin/tracemalloc/stop", {"token": token}, timeout=10)
+                memory = admin.request("admin/memory", {"token": token, "collect": True}, timeout=10)["result"]
+                os.kill(ready["pid"], signal.SIGUSR2)
+                deadline = time.monotonic() + 10
+                while os.path.exists(token_file) and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                if admin.request("admin/memory", {"token": token}, timeout=10)["error"]["code"] != -32601:
+                    raise RuntimeError("admin methods still answered after being disabled")
+        finally:
+            server.terminate()
+            server.wait()
+    if not any(entry["function"].startswith("dispatch ") and entry["calls"] >= 300 for entry in profile["functions"]):
+        raise RuntimeError(f"profile missed the requests: {profile['functions'][:5]}")
+    if not sample["samples"] or not all(line.rpartition(" ")[2].isdigit() for line in sample["collapsed"].splitlines()):
+        raise RuntimeError(f"bad sample: {sample}")
+    if not diff["top"] or not memory["gc"]["generations"] or (memory["rssBytes"] or 1) <= 0:
+        raise RuntimeError(f"bad memory report: {diff}, {memory}")
+    return f"{profile['totalCalls']} calls profiled, {sample['samples']} stack samples, " \
+           f"RSS {(memory['rssBytes'] or 0) / 1048576:.0f} MB"
+
+def check_soak():
+    """A short soak of a stdio server with every kind of traffic, including malformed and huge lines."""
+    with tempfile.TemporaryDirectory() as directory:
+        report_path = os.path.join(directory, "soak.json")
+        # A few thousand requests are too few to measure drift, so slopes are reported but not enforced.
+        soak = subprocess.run([sys.executable, "soak.py", "--requests", "3000", "--sample-every", "0.3", "--seed", "7",
+                               "--huge-bytes", "65536", "--quiet", "--json", report_path],
+                              stdout=subprocess.DEVNULL, timeout=120)
+        with open(report_path) as f:
+            report = json.load(f)
+    if soak.returncode != 0 or report["wrong"] or report["requests"] != 3000 or len(report["samples"]) < 3 \
+            or report["slopes_enforced"]:
+        raise RuntimeError(f"soak failed: {report['failures']} {report['wrong_examples']}")
+    if not {"malformed", "cancel", "divide_by_zero", "unknown_method"} <= set(report["kinds"]):
+        raise RuntimeError(f"soak mix missed some kinds: {report['kinds']}")
+    return f"{report['requests']} mixed requests at {report['requests_per_second']:.0f} req/s, " \
+           f"fd growth {report['slopes_per_million']['fds']:+g} per million"
+
+def check_streaming_json():
+    """Requests past --stream-threshold-mb are decoded as they are read, over stdio and TCP."""
+    # Numbers packed before a non-number turns up come back as json.loads would give them.
+    for document in (b'{"a": [1.5, 2, "x"]}', b'[1, 2, ' + str(2 ** 60 + 1).encode() + b', 0.5, null]'):
+        if loads(document, array_min=2) != json.loads(document):
+            raise RuntimeError(f"streamed {document!r} decoded to {loads(document, array_min=2)}")
+    cashflows = [-1000.0] + [1.0 + n / 7 for n in range(20_000)]
+    expected = math.fsum(flow / 1.01 ** t for t, flow in enumerate(cashflows))
+    with Client.spawn([sys.executable, "calculator_server.py", "--stream-threshold-mb", "0.01"]) as client:
+        client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+        value = structured_result(client.call_tool("npv", {"rate": 0.01, "cashflows": cashflows}, timeout=30))["result"]
+        # A streamed array where a number belongs is refused without echoing the array back.
+        misplaced = result_text(client.call_tool("add", {"a": cashflows, "b": 1}, timeout=30))
+    if not math.isclose(value, expected, rel_tol=1e-9):
+        raise RuntimeError(f"streamed npv over stdio was {value}, expected {expected}")
+    if misplaced != "Error: 'a' expected a number, got array":
+        raise RuntimeError(f"array passed as a number got {misplaced[:200]!r}")
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        server = subprocess.Popen([sys.executable, "calculator_server.py", "--tcp", "127.0.0.1:0", "--ready-file",
+                                   ready_file, "--stream-threshold-mb", "0.01"],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            host, _, port = wait_for_ready_file(ready_file, timeout=30, process=server)["address"].rpartition(":")
+            with socket.create_connection((host, int(port)), timeout=30) as sock:
+                # A malformed line past the threshold is answered with a parse error and the connection carries on.
+                broken = b'{"jsonrpc": "2.0", "id": 1, "method": "ping", "params": {"x": [' + b"1.5, " * 10_000 + b"oops]}}\n"
+                request = {"jsonrpc": "2.0", "id": 2, "method": "tools/call",
+                           "params": {"name": "npv", "arguments": {"rate": 0.01, "cashflows": cashflows}}}
+                sock.sendall(broken + json.dumps(request).encode() + b"\n")
+                replies = sock.makefile("rb")
+                error, response = json.loads(replies.readline()), json.loads(replies.readline())
+        finally:
+            server.terminate()
+            server.wait()
+    if error.get("error", {}).get("code") != -32700:
+        raise RuntimeError(f"malformed streamed line got {error}")
+    if not math.isclose(structured_result(response)["result"], expected, rel_tol=1e-9):
+        raise RuntimeError(f"streamed npv over TCP got {response}")
+    return f"npv of {len(cashflows)} cash flows decoded while reading over stdio and TCP; bad line rejected"
+
+def check_batch_jobs():
+    """A batch of CSV rows and expressions runs pipelined over a pool, with errors and CSV export per row."""
+    rows = parse_csv("b,operation,a\n" + "".join(f"{n},add,{n}\n" for n in range(500)) + "1,power,2\nx,add,1\n")
+    rows += parse_expressions("12 * (2 - 0.5)  # a graph\n-(3 + 2) * 4\n10 / 0\nimport os\n")
+    with ServerPool([sys.executable, "calculator_server.py"], min_size=2) as pool:
+        run = BatchRun(pool, rows, in_flight=16, update_interval=0.01)
+        updates = list(run)
+    final = updates[-1]
+    results = [result["result"] for result in run.results]
+    if not final.finished or final.total != len(rows) or results[:500] != [2.0 * n for n in range(500)]:
+        raise RuntimeError(f"batch results were wrong: {final}, {results[:5]}")
+    if results[502:504] != [18.0, -20.0] or final.errors != 4 or "zero" not in run.results[504]["error"]:
+        raise RuntimeError(f"batch errors were wrong: {run.results[500:]}")
+    exported = to_csv(run.results).splitlines()
+    if len(exported) != len(rows) + 1 or not exported[1].startswith("1,"):
+        raise RuntimeError(f"bad CSV export: {exported[:3]}")
+    return f"{final.total} rows ({final.errors} errors) at {final.rows_per_second:.0f} rows/s, " \
+           f"p99 {final.latency_ms['p99']:.1f} ms, {len(updates)} progress updates"
+
+def check_graph_random_nodes():
+    """Unseeded random nodes in a calculation graph are drawn independently; seeded ones may be shared.
+
+    A reference that is not a node id string is rejected with a clear error.
+    """
+    with Client.spawn([sys.executable, "calculator_server.py"]) as client:
+        client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+        graph = {"nodes": {"x": {"tool": "random_uniform", "arguments": {"count": 1}},
+                           "y": {"tool": "random_uniform", "arguments": {"count": 1}},
+                           "p": {"tool": "random_normal", "arguments": {"count": 1, "seed": 3}},
+                           "q": {"tool": "random_normal", "arguments": {"count": 1, "seed": 3}}},
+                 "outputs": ["x", "y", "p", "q"]}
+        results = structured_result(client.call_tool("compute_graph", graph, timeout=30))["results"]
+        bad_ref = result_text(client.call_tool("compute_graph", {
+            "nodes": {"a": {"tool": "add", "arguments": {"a": {"ref": [1]}, "b": 1}}}, "outputs": ["a"]
+        }, timeout=10))
+    if "must be node id strings" not in bad_ref:
+        raise RuntimeError(f"non-string ref got {bad_ref!r}")
+    if results["x"] == results["y"]:
+        raise RuntimeError(f"unseeded nodes were collapsed: {results}")
+    if results["p"] != results["q"]:
+        raise RuntimeError(f"seeded nodes disagree: {results}")
+    return f"unseeded draws {results['x'][0]:.4f} and {results['y'][0]:.4f} kept apart"
+
+def check_http_limits():
+    """HTTP rejects bad Content-Length headers and sessionless requests, and expires sessions left idle or beyond the cap."""
+    def post(port, headers, body=b""):
+        with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+            sock.sendall(b"POST /mcp HTTP/1.1\r\nHost: localhost\r\n" + headers + b"\r\n" + body)
+            status_line, *header_lines = sock.makefile("rb").read().split(b"\r\n\r\n", 1)[0].split(b"\r\n")
+        fields = dict(line.decode().lower().split(": ", 1) for line in header_lines)
+        return int(status_line.split()[1]), fields
+
+    def rpc(port, message, session_id=None):
+        body = json.dumps(message).encode()
+        extra = f"Mcp-Session-Id: {session_id}\r\n".encode() if session_id else b""
+        return post(port, b"Content-Type: application/json\r\nConnection: close\r\n" + extra +
+                    f"Content-Length: {len(body)}\r\n".encode(), body)
+
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        server = subprocess.Popen([sys.executable, "calculator_server.py", "--http", "127.0.0.1:0", "--ready-file",
+                                   ready_file, "--idle-timeout", "1", "--max-sessions", "1"],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            port = int(wait_for_ready_file(ready_file, timeout=30, process=server)["address"].rpartition(":")[2])
+            statuses = [post(port, b"Content-Length: " + length + b"\r\n")[0]
+                        for length in (b"abc", b"-5", b"+5", b"5_0", str(10 ** 12).encode())]
+            initialize = {"jsonrpc": "2.0", "id": 1, "method": "initialize",
+                          "params": {"clientInfo": {"name": "test-client", "version": "1.0"}}}
+            ping = {"jsonrpc": "2.0", "id": 2, "method": "ping"}
+            evicted_id = rpc(port, initialize)[1]["mcp-session-id"]
+            status, fields = rpc(port, initialize)
+            session_id = fields["mcp-session-id"]
+            evicted = rpc(port, ping, evicted_id)[0]
+            sessionless = rpc(port, ping)[0]
+            fresh = rpc(port, ping, session_id)[0]
+            time.sleep(1.5)
+            expired = rpc(port, ping, session_id)[0]
+        finally:
+            server.terminate()
+            server.wait()
+    if statuses != [400, 400, 400, 400, 413]:
+        raise RuntimeError(f"Content-Length abc, -5, +5, 5_0 and 10**12 got {statuses}")
+    if (status, evicted, sessionless, fresh, expired) != (200, 404, 400, 200, 404):
+        raise RuntimeError(f"session lifecycle got initialize {status}, evicted ping {evicted}, "
+                           f"sessionless ping {sessionless}, ping {fresh}, idle ping {expired}")
+    return "bad Content-Length rejected with 400/413; sessionless request rejected with 400; " \
+           "sessions beyond the cap or left idle expired with 404"
+
+def check_socket_transport():
+    """A socket connection runs requests concurrently, extra connections are refused and idle ones are closed."""
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        server = subprocess.Popen([sys.executable, "calculator_server.py", "--tcp", "127.0.0.1:0", "--ready-file",
+                                   ready_file, "--max-connections", "1", "--idle-timeout", "1"],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            host, _, port = wait_for_ready_file(ready_file, timeout=30, process=server)["address"].rpartition(":")
+            with Client.connect(host, int(port)) as client:
+                client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+                finished = []
+                slow = client.submit("tools/call", {"name": "random_uniform", "arguments": {
+                    "count": 2_000_000, "seed": 1, "output_path": os.path.join(directory, "uniform.f64")}}, timeout=60)
+                slow.add_done_callback(lambda _: finished.append("slow"))
+                fast = client.submit("tools/call", {"name": "add", "arguments": {"a": 1, "b": 2}}, timeout=60)
+                fast.add_done_callback(lambda _: finished.append("fast"))
+                if "result" not in fast.result() or "result" not in slow.result():
+                    raise RuntimeError(f"concurrent calls failed: {fast.result()} {slow.result()}")
+                with socket.create_connection((host, int(port)), timeout=10) as extra:
+                    refused = json.loads(extra.makefile("rb").readline())
+            time.sleep(0.2)  # let the server notice the first client left
+            with socket.create_connection((host, int(port)), timeout=10) as idle:
+                started = time.monotonic()
+                closed = idle.recv(1) == b""
+                waited = time.monotonic() - started
+        finally:
+            server.terminate()
+            server.wait()
+    if finished != ["fast", "slow"]:
+        raise RuntimeError(f"requests on one connection finished in order {finished}")
+    if refused.get("error", {}).get("message") != "Too many connections":
+        raise RuntimeError(f"second connection got {refused}")
+    if not closed or not 0.5 < waited < 5:
+        raise RuntimeError(f"idle connection closed={closed} after {waited:.1f}s")
+    return f"add overtook a slow call on one connection; extra connection refused; idle one closed after {waited:.1f}s"
+
+def check_workers():
+    """Two workers share one address (IPv6 where available); SIGHUP replaces both without refusing requests."""
+    endpoint = "[::1]:0" if socket.has_ipv6 else "127.0.0.1:0"
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        log_path = os.path.join(directory, "supervisor.log")
+        with open(log_path, "w") as log:
+            supervisor = subprocess.Popen([sys.executable, "calculator_server.py", "--tcp", endpoint, "--workers", "2",
+                                           "--ready-file", ready_file], stdin=subprocess.DEVNULL, stderr=log)
+        try:
+            host, _, port = wait_for_ready_file(ready_file, timeout=60, process=supervisor)["address"].rpartition(":")
+            host = host.strip("[]")
+
+            def call(n):
+                with Client.connect(host, int(port)) as client:
+                    client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+                    result = client.call_tool("add", {"a": n, "b": 1}, timeout=10)
+                    return result, client.request("server/metrics", timeout=10)["result"]["processes"]
+
+            before = [call(n) for n in range(4)]
+            supervisor.send_signal(signal.SIGHUP)
+            during = []
+            deadline = time.monotonic() + 60
+            while "reload complete" not in open(log_path).read():
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"reload did not complete: {open(log_path).read()}")
+                during.append(call(len(during)))
+            time.sleep(0.5)  # let the retired workers drain and drop their metrics
+            after = [call(n) for n in range(4)]
+        finally:
+            supervisor.terminate()
+            supervisor.wait(timeout=60)
+    failed = [result for result, _ in before + during + after if "result" not in result]
+    if failed or {processes for _, processes in before + after} != {2}:
+        raise RuntimeError(f"calls failed {failed} or saw processes {before + after}")
+    return f"2 workers on {endpoint}; SIGHUP reload served {len(during)} calls mid-reload without errors"
 
-def send_request(process, request):
-    """Send a request and get response."""
-    process.stdin.write(json.dumps(request) + "\n")
-    process.stdin.flush()
-    response = process.stdout.readline()
-    return json.loads(response) if response.strip() else None
+def check_framing():
+    """Every installed encoding is negotiated and round-trips packed arrays, framed and through a server."""
+    checked, skipped = [], [name for name in ("msgpack", "cbor") if name not in CODECS]
+    for name, codec in CODECS.items():
+        binary = name != "json"
+        if binary and negotiate({"capabilities": {"experimental": {"encodings": ["json", name]}}}) != name:
+            raise RuntimeError(f"{name} was not negotiated")
+        message = {"id": 1, "result": compact_arrays({"floats": [n / 4 for n in range(10)], "ints": list(range(10)),
+                                                      "short": [1.5, 2]}, binary)}
+        stream = io.BytesIO(frame(codec.encode(message)) * 2)
+        decoded = [unpack_arrays(codec.decode(read_frame_sync(stream))) for _ in range(2)]
+        if read_frame_sync(stream) is not None or any(
+                (value["floats"], value["ints"], value["short"]) != (array("d", [n / 4 for n in range(10)]),
+                                                                     array("q", range(10)), [1.5, 2])
+                for value in (item["result"] for item in decoded)):
+            raise RuntimeError(f"{name} round trip gave {decoded}")
+        with Client.spawn([sys.executable, "calculator_server.py"]) as client:
+            client.initialize({"name": "test-client", "version": "1.0"}, encodings=[name], compact=True, timeout=10)
+            values = structured_result(client.call_tool("random_uniform", {"count": 16, "seed": 3}, timeout=10))
+        if not isinstance(values["values"], array) or len(values["values"]) != 16:
+            raise RuntimeError(f"{name} server round trip gave {values}")
+        checked.append(name)
+    return f"{', '.join(checked)} round-tripped packed arrays" + (f"; {', '.join(skipped)} not installed" if skipped else "")
+
+def check_cancellation():
+    """A call that times out on the client is cancelled on the server, while still queued for a heavy slot."""
+    with tempfile.TemporaryDirectory() as directory:
+        ready_file = os.path.join(directory, "ready.json")
+        server = subprocess.Popen([sys.executable, "calculator_server.py", "--tcp", "127.0.0.1:0", "--ready-file",
+                                   ready_file, "--heavy-concurrency", "1"],
+                                  stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            host, _, port = wait_for_ready_file(ready_file, timeout=30, process=server)["address"].rpartition(":")
+            with Client.connect(host, int(port)) as client:
+                client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+
+                def uniform(n):
+                    return {"name": "random_uniform", "arguments": {
+                        "count": 4_000_000, "seed": n, "output_path": os.path.join(directory, f"uniform-{n}.f64")}}
+
+                running = client.submit("tools/call", uniform(1), timeout=60)
+                try:
+                    client.request("tools/call", uniform(2), timeout=0.05)
+                    abandoned = "answered"
+                except asyncio.TimeoutError:
+                    abandoned = "timed out"
+                if "result" not in running.result():
+                    raise RuntimeError(f"running call failed: {running.result()}")
+                counters = client.request("server/metrics", timeout=10)["result"]["counters"]
+                written = sorted(name for name in os.listdir(directory) if name.startswith("uniform-"))
+        finally:
+            server.terminate()
+            server.wait()
+    if abandoned != "timed out" or counters.get("cancelled") != 1 or written != ["uniform-1.f64"]:
+        raise RuntimeError(f"queued call {abandoned}, cancelled count {counters.get('cancelled')}, wrote {written}")
+    return "queued heavy call cancelled by notifications/cancelled before it ran"
+
+def check_shared_array_elementwise():
+    """array_elementwise writes into a client-owned output, or hands off a server segment the client releases."""
+    with Client.spawn([sys.executable, "calculator_server.py"]) as client:
+        client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+        with SharedArray.from_values([1.0, 2.0, 3.0]) as values, SharedArray.from_values([4.0, 5.0, 6.0]) as other, \
+                SharedArray.create("float64", (3,)) as output:
+            client.call_tool("array_elementwise", {"operation": "multiply", "array": values.descriptor, "operand": 2,
+                                                   "output": output.descriptor}, timeout=10)
+            inline = output.tolist()
+            handed_off = structured_result(client.call_tool("array_elementwise", {
+                "operation": "add", "array": values.descriptor, "operand_array": other.descriptor
+            }, timeout=10))["output"]
+            with SharedArray.attach(handed_off) as result:
+                summed = result.tolist()
+        owned = client.request("shm/segments", timeout=10)["result"]["segments"]
+        released = client.request("shm/release", {"name": handed_off["shm"]}, timeout=10)["result"]["released"]
+        left = client.request("shm/segments", timeout=10)["result"]["segments"]
+    if inline != [2.0, 4.0, 6.0] or summed != [5.0, 7.0, 9.0]:
+        raise RuntimeError(f"elementwise results were {inline} and {summed}")
+    if [segment["name"] for segment in owned] != [handed_off["shm"]] or not released or left:
+        raise RuntimeError(f"handed-off segment was not released: {owned} -> {left}")
+    return "multiply into a client-owned segment, add into a handed-off segment released with shm/release"
+
+def check_long_irr():
+    """irr converges on a 360-period schedule whose discount factors underflow near -100%."""
+    cashflows = [-100000] + [600] * 360
+    with Client.spawn([sys.executable, "calculator_server.py"]) as client:
+        client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
+        rate = structured_result(client.call_tool("irr", {"cashflows": cashflows}, timeout=30))["result"]
+        value = structured_result(client.call_tool("npv", {"rate": rate, "cashflows": cashflows}, timeout=30))["result"]
+    if not math.isclose(rate, 0.0050058, rel_tol=1e-4) or abs(value) > 1e-3:
+        raise RuntimeError(f"30-year monthly IRR was {rate} with NPV {value}")
+    return f"30-year monthly schedule: IRR {rate:.6f}/period, NPV at IRR {value:.2e}"
 
 def main():
     print("🧮 Calculator MCP Server Test")
     print("=" * 35)
     
     # Start server
-    process = subprocess.Popen(
-        [sys.executable, "calculator_server.py"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1
-    )
+    client = Client.spawn([sys.executable, "calculator_server.py"])
     
     try:
-        # Wait for server to start
-        time.sleep(0.5)
-        
-        # 1. Initialize
+        # 1. Initialize (the response doubles as the readiness handshake; no fixed sleep)
         print("1️⃣ Initializing server...")
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "test-client", "version": "1.0"}
-            }
-        }
-        
-        response = send_request(process, init_request)
+        response = client.initialize({"name": "test-client", "version": "1.0"}, timeout=10)
         if response and "result" in response:
             server_name = response["result"]["serverInfo"]["name"]
             print(f"   ✅ Connected to: {server_name}")
@@ -56,13 +647,7 @@ def main():
         
         # 2. List tools
         print("\n2️⃣ Listing available tools...")
-        tools_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/list"
-        }
-        
-        response = send_request(process, tools_request)
+        response = client.request("tools/list", timeout=10)
         if response and "result" in response:
             tools = response["result"]["tools"]
             print(f"   ✅ Found {len(tools)} tools:")
@@ -72,33 +657,129 @@ def main():
             print(f"   ❌ List tools failed: {response}")
             return
         
+        # Small raw float64 dataset for the memory-mapped tools
+        dataset_path = os.path.join(tempfile.mkdtemp(), "values.f64")
+        with open(dataset_path, "wb") as f:
+            f.write(array("d", [1.5, 2.5, 3.5, 4.5]).tobytes())
+        csv_path = os.path.join(os.path.dirname(dataset_path), "orders.csv")
+        with open(csv_path, "w") as f:
+            f.write("price,qty\n10,2\n2.5,4\n7,3\n")
+        shared = SharedArray.from_values([1.0, 2.0, 3.0, 4.0])
+        
         # 3. Test all operations
         operations = [
             ("add", {"a": 15, "b": 7}, "Addition"),
             ("subtract", {"a": 20, "b": 8}, "Subtraction"),
             ("multiply", {"a": 6, "b": 9}, "Multiplication"),
             ("divide", {"a": 48, "b": 6}, "Division"),
-            ("divide", {"a": 10, "b": 0}, "Division by zero (error test)")
+            ("divide", {"a": 10, "b": 0}, "Division by zero (error test)"),
+            ("compute_graph", {
+                "nodes": {
+                    "sum": {"tool": "add", "arguments": {"a": 2, "b": 3}},
+                    "same_sum": {"tool": "add", "arguments": {"b": 3, "a": 2}},
+                    "product": {"tool": "multiply", "arguments": {"a": {"ref": "sum"}, "b": {"ref": "same_sum"}}}
+                },
+                "outputs": ["product"]
+            }, "Calculation graph"),
+            ("dataset_reduce", {"path": dataset_path, "operation": "mean"}, "Dataset mean"),
+            ("dataset_elementwise", {
+                "path": dataset_path, "operation": "multiply", "operand": 2,
+                "output_path": dataset_path + ".doubled"
+            }, "Dataset elementwise multiply"),
+            ("bulk_compute", {
+                "path": csv_path, "output_path": csv_path + ".out",
+                "expression": "price * qty", "chunk_rows": 2
+            }, "Bulk CSV compute"),
+            ("random_uniform", {"count": 3, "seed": 7}, "Seeded uniform samples"),
+            ("monte_carlo", {
+                "expression": "x * x",
+                "variables": {"x": {"distribution": "uniform", "low": 0, "high": 1}},
+                "samples": 20000, "seed": 7
+            }, "Monte Carlo estimate"),
+            ("amortization_schedule", {
+                "principal": 1000, "annual_rate": 0.12, "periods": 3
+            }, "Amortization schedule"),
+            ("irr", {"cashflows": [-100, 50, 60]}, "Internal rate of return"),
+            ("array_reduce", {"array": shared.descriptor, "operation": "sum"}, "Shared-memory array sum")
         ]
         
-        for i, (operation, args, description) in enumerate(operations, 3):
+        # All calls are pipelined on one connection; responses are matched by id.
+        responses = client.batch(
+            [("tools/call", {"name": operation, "arguments": args}) for operation, args, _ in operations],
+            timeout=60
+        )
+        for i, ((operation, args, description), response) in enumerate(zip(operations, responses), 3):
             print(f"\n{i}️⃣ Testing {description}...")
-            request = {
-                "jsonrpc": "2.0",
-                "id": i,
-                "method": "tools/call",
-                "params": {
-                    "name": operation,
-                    "arguments": args
-                }
-            }
-            
-            response = send_request(process, request)
             if response and "result" in response:
-                result_text = response["result"]["content"][0]["text"]
-                print(f"   ✅ {result_text}")
+                print(f"   ✅ {result_text(response)}")
             else:
                 print(f"   ❌ {description} failed: {response}")
+        shared.unlink()
+        
+        print("\n🔁 Testing server pool...")
+        with ServerPool([sys.executable, "calculator_server.py"], min_size=2) as pool:
+            responses = pool.batch(
+                [("tools/call", {"name": "multiply", "arguments": {"a": n, "b": 2}}) for n in range(20)],
+                timeout=30
+            )
+            print(f"   ✅ {result_text(responses[-1])} ({len(pool.stats()['members'])} servers)")
+        
+        print("\n🛡️ Testing server supervisor...")
+        print(f"   ✅ {check_supervisor()}")
+        
+        print("\n🚦 Testing admission control...")
+        print(f"   ✅ {check_admission()}")
+        
+        print("\n🧾 Testing structured results...")
+        print(f"   ✅ {check_structured_results()}")
+        
+        print("\n⚖️ Testing priority and fair-share scheduling...")
+        print(f"   ✅ {check_scheduling()}")
+        
+        print("\n📼 Testing record and replay...")
+        print(f"   ✅ {check_replay()}")
+        
+        print("\n🔍 Testing request tracing...")
+        print(f"   ✅ {check_tracing()}")
+        
+        print("\n🩺 Testing profiling and memory diagnostics...")
+        print(f"   ✅ {check_diagnostics()}")
+        
+        print("\n🌊 Testing soak mode...")
+        print(f"   ✅ {check_soak()}")
+        
+        print("\n📜 Testing streaming JSON parsing...")
+        print(f"   ✅ {check_streaming_json()}")
+        
+        print("\n📦 Testing batch jobs...")
+        print(f"   ✅ {check_batch_jobs()}")
+        
+        print("\n🎲 Testing random nodes in calculation graphs...")
+        print(f"   ✅ {check_graph_random_nodes()}")
+        
+        print("\n🌐 Testing HTTP request limits and session expiry...")
+        print(f"   ✅ {check_http_limits()}")
+        
+        print("\n🧠 Testing shared-memory elementwise...")
+        print(f"   ✅ {check_shared_array_elementwise()}")
+        
+        print("\n📈 Testing long IRR schedules...")
+        print(f"   ✅ {check_long_irr()}")
+        
+        print("\n🔌 Testing socket transport...")
+        print(f"   ✅ {check_socket_transport()}")
+        
+        print("\n👷 Testing pre-fork workers...")
+        print(f"   ✅ {check_workers()}")
+        
+        print("\n📦 Testing binary framing...")
+        print(f"   ✅ {check_framing()}")
+        
+        print("\n🛑 Testing request cancellation...")
+        print(f"   ✅ {check_cancellation()}")
+        
+        print("\n🧬 Testing zygote sessions...")
+        print(f"   ✅ {check_zygote()}")
         
         print("\n🎉 All tests completed! Calculator MCP Server is working perfectly!")
         print("\n📊 Summary:")
@@ -109,12 +790,37 @@ def main():
         print("   • Multiplication: ✅")
         print("   • Division: ✅")
         print("   • Error handling: ✅")
+        print("   • Calculation graph: ✅")
+        print("   • Memory-mapped datasets: ✅")
+        print("   • Bulk CSV compute: ✅")
+        print("   • Random sampling / Monte Carlo: ✅")
+        print("   • Financial schedules: ✅")
+        print("   • Shared-memory arrays: ✅")
+        print("   • Server pool: ✅")
+        print("   • Server supervisor: ✅")
+        print("   • Zygote sessions: ✅")
+        print("   • Admission control: ✅")
+        print("   • Priority scheduling: ✅")
+        print("   • Structured results: ✅")
+        print("   • Record and replay: ✅")
+        print("   • Request tracing: ✅")
+        print("   • Diagnostics: ✅")
+        print("   • Soak: ✅")
+        print("   • Streaming JSON: ✅")
+        print("   • Batch jobs: ✅")
+        print("   • Graph random nodes: ✅")
+        print("   • HTTP limits: ✅")
+        print("   • Shared-memory elementwise: ✅")
+        print("   • Long IRR schedules: ✅")
+        print("   • Socket transport: ✅")
+        print("   • Pre-fork workers: ✅")
+        print("   • Binary framing: ✅")
+        print("   • Request cancellation: ✅")
         
     except Exception as e:
         print(f"❌ Error: {e}")
     finally:
-        process.terminate()
-        process.wait()
+        client.close()
 
 if __name__ == "__main__":
     main()
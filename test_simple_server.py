@@ -3,50 +3,86 @@
 Simple Test for MCP Server
 """
 
-import subprocess
-import json
+import asyncio
+import os
 import sys
 import time
 
-def send_request(process, request):
-    """Send a request and get response."""
-    process.stdin.write(json.dumps(request) + "\n")
-    process.stdin.flush()
-    response = process.stdout.readline()
-    return json.loads(response) if response.strip() else None
+from mcp import types
+
+from mcp_client import Client, result_text
+from sdk_server import ToolServer
+from simple_server import create_server
+
+NAP_TOOL = {"name": "nap", "description": "Sleep briefly and report when and where",
+            "inputSchema": {"type": "object", "properties": {}}}
+
+def nap(arguments):
+    """A heavy tool: module-level, so the process pool can pickle it."""
+    started = time.monotonic()
+    time.sleep(0.2)
+    return "", {"pid": os.getpid(), "started": started, "finished": time.monotonic()}
+
+def call(server, name, arguments):
+    request = types.CallToolRequest(method="tools/call", params=types.CallToolRequestParams(name=name, arguments=arguments))
+    return server.server.request_handlers[types.CallToolRequest](request)
+
+def check_tool_list():
+    """tools/list returns one result built when the tools were added; server_metrics is opt-in."""
+    server = create_server()
+    handler = server.server.request_handlers[types.ListToolsRequest]
+    first, second = asyncio.run(handler(None)), asyncio.run(handler(None))
+    names = [tool.name for tool in first.root.tools]
+    with_metrics = [tool.name for tool in create_server(metrics_tool=True).tools]
+    if first is not second or "server_metrics" in names or "server_metrics" not in with_metrics:
+        raise RuntimeError(f"tools/list rebuilt its result or offered {names}")
+    return f"{len(names)} tools from one prebuilt ListToolsResult; server_metrics only on request"
+
+def check_validation():
+    """Arguments that break a tool's input schema are refused before the tool runs."""
+    server = create_server()
+    result = asyncio.run(call(server, "add", {"a": "five", "b": 3})).root
+    if not result.isError or "Invalid arguments" not in result.content[0].text:
+        raise RuntimeError(f"invalid arguments were accepted: {result}")
+    return result.content[0].text
+
+def check_pool_and_concurrency():
+    """Heavy tools run in the process pool, at most max_concurrency at a time."""
+    server = ToolServer("test", max_concurrency=2, pool_workers=4)
+    server.add_tool(NAP_TOOL, nap, heavy=True)
+
+    async def run():
+        return await asyncio.gather(*(call(server, "nap", {}) for _ in range(4)))
+
+    try:
+        results = [response.root.structuredContent for response in asyncio.run(run())]
+    finally:
+        server.shutdown()
+    events = sorted([(result["started"], 1) for result in results] + [(result["finished"], -1) for result in results])
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    pids = {result["pid"] for result in results}
+    if os.getpid() in pids or peak > 2:
+        raise RuntimeError(f"naps ran in {pids} (test is {os.getpid()}) with up to {peak} at once")
+    return f"4 naps ran in pool processes {sorted(pids)}, at most {peak} at once"
 
 def main():
     print("Simple MCP Server Test")
     print("=" * 25)
     
     # Start server
-    process = subprocess.Popen(
-        [sys.executable, "simple_server.py"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1
-    )
+    client = Client.spawn([sys.executable, "simple_server.py"])
     
     try:
-        # Wait for server to start
-        time.sleep(1)
-        
         # 1. Initialize
         print("1. Initializing server...")
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "test-client", "version": "1.0"}
-            }
-        }
-        
-        response = send_request(process, init_request)
+        response = client.request("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "test-client", "version": "1.0"}
+        }, timeout=10)
         if response and "result" in response:
             server_name = response["result"]["serverInfo"]["name"]
             print(f"   ✅ Connected to: {server_name}")
@@ -56,22 +92,11 @@ def main():
         
         # 2. Send initialized notification
         print("2. Sending initialized notification...")
-        initialized = {
-            "jsonrpc": "2.0",
-            "method": "notifications/initialized"
-        }
-        process.stdin.write(json.dumps(initialized) + "\n")
-        process.stdin.flush()
+        client.notify("notifications/initialized")
         
         # 3. List tools
         print("3. Listing available tools...")
-        tools_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/list"
-        }
-        
-        response = send_request(process, tools_request)
+        response = client.request("tools/list", timeout=10)
         if response and "result" in response:
             tools = response["result"]["tools"]
             print(f"   ✅ Found {len(tools)} tools:")
@@ -83,49 +108,34 @@ def main():
         
         # 4. Test addition
         print("4. Testing addition (5 + 3)...")
-        add_request = {
-            "jsonrpc": "2.0",
-            "id": 3,
-            "method": "tools/call",
-            "params": {
-                "name": "add",
-                "arguments": {"a": 5, "b": 3}
-            }
-        }
-        
-        response = send_request(process, add_request)
+        response = client.call_tool("add", {"a": 5, "b": 3}, timeout=10)
         if response and "result" in response:
-            result_text = response["result"]["content"][0]["text"]
-            print(f"   ✅ {result_text}")
+            print(f"   ✅ {result_text(response)}")
         else:
             print(f"   ❌ Addition failed: {response}")
         
         # 5. Test multiplication
         print("5. Testing multiplication (4 × 6)...")
-        mult_request = {
-            "jsonrpc": "2.0",
-            "id": 4,
-            "method": "tools/call",
-            "params": {
-                "name": "multiply",
-                "arguments": {"a": 4, "b": 6}
-            }
-        }
-        
-        response = send_request(process, mult_request)
+        response = client.call_tool("multiply", {"a": 4, "b": 6}, timeout=10)
         if response and "result" in response:
-            result_text = response["result"]["content"][0]["text"]
-            print(f"   ✅ {result_text}")
+            print(f"   ✅ {result_text(response)}")
         else:
             print(f"   ❌ Multiplication failed: {response}")
         
+        # 6. ToolServer internals, in process
+        print("6. Testing prebuilt tools/list...")
+        print(f"   ✅ {check_tool_list()}")
+        print("7. Testing input validation...")
+        print(f"   ✅ {check_validation()}")
+        print("8. Testing process pool and concurrency limit...")
+        print(f"   ✅ {check_pool_and_concurrency()}")
+        
         print("\n🎉 All tests passed! MCP Server is working correctly!")
         
     except Exception as e:
         print(f"❌ Error: {e}")
     finally:
-        process.terminate()
-        process.wait()
+        client.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Tool definitions of the calculator server: the ``tools/list`` entries, with
+their input and output schemas.
+
+Kept apart from ``calculator_server.py`` so that other servers offering the
+same tools (``simple_server.py``) can use the definitions without importing
+the whole server.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from dataset_io import DTYPES
+
+
+def _binary_schema(a_description: str = "First number", b_description: str = "Second number") -> Dict[str, Any]:
+    """Input schema shared by the two-operand arithmetic tools."""
+    return {
+        "type": "object",
+        "properties": {
+            "a": {"type": "number", "description": a_description},
+            "b": {"type": "number", "description": b_description}
+        },
+        "required": ["a", "b"]
+    }
+
+
+_SHM_DESCRIPTOR: Dict[str, Any] = {
+    "type": "object",
+    "description": "Shared-memory array: {\"shm\": segment name, \"dtype\": \"float64\", \"shape\": [n]}",
+    "properties": {
+        "shm": {"type": "string"},
+        "dtype": {"type": "string", "enum": list(DTYPES)},
+        "shape": {"type": "array", "items": {"type": "integer"}}
+    },
+    "required": ["shm"]
+}
+
+# Built once at import time; tools/list returns this list as-is.
+TOOLS: List[Dict[str, Any]] = [
+    {
+        "name": "add",
+        "description": "Add two numbers together",
+        "inputSchema": _binary_schema()
+    },
+    {
+        "name": "multiply",
+        "description": "Multiply two numbers",
+        "inputSchema": _binary_schema()
+    },
+    {
+        "name": "subtract",
+        "description": "Subtract second number from first",
+        "inputSchema": _binary_schema()
+    },
+    {
+        "name": "divide",
+        "description": "Divide first number by second",
+        "inputSchema": _binary_schema()
+    },
+    {
+        "name": "dataset_reduce",
+        "description": "Compute sum, mean, min or max of a memory-mapped local dataset file",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Raw little-endian, .npy or CALCARR1 file"},
+                "operation": {"type": "string", "enum": ["sum", "mean", "min", "max"]},
+                "dtype": {"type": "string", "enum": list(DTYPES), "description": "Element type of raw files"}
+            },
+            "required": ["path", "operation"]
+        }
+    },
+    {
+        "name": "dataset_elementwise",
+        "description": "Apply add/subtract/multiply/divide to a dataset file and write float64 results to another file",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Input dataset file"},
+                "operation": {"type": "string", "enum": ["add", "subtract", "multiply", "divide"]},
+                "operand": {"type": "number", "description": "Scalar right-hand operand"},
+                "operand_path": {"type": "string", "description": "Dataset file used as right-hand operand"},
+                "output_path": {"type": "string", "description": "Output file (.npy or raw float64)"},
+                "dtype": {"type": "string", "enum": list(DTYPES), "description": "Element type of raw files"}
+            },
+            "required": ["path", "operation", "output_path"]
+        }
+    },
+    {
+        "name": "bulk_compute",
+        "description": "Stream a CSV through an operation or expression in fixed-size chunks, writing results to a file",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Input CSV with a header row"},
+                "output_path": {"type": "string", "description": "Output CSV (one result column)"},
+                "operation": {"type": "string", "enum": ["add", "subtract", "multiply", "divide"]},
+                "columns": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Two column names, or one column plus 'operand'"
+                },
+                "operand": {"type": "number", "description": "Scalar right-hand operand"},
+                "expression": {"type": "string", "description": "Expression over column names, e.g. 'price * qty'"},
+                "output_column": {"type": "string", "description": "Header of the result column"},
+                "delimiter": {"type": "string", "description": "Field delimiter (default ',')"},
+                "chunk_rows": {"type": "integer", "description": "Rows per chunk"}
+            },
+            "required": ["path", "output_path"]
+        }
+    },
+    {
+        "name": "random_uniform",
+        "description": "Draw seeded uniform samples (inline, or to a float64 file via output_path)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer", "description": "Number of samples"},
+                "low": {"type": "number", "description": "Lower bound (default 0)"},
+                "high": {"type": "number", "description": "Upper bound (default 1)"},
+                "seed": {"type": "integer", "description": "Seed; a random one is chosen and reported if omitted"},
+                "output_path": {"type": "string", "description": "Write samples here instead of returning them"}
+            },
+            "required": ["count"]
+        }
+    },
+    {
+        "name": "random_normal",
+        "description": "Draw seeded normal samples (inline, or to a float64 file via output_path)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer", "description": "Number of samples"},
+                "mean": {"type": "number", "description": "Mean (default 0)"},
+                "std": {"type": "number", "description": "Standard deviation (default 1)"},
+                "seed": {"type": "integer", "description": "Seed; a random one is chosen and reported if omitted"},
+                "output_path": {"type": "string", "description": "Write samples here instead of returning them"}
+            },
+            "required": ["count"]
+        }
+    },
+    {
+        "name": "monte_carlo",
+        "description": "Estimate the expectation of an expression over random variables, with a confidence interval",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "expression": {"type": "string", "description": "Expression over the variables, e.g. 'max(s - 100, 0)'"},
+                "variables": {
+                    "type": "object",
+                    "description": (
+                        "Map of variable name to {\"distribution\": \"uniform\", \"low\", \"high\"} "
+                        "or {\"distribution\": \"normal\", \"mean\", \"std\"}"
+                    )
+                },
+                "samples": {"type": "integer", "description": "Number of samples"},
+                "seed": {"type": "integer", "description": "Seed; results are identical for any worker count"},
+                "confidence": {"type": "number", "description": "Confidence level (default 0.95)"}
+            },
+            "required": ["expression", "variables", "samples"]
+        }
+    },
+    {
+        "name": "amortization_schedule",
+        "description": "Level-payment loan schedule as columns (period, payment, interest, principal, balance)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "principal": {"type": "number", "description": "Loan amount"},
+                "annual_rate": {"type": "number", "description": "Annual interest rate as a decimal (0.05 = 5%)"},
+                "periods": {"type": "integer", "description": "Number of payments"},
+                "periods_per_year": {"type": "integer", "description": "Payments per year (default 12)"},
+                "offset": {"type": "integer", "description": "First row to return"},
+                "limit": {"type": "integer", "description": "Maximum rows to return"},
+                "output_path": {"type": "string", "description": "Stream the full schedule to this CSV instead"}
+            },
+            "required": ["principal", "annual_rate", "periods"]
+        }
+    },
+    {
+        "name": "npv",
+        "description": "Net present value of cash flows (the first flow is at time zero)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "rate": {"type": "number", "description": "Discount rate per period as a decimal"},
+                "cashflows": {"type": "array", "items": {"type": "number"}}
+            },
+            "required": ["rate", "cashflows"]
+        }
+    },
+    {
+        "name": "irr",
+        "description": "Internal rate of return of cash flows (Newton with a bisection fallback)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "cashflows": {"type": "array", "items": {"type": "number"}},
+                "guess": {"type": "number", "description": "Starting rate (default 0.1)"}
+            },
+            "required": ["cashflows"]
+        }
+    },
+    {
+        "name": "compound_table",
+        "description": "Year-end balances for compound growth with optional per-period contributions",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "principal": {"type": "number", "description": "Starting balance"},
+                "annual_rate": {"type": "number", "description": "Annual rate as a decimal"},
+                "years": {"type": "integer", "description": "Number of years"},
+                "compounds_per_year": {"type": "integer", "description": "Compounding periods per year (default 1)"},
+                "contribution": {"type": "number", "description": "Amount added every compounding period"},
+                "offset": {"type": "integer", "description": "First row to return"},
+                "limit": {"type": "integer", "description": "Maximum rows to return"},
+                "output_path": {"type": "string", "description": "Stream the full table to this CSV instead"}
+            },
+            "required": ["principal", "annual_rate", "years"]
+        }
+    },
+    {
+        "name": "annuity",
+        "description": "Present and future value of a level annuity",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "payment": {"type": "number", "description": "Payment per period"},
+                "rate": {"type": "number", "description": "Rate per period as a decimal"},
+                "periods": {"type": "integer", "description": "Number of payments"},
+                "due": {"type": "boolean", "description": "Payments at the start of each period"}
+            },
+            "required": ["payment", "rate", "periods"]
+        }
+    },
+    {
+        "name": "array_elementwise",
+        "description": (
+            "Add, subtract, multiply or divide a shared-memory array by a number or a second "
+            "shared-memory array, writing float64 results to shared memory (clients on the same host)"
+        ),
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "operation": {"type": "string", "enum": ["add", "subtract", "multiply", "divide"]},
+                "array": _SHM_DESCRIPTOR,
+                "operand": {"type": "number", "description": "Scalar second operand"},
+                "operand_array": {**_SHM_DESCRIPTOR, "description": "Shared-memory array of the same length"},
+                "output": {
+                    **_SHM_DESCRIPTOR,
+                    "description": (
+                        "Client-owned float64 segment to write into; if omitted the server creates one, "
+                        "which the client must free with shm/release"
+                    )
+                }
+            },
+            "required": ["operation", "array"]
+        }
+    },
+    {
+        "name": "array_reduce",
+        "description": "Sum, mean, minimum or maximum of a shared-memory array (clients on the same host)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "operation": {"type": "string", "enum": ["sum", "mean", "min", "max"]},
+                "array": _SHM_DESCRIPTOR
+            },
+            "required": ["operation", "array"]
+        }
+    },
+    {
+        "name": "compute_graph",
+        "description": "Evaluate a DAG of tool calls in one request and return the requested outputs",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "nodes": {
+                    "type": "object",
+                    "description": (
+                        "Map of node id to {\"tool\": name, \"arguments\": {...}}. "
+                        "An argument of the form {\"ref\": node_id} takes that node's result."
+                    ),
+                    "additionalProperties": {
+                        "type": "object",
+                        "properties": {
+                            "tool": {"type": "string"},
+                            "arguments": {"type": "object"}
+                        },
+                        "required": ["tool"]
+                    }
+                },
+                "outputs": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Node ids whose results are returned"
+                }
+            },
+            "required": ["nodes", "outputs"]
+        }
+    }
+]
+
+
+_PACKED_ARRAY: Dict[str, Any] = {
+    "type": "object",
+    "description": "Compact-mode numeric array: little-endian values as base64 (see framing.compact_arrays)",
+    "properties": {
+        "dtype": {"type": "string", "enum": list(DTYPES)},
+        "shape": {"type": "array", "items": {"type": "integer"}},
+        "base64": {"type": "string"}
+    },
+    "required": ["dtype", "shape", "base64"]
+}
+_NUMBERS: Dict[str, Any] = {"anyOf": [{"type": "array", "items": {"type": "number"}}, _PACKED_ARRAY]}
+_COLUMNS: Dict[str, Any] = {"type": "object", "description": "Column name to values", "additionalProperties": _NUMBERS}
+
+
+def _result_schema(properties: Dict[str, str], required: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Output schema of an object result; ``properties`` maps names to JSON types (or full schemas)."""
+    return {
+        "type": "object",
+        "properties": {name: {"type": kind} if isinstance(kind, str) else kind for name, kind in properties.items()},
+        "required": list(properties) if required is None else required
+    }
+
+
+_SCALAR_RESULT = _result_schema({"result": "number"})
+
+# structuredContent of each tool's successful results, published as outputSchema in tools/list.
+OUTPUT_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "add": _SCALAR_RESULT,
+    "multiply": _SCALAR_RESULT,
+    "subtract": _SCALAR_RESULT,
+    "divide": _SCALAR_RESULT,
+    "dataset_reduce": _SCALAR_RESULT,
+    "dataset_elementwise": _result_schema({"output_path": "string"}),
+    "bulk_compute": _result_schema({"rows": "integer", "chunks": "integer", "invalid": "integer", "seconds": "number",
+                                    "rows_per_second": "number", "output_path": "string"}),
+    "random_uniform": _result_schema({"seed": "integer", "count": "integer", "values": _NUMBERS,
+                                      "output_path": "string"}, ["seed", "count"]),
+    "random_normal": _result_schema({"seed": "integer", "count": "integer", "values": _NUMBERS,
+                                     "output_path": "string"}, ["seed", "count"]),
+    "monte_carlo": _result_schema({"mean": "number", "std": "number", "stderr": "number", "confidence": "number",
+                                   "ci_low": "number", "ci_high": "number", "samples": "integer",
+                                   "valid_samples": "integer", "seed": "integer"}),
+    "amortization_schedule": _result_schema({"payment": "number", "periods": "integer", "total_interest": "number",
+                                             "offset": "integer", "columns": _COLUMNS, "output_path": "string"},
+                                            ["payment", "periods", "total_interest"]),
+    "npv": _SCALAR_RESULT,
+    "irr": _SCALAR_RESULT,
+    "compound_table": _result_schema({"years": "integer", "offset": "integer", "columns": _COLUMNS,
+                                      "output_path": "string"}, ["years"]),
+    "annuity": _result_schema({"present_value": "number", "future_value": "number"}),
+    "array_elementwise": _result_schema({"operation": "string", "output": _SHM_DESCRIPTOR}),
+    "array_reduce": _SCALAR_RESULT,
+    "compute_graph": _result_schema({"results": {"type": "object", "description": "Value of each output node"}}),
+}
+for _tool in TOOLS:
+    _tool["outputSchema"] = OUTPUT_SCHEMAS[_tool["name"]]
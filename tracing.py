@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Per-request tracing for the calculator server.
+
+``calculator_server.py --trace PATH`` splits each sampled request into phase
+spans:
+
+* ``read``: from the transport having the message to the server starting
+  on it (the stdin reader thread handing over, a socket request task being
+  scheduled, or an HTTP request arriving in full)
+* ``parse``: decoding the message
+* ``validate``: classifying it for admission control (cost class, priority)
+* ``queue``: admission checks and any wait for a slot in its cost class
+* ``compute``: running the method, with a ``pool`` span for each hop to the
+  process pool inside it
+* ``serialize`` and ``write``: encoding the response and writing it out
+
+A request whose ``params._meta`` carries a W3C ``traceparent``
+(``00-<trace id>-<parent span id>-<flags>``) or a ``traceId`` keeps that
+trace id, so its spans line up with the rest of an agent chain. It is always
+traced when the traceparent's sampled flag is set. Other requests are
+traced with probability ``--trace-sample``.
+
+``--trace-format jsonl`` (the default) writes one line per request with its
+spans as millisecond offsets. ``chrome`` writes Trace Event Format "complete"
+events that chrome://tracing and Perfetto open directly. Concurrent requests
+are laid out on separate rows. Files rotate at ``--trace-max-mb`` and keep
+``--trace-backups`` old files (PATH.1 is the newest).
+
+Finished traces are buffered and written by a background thread, as the
+recorder does. With tracing off, the only costs left on the request path are a
+few ``is None`` checks and ``ContextVar`` lookups.
+"""
+
+import asyncio
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from framing import JSON
+
+FORMATS = ("jsonl", "chrome")
+# Finished traces that wake the writer before its flush interval is up.
+BATCH_TRACES = 500
+# Finished traces held in memory at most; beyond this new ones are dropped.
+MAX_BUFFERED = 50_000
+
+
+class Trace:
+    """Spans of one request; times are ``time.perf_counter()`` readings."""
+
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "method", "tool", "spans", "finished")
+
+    def __init__(self, tracer: "Tracer", trace_id: str, parent_id: Optional[str], request: Dict[str, Any]):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent_id
+        self.method = request.get("method")
+        params = request.get("params")
+        self.tool = params.get("name") if self.method == "tools/call" and isinstance(params, dict) else None
+        self.spans: List[Tuple[str, float, float]] = []
+        self.finished = False
+
+    def add(self, phase: str, start: float, end: Optional[float] = None):
+        self.spans.append((phase, start, time.perf_counter() if end is None else end))
+
+    def sent(self, message: Dict[str, Any], start: float, encoded: float):
+        """Record sending ``message`` (encoded by ``encoded``, written by now); a response completes the trace."""
+        end = time.perf_counter()
+        is_response = "id" in message and "method" not in message
+        self.spans.append(("serialize" if is_response else "notify:serialize", start, encoded))
+        self.spans.append(("write" if is_response else "notify:write", encoded, end))
+        if is_response and not self.finished:
+            self.finished = True
+            self.tracer.finish(self)
+
+
+# Trace of the request being handled, if it is sampled.
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def _incoming_context(request: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], bool]:
+    """(trace id, parent span id, sampled flag) from the request's ``_meta``, if it has any."""
+    params = request.get("params")
+    meta = params.get("_meta") if isinstance(params, dict) else None
+    if not isinstance(meta, dict):
+        return None, None, False
+    parent = meta.get("traceparent")
+    if isinstance(parent, str):
+        parts = parent.split("-")
+        if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+            try:
+                return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+            except ValueError:
+                pass
+    trace_id = meta.get("traceId")
+    return (str(trace_id), None, False) if trace_id is not None else (None, None, False)
+
+
+class Tracer:
+    def __init__(self, path: str, sample_rate: float = 1.0, output_format: str = "jsonl",
+                 max_bytes: int = 64 * 1024 * 1024, backups: int = 3, flush_interval: float = 0.5):
+        if output_format not in FORMATS:
+            raise ValueError(f"trace format must be one of {', '.join(FORMATS)}")
+        self.path = path
+        self.sample_rate = sample_rate
+        self.output_format = output_format
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.buffer: List[Trace] = []
+        self.traced = 0
+        self.dropped = 0
+        # Maps perf_counter() readings to wall-clock time.
+        self._epoch = time.time() - time.perf_counter()
+        self._pid = os.getpid()
+        # End time of the last request drawn on each Chrome trace row.
+        self._lanes: List[float] = []
+        self._file = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        """Open the trace file and start the background writer; call from the server's event loop."""
+        self._open()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._write_loop())
+
+    def begin(self, request: Dict[str, Any], received: float, parse_start: float, parsed: float) -> Optional[Trace]:
+        """A trace for ``request`` if it is sampled, with its read and parse spans; None otherwise."""
+        trace_id, parent_id, sampled = _incoming_context(request)
+        if not sampled and random.random() >= self.sample_rate:
+            return None
+        trace = Trace(self, trace_id or random.getrandbits(128).to_bytes(16, "big").hex(), parent_id, request)
+        trace.spans.append(("read", received, parse_start))
+        trace.spans.append(("parse", parse_start, parsed))
+        return trace
+
+    def finish(self, trace: Trace):
+        if len(self.buffer) >= MAX_BUFFERED:
+            self.dropped += 1
+            return
+        self.buffer.append(trace)
+        if len(self.buffer) >= BATCH_TRACES and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _jsonl(self, trace: Trace) -> bytes:
+        start = trace.spans[0][1]
+        end = max(span[2] for span in trace.spans)
+        return JSON.encode({
+            "traceId": trace.trace_id, "spanId": trace.span_id, "parentId": trace.parent_id,
+            "method": trace.method, "tool": trace.tool, "start": round(self._epoch + start, 6),
+            "ms": round((end - start) * 1000, 3),
+            "spans": [{"name": name, "startMs": round((begin - start) * 1000, 3),
+                       "ms": round((finish - begin) * 1000, 3)} for name, begin, finish in trace.spans],
+        }) + b"\n"
+
+    def _chrome(self, trace: Trace) -> bytes:
+        start = trace.spans[0][1]
+        end = max(span[2] for span in trace.spans)
+        for lane, busy_until in enumerate(self._lanes):
+            if busy_until <= start:
+                break
+        else:
+            lane = len(self._lanes)
+            self._lanes.append(0.0)
+        self._lanes[lane] = end
+        name = f"{trace.method} {trace.tool}" if trace.tool else str(trace.method)
+        args = {"traceId": trace.trace_id, "spanId": trace.span_id, "parentId": trace.parent_id}
+        events = [("request", name, start, end, args)] + [(phase, phase, begin, finish, None)
+                                                          for phase, begin, finish in trace.spans]
+        return b"".join(
+            JSON.encode({"name": label, "cat": category, "ph": "X", "pid": self._pid, "tid": lane,
+                         "ts": round((self._epoch + begin) * 1e6, 1), "dur": round((finish - begin) * 1e6, 1),
+                         **({"args": extra} if extra else {})}) + b",\n"
+            for category, label, begin, finish, extra in events
+        )
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        if self.output_format == "chrome" and self._file.tell() == 0:
+            # Trace viewers accept the event array without its closing bracket, so it can grow forever.
+            self._file.write(b"[\n")
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.unlink(self.path)
+        self._open()
+
+    def _write(self, batch: List[Trace]):
+        encode = self._chrome if self.output_format == "chrome" else self._jsonl
+        self._file.write(b"".join(encode(trace) for trace in batch))
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    async def flush(self):
+        if self.buffer and self._file is not None:
+            batch, self.buffer = self.buffer, []
+            await asyncio.to_thread(self._write, batch)
+            self.traced += len(batch)
+
+    async def _write_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        """Stop the writer and write out whatever is still buffered."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def gauges(self) -> Dict[str, Any]:
+        return {"traced": self.traced, "trace_dropped": self.dropped}
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+Network transports for the calculator MCP server.
+
+``serve_socket`` exposes an ``MCPServer`` on TCP or a Unix-domain socket using
+the same newline-delimited JSON-RPC framing as stdio. Many clients share one
+server process (and its worker pool); each connection gets its own ``Session``
+so notifications and per-client state never leak between connections.
+Like stdio, a connection may switch to length-prefixed binary frames at
+``initialize`` (see ``framing``).
+
+``serve_http`` follows the MCP Streamable HTTP shape: JSON-RPC messages are
+POSTed to one endpoint and answered with plain JSON, or with a server-sent
+event stream when the request asks for progress. Every request but
+``initialize`` must carry the ``Mcp-Session-Id`` that initialize returned. Connections are kept alive
+between requests (HTTP/1.1) and request bodies are size-capped. A session not
+used for ``idle_timeout`` seconds is forgotten, as if DELETEd, and so is the
+least recently used one once ``max_sessions`` are open. Bodies sent as
+``application/msgpack`` or ``application/cbor`` are answered in kind.
+"""
+
+import asyncio
+import collections
+import json
+import os
+import signal
+import socket
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple, Union
+
+from calculator_server import MCPServer, Session, current_session
+from framing import CODECS, JSON, codec_for_content_type, frame, read_frame
+from streaming_json import Parsed, decode_parsed, loads, read_line_async
+from tracing import current_trace
+
+# Largest single JSON-RPC line accepted from a socket client.
+MAX_LINE_BYTES = 64 * 1024 * 1024
+# Requests a single connection may have in flight before reads pause.
+MAX_PENDING_PER_CONNECTION = 64
+
+
+def _error(code: int, message: str, request_id: Any = None) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+class _Transport:
+    """Connection bookkeeping shared by the socket and HTTP transports."""
+
+    read_limit = MAX_LINE_BYTES
+
+    def __init__(self, server: MCPServer, max_connections: int, idle_timeout: Optional[float]):
+        self.server = server
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        # connection task -> its in-flight request tasks
+        self.connections: Dict[asyncio.Task, Set[asyncio.Task]] = {}
+        self.closing = False
+
+    async def start(self, host: Optional[str] = None, port: Optional[int] = None, path: Optional[str] = None,
+                    sock: Optional[socket.socket] = None, reuse_port: bool = False) -> asyncio.AbstractServer:
+        """Listen on an inherited socket (``sock``), a Unix socket (``path``) or TCP host/port."""
+        if sock is not None and sock.family == getattr(socket, "AF_UNIX", None):
+            return await asyncio.start_unix_server(self.handle_connection, sock=sock, limit=self.read_limit)
+        if sock is not None:
+            return await asyncio.start_server(self.handle_connection, sock=sock, limit=self.read_limit)
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            return await asyncio.start_unix_server(self.handle_connection, path=path, limit=self.read_limit)
+        return await asyncio.start_server(self.handle_connection, host=host, port=port,
+                                          reuse_port=reuse_port or None, limit=self.read_limit)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        raise NotImplementedError
+
+    async def drain(self, timeout: float):
+        """Stop reading new requests, let in-flight ones finish, then drop connections."""
+        self.closing = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while any(self.connections.values()) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        tasks = list(self.connections)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=1.0)
+
+
+class SocketTransport(_Transport):
+    """Accepts socket clients and runs their requests against one shared server."""
+
+    def __init__(self, server: MCPServer, max_connections: int = 256, idle_timeout: Optional[float] = 300.0,
+                 max_line_bytes: int = MAX_LINE_BYTES, max_pending: int = MAX_PENDING_PER_CONNECTION):
+        super().__init__(server, max_connections, idle_timeout)
+        self.max_line_bytes = self.read_limit = max_line_bytes
+        if 0 < server.stream_threshold < max_line_bytes:
+            # Longer lines overrun the reader's limit and are decoded as they arrive.
+            self.read_limit = server.stream_threshold
+        self.max_pending = max_pending
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = _SocketConnection(self, reader, writer)
+        if len(self.connections) >= self.max_connections:
+            try:
+                await connection.send(_error(-32000, "Too many connections"))
+            finally:
+                writer.close()
+            return
+
+        task = asyncio.current_task()
+        self.connections[task] = connection.pending
+        try:
+            await connection.serve()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # cancelled: dropped by drain() at shutdown
+        finally:
+            self.connections.pop(task, None)
+            await connection.close()
+
+
+class _SocketConnection:
+    """One socket client: its session, ordered writes and in-flight request tasks."""
+
+    def __init__(self, transport: SocketTransport, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.transport = transport
+        self.reader = reader
+        self.writer = writer
+        self.write_lock = asyncio.Lock()
+        peer = writer.get_extra_info("peername") or writer.get_extra_info("sockname") or "unix"
+        self.session = Session(self.send, peer=str(peer))
+        self.slots = asyncio.Semaphore(transport.max_pending)
+        self.pending: Set[asyncio.Task] = set()
+
+    async def send(self, message: Dict[str, Any]):
+        trace = current_trace.get()
+        started = time.perf_counter() if trace is not None else 0.0
+        if self.session.encoding == "json":
+            data = json.dumps(message).encode() + b"\n"
+        else:
+            data = frame(CODECS[self.session.encoding].encode(message))
+        encoded = time.perf_counter() if trace is not None else 0.0
+        async with self.write_lock:
+            self.writer.write(data)
+            await self.writer.drain()
+        if trace is not None:
+            trace.sent(message, started, encoded)
+
+    async def serve(self):
+        """Read messages until EOF, an idle timeout or shutdown, then wait for in-flight requests."""
+        while not self.transport.closing:
+            data = await self.read_message()
+            if not data:
+                break
+            if isinstance(data, Parsed):
+                decode = decode_parsed
+            else:
+                codec = CODECS[self.session.encoding]
+                if codec is JSON and not data.strip():
+                    continue
+                decode = codec.decode
+            await self.dispatch(data, decode)
+        if self.pending:
+            await asyncio.wait(list(self.pending))
+
+    async def read_message(self) -> Union[bytes, Parsed]:
+        """The next line or frame; empty once the connection should close."""
+        limit = self.transport.max_line_bytes
+        codec = CODECS[self.session.encoding]
+        while True:
+            try:
+                if codec is JSON:
+                    return await asyncio.wait_for(read_line_async(self.reader, limit), self.transport.idle_timeout)
+                return await read_frame(self.reader, limit, self.transport.idle_timeout)
+            except asyncio.TimeoutError:
+                if not self.pending:
+                    return b""
+                # quiet, but still waiting on its own requests
+            except (asyncio.LimitOverrunError, ValueError):
+                await self.send(_error(-32700, f"Parse error: message exceeds {limit} bytes"))
+                return b""
+
+    async def dispatch(self, data: Union[bytes, Parsed], decode: Callable[[Any], Any]):
+        await self.slots.acquire()
+        received = time.perf_counter()
+        if not self.session.initialized:
+            # Until initialize is answered, handle messages in order: its
+            # response may switch the connection to a binary encoding.
+            await self.respond(data, decode, received)
+            self.session.switch_encoding()
+            return
+        request_task = asyncio.create_task(self.respond(data, decode, received))
+        self.pending.add(request_task)
+        request_task.add_done_callback(self.pending.discard)
+
+    async def respond(self, data: Union[bytes, Parsed], decode: Callable[[Any], Any], received: float):
+        try:
+            current_session.set(self.session)
+            response = await self.transport.server.handle_message(data, decode, received)
+            if response is not None:
+                await self.send(response)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.slots.release()
+
+    async def close(self):
+        for request_task in list(self.pending):
+            request_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+def _address(listener: asyncio.AbstractServer) -> str:
+    """The bound address, with the real port when 0 was requested."""
+    bound = listener.sockets[0].getsockname()
+    if isinstance(bound, tuple):
+        host = bound[0]
+        return f"[{host}]:{bound[1]}" if ":" in host else f"{host}:{bound[1]}"
+    return bound.decode() if isinstance(bound, bytes) else bound
+
+
+async def serve(transport: _Transport, listener: asyncio.AbstractServer, drain_timeout: float = 30.0,
+                ready: Optional[Callable[[str], None]] = None):
+    """Serve until SIGTERM (or SIGINT), then close the listener and drain in-flight requests."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass  # not the main thread, or a platform without signal handlers
+    if ready is not None:
+        ready(_address(listener))
+    try:
+        await stop.wait()
+    finally:
+        listener.close()
+        await transport.drain(drain_timeout)
+
+
+async def serve_socket(server: MCPServer, host: Optional[str] = None, port: Optional[int] = None,
+                       path: Optional[str] = None, sock: Optional[socket.socket] = None, reuse_port: bool = False,
+                       drain_timeout: float = 30.0, ready: Optional[Callable[[str], None]] = None, **options: Any):
+    """Serve ``server`` on TCP (host/port), a Unix socket (path) or an inherited socket."""
+    transport = SocketTransport(server, **options)
+    listener = await transport.start(host=host, port=port, path=path, sock=sock, reuse_port=reuse_port)
+    await serve(transport, listener, drain_timeout, ready)
+
+
+# Largest accepted HTTP header block.
+MAX_HEADER_BYTES = 64 * 1024
+# Live HTTP sessions kept; beyond this the least recently used is forgotten.
+MAX_SESSIONS = 10_000
+
+_STATUS_TEXT = {
+    200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    408: "Request Timeout", 411: "Length Required", 413: "Payload Too Large",
+    431: "Request Header Fields Too Large", 503: "Service Unavailable",
+}
+
+# SSE writer of the HTTP request currently being handled, if it streams.
+_event_stream: ContextVar[Optional[Callable[[Dict[str, Any]], Awaitable[None]]]] = ContextVar(
+    "_event_stream", default=None
+)
+
+
+async def _stream_or_drop(message: Dict[str, Any]):
+    """Session sender for HTTP: deliver on the request's event stream, if it has one."""
+    stream = _event_stream.get()
+    if stream is not None:
+        await stream(message)
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message or _STATUS_TEXT.get(status, ""))
+        self.status = status
+
+
+class HttpTransport(_Transport):
+    """Minimal HTTP/1.1 server for the MCP Streamable HTTP transport."""
+
+    def __init__(self, server: MCPServer, endpoint: str = "/mcp", max_connections: int = 256,
+                 idle_timeout: Optional[float] = 300.0, max_body_bytes: int = MAX_LINE_BYTES,
+                 max_header_bytes: int = MAX_HEADER_BYTES, max_sessions: int = MAX_SESSIONS):
+        super().__init__(server, max_connections, idle_timeout)
+        self.endpoint = endpoint
+        self.max_body_bytes = max_body_bytes
+        self.max_sessions = max_sessions
+        self.max_header_bytes = self.read_limit = max_header_bytes
+        self.sessions: Dict[str, Session] = {}
+        # session id -> when it was last used, least recently used first
+        self._last_used: "collections.OrderedDict[str, float]" = collections.OrderedDict()
+
+    @staticmethod
+    def _head(status: int, headers: Dict[str, str]) -> bytes:
+        lines = [f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin1")
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: bytes = b"",
+                       headers: Optional[Dict[str, str]] = None, keep_alive: bool = True):
+        headers = dict(headers or {})
+        headers["Content-Length"] = str(len(body))
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        writer.write(self._head(status, headers) + body)
+        await writer.drain()
+
+    async def _read_head(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, str, Dict[str, str]]]:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+        except asyncio.TimeoutError:
+            return None
+        except (asyncio.LimitOverrunError, ValueError):
+            raise _HttpError(431)
+        if not request_line:
+            return None
+        parts = request_line.decode("latin1").split()
+        if len(parts) != 3:
+            raise _HttpError(400, "Malformed request line")
+        method, target, version = parts
+
+        headers: Dict[str, str] = {}
+        size = len(request_line)
+        while True:
+            try:
+                line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                raise _HttpError(408)
+            except (asyncio.LimitOverrunError, ValueError):
+                raise _HttpError(431)
+            size += len(line)
+            if size > self.max_header_bytes:
+                raise _HttpError(431)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    def _content_length(self, headers: Dict[str, str]) -> int:
+        if "content-length" not in headers:
+            raise _HttpError(411)
+        value = headers["content-length"]
+        # int() would also take "+5", " 5" and "5_0"; HTTP allows only ASCII digits.
+        if not (value.isascii() and value.isdigit()):
+            raise _HttpError(400, "Invalid Content-Length")
+        length = int(value)
+        if length > self.max_body_bytes:
+            raise _HttpError(413, f"Request body exceeds {self.max_body_bytes} bytes")
+        return length
+
+    def _expire_sessions(self):
+        """Forget sessions idle for longer than ``idle_timeout``; their ids get 404 from then on."""
+        if not self.idle_timeout:
+            return
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._last_used:
+            session_id, last_used = next(iter(self._last_used.items()))
+            if last_used > cutoff:
+                break
+            self._forget(session_id)
+
+    def _forget(self, session_id: str):
+        self._last_used.pop(session_id, None)
+        self.sessions.pop(session_id, None)
+
+    def _session_for(self, headers: Dict[str, str], message: Any) -> Tuple[Session, Optional[str]]:
+        """Look up the Mcp-Session-Id session; initialize opens a new one.
+
+        Anything else must name a session, so rate limits and fair queuing,
+        which are per session, cannot be sidestepped by leaving the header out.
+        """
+        self._expire_sessions()
+        if isinstance(message, dict) and message.get("method") == "initialize":
+            while self._last_used and len(self.sessions) >= self.max_sessions:
+                self._forget(next(iter(self._last_used)))
+            session_id = uuid.uuid4().hex
+            self.sessions[session_id] = Session(_stream_or_drop, peer=f"http:{session_id}", framing=False)
+        else:
+            session_id = headers.get("mcp-session-id")
+            if session_id is None:
+                raise _HttpError(400, "Missing Mcp-Session-Id header; send initialize first")
+            if session_id not in self.sessions:
+                raise _HttpError(404, "Unknown session")
+        self._last_used[session_id] = time.monotonic()
+        self._last_used.move_to_end(session_id)
+        return self.sessions[session_id], session_id
+
+    async def _handle_post(self, writer: asyncio.StreamWriter, headers: Dict[str, str], body: bytes,
+                           keep_alive: bool, received: float):
+        codec = codec_for_content_type(headers.get("content-type"))
+        decode = codec.decode
+        if codec is JSON and 0 < self.server.stream_threshold <= len(body):
+            decode = loads  # the body is already in memory, but its numeric arrays need not be boxed
+        parse_start = time.perf_counter()
+        try:
+            message = decode(body)
+        except (ValueError, TypeError):
+            payload = codec.encode(_error(-32700, "Parse error"))
+            await self._respond(writer, 400, payload, {"Content-Type": codec.content_type}, keep_alive)
+            return
+
+        session, session_id = self._session_for(headers, message)
+        current_session.set(session)
+        extra = {"Mcp-Session-Id": session_id} if session_id else {}
+
+        if isinstance(message, list):
+            for item in message:
+                if isinstance(item, dict) and "id" not in item:
+                    self.server.handle_notification(item)
+            requests = [item for item in message if isinstance(item, dict) and "id" in item]
+            size = len(body) // max(1, len(requests))
+            responses = await asyncio.gather(*(self.server.handle_request(item, size) for item in requests))
+            responses = [response for response in responses if response is not None]  # cancelled
+            if not responses:
+                await self._respond(writer, 202, headers=extra, keep_alive=keep_alive)
+                return
+            await self._respond(writer, 200, codec.encode(responses),
+                                {"Content-Type": codec.content_type, **extra}, keep_alive)
+            return
+        if not isinstance(message, dict) or "id" not in message:
+            # Notifications and stray responses need no reply.
+            if isinstance(message, dict):
+                self.server.handle_notification(message)
+            await self._respond(writer, 202, headers=extra, keep_alive=keep_alive)
+            return
+
+        tracer = self.server.tracer
+        trace = tracer.begin(message, received, parse_start, time.perf_counter()) if tracer is not None else None
+        current_trace.set(trace)
+        wants_stream = "text/event-stream" in headers.get("accept", "")
+        has_progress = bool(((message.get("params") or {}).get("_meta") or {}).get("progressToken") is not None)
+        if not (wants_stream and has_progress):
+            response = await self.server.handle_request(message, len(body))
+            if response is None:
+                # Cancelled by the client, which no longer expects a result.
+                await self._respond(writer, 202, headers=extra, keep_alive=keep_alive)
+                return
+            started = time.perf_counter()
+            payload = codec.encode(response)
+            encoded = time.perf_counter()
+            await self._respond(writer, 200, payload, {"Content-Type": codec.content_type, **extra}, keep_alive)
+            if trace is not None:
+                trace.sent(response, started, encoded)
+            return
+
+        # Stream notifications and the final response as SSE over a chunked body.
+        writer.write(self._head(200, {
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "Transfer-Encoding": "chunked",
+            "Connection": "keep-alive" if keep_alive else "close",
+            **extra,
+        }))
+
+        async def send_event(event: Dict[str, Any]):
+            started = time.perf_counter()
+            data = b"event: message\ndata: " + JSON.encode(event) + b"\n\n"
+            encoded = time.perf_counter()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+            if trace is not None:
+                trace.sent(event, started, encoded)
+
+        _event_stream.set(send_event)
+        response = await self.server.handle_request(message, len(body))
+        if response is not None:
+            await send_event(response)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if len(self.connections) >= self.max_connections:
+            await self._respond(writer, 503, b"Too many connections", keep_alive=False)
+            writer.close()
+            return
+        task = asyncio.current_task()
+        in_flight: Set[asyncio.Task] = set()
+        self.connections[task] = in_flight
+        try:
+            while not self.closing:
+                try:
+                    head = await self._read_head(reader)
+                    if head is None:
+                        break
+                    method, target, version, headers = head
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+                    if target.split("?", 1)[0] != self.endpoint:
+                        raise _HttpError(404)
+                    self._expire_sessions()
+                    if method == "DELETE" and headers.get("mcp-session-id") in self.sessions:
+                        self._forget(headers["mcp-session-id"])
+                        await self._respond(writer, 200, keep_alive=keep_alive)
+                        continue
+                    if method != "POST":
+                        raise _HttpError(405)
+                    length = self._content_length(headers)
+                    received = time.perf_counter()
+                    body = await asyncio.wait_for(reader.readexactly(length), self.idle_timeout)
+                    # A task per request gives it a fresh context for its session and stream.
+                    request_task = asyncio.create_task(self._handle_post(writer, headers, body, keep_alive, received))
+                    in_flight.add(request_task)
+                    try:
+                        await request_task
+                    finally:
+                        in_flight.discard(request_task)
+                    if not keep_alive:
+                        break
+                except _HttpError as e:
+                    # The request body may be unread, so the connection cannot be reused.
+                    await self._respond(writer, e.status, str(e).encode(), {"Content-Type": "text/plain",
+                                        **({"Allow": "POST, DELETE"} if e.status == 405 else {})}, keep_alive=False)
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError,
+                asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def serve_http(server: MCPServer, host: Optional[str] = None, port: Optional[int] = None,
+                     sock: Optional[socket.socket] = None, reuse_port: bool = False, drain_timeout: float = 30.0,
+                     ready: Optional[Callable[[str], None]] = None, **options: Any):
+    """Serve ``server`` over Streamable HTTP until SIGTERM."""
+    transport = HttpTransport(server, **options)
+    listener = await transport.start(host=host, port=port, sock=sock, reuse_port=reuse_port)
+    await serve(transport, listener, drain_timeout, ready)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Pre-fork worker mode for the calculator server's socket and HTTP transports.
+
+``supervise`` runs in the parent process. It starts N worker processes that
+all serve the same address, either each binding it with ``SO_REUSEPORT`` (TCP
+and HTTP on platforms that support it) or by accepting on one listening
+socket the parent opened and passed down. The parent then:
+
+* restarts workers that exit unexpectedly, backing off if they crash-loop
+* on SIGHUP, replaces workers one at a time: the new worker must report
+  ready before the old one is told to drain, so capacity never drops
+* on SIGTERM/SIGINT, drains and stops every worker
+
+Workers are started with ``exec`` rather than ``fork``, so a reload picks up
+new code. Each worker publishes metrics snapshots to a shared directory, and
+``server/metrics`` on any worker reports the totals across the group.
+"""
+
+import argparse
+import os
+import select
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calculator_server.py")
+# How long a new worker may take to start listening.
+READY_TIMEOUT = 15.0
+# A worker that dies sooner than this after starting counts as crash-looping.
+MIN_HEALTHY_SECONDS = 5.0
+MAX_RESTART_DELAY = 30.0
+
+
+def _log(message: str):
+    print(f"[supervisor {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def _split_endpoint(value: str):
+    """``host:port`` or ``[v6 host]:port`` -> (host without brackets or None, port)."""
+    host, _, port = value.rpartition(":")
+    if host.startswith("[") and host.endswith("]"):
+        host = host[1:-1]
+    return host or None, int(port)
+
+
+def _join_endpoint(host: Optional[str], port: int) -> str:
+    if host and ":" in host:
+        return f"[{host}]:{port}"
+    return f"{host or ''}:{port}"
+
+
+class Worker:
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+        self.started = time.monotonic()
+        self.retire_deadline: Optional[float] = None
+        # Set once the worker has exited: when to start its replacement.
+        self.restart_at: Optional[float] = None
+
+
+class Supervisor:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.count = args.workers
+        self.metrics_dir = tempfile.mkdtemp(prefix="calculator-metrics-")
+        self.listener: Optional[socket.socket] = None
+        self.worker_args: List[str] = []
+        self.address = ""
+        self.workers: List[Worker] = []
+        self.retiring: List[Worker] = []
+        self.restart_delay = 0.5
+        self.stopping = False
+        self.reload_requested = False
+        self._prepare_listener()
+
+    def _prepare_listener(self):
+        """Decide how workers share the address and build their command line."""
+        args = self.args
+        common = ["--max-connections", str(args.max_connections), "--idle-timeout", str(args.idle_timeout),
+                  "--drain-timeout", str(args.drain_timeout), "--metrics-dir", self.metrics_dir,
+                  "--max-in-flight", str(args.max_in_flight), "--max-queued-mb", str(args.max_queued_mb),
+                  "--stream-threshold-mb", str(args.stream_threshold_mb)]
+        for option, value in (("--heavy-concurrency", args.heavy_concurrency), ("--heavy-queue", args.heavy_queue),
+                              ("--rate-limit", args.rate_limit), ("--rate-burst", args.rate_burst),
+                              ("--record", args.record), ("--record-sample", args.record_sample),
+                              ("--trace", args.trace), ("--trace-sample", args.trace_sample),
+                              ("--trace-format", args.trace_format), ("--trace-max-mb", args.trace_max_mb),
+                              ("--trace-backups", args.trace_backups), ("--admin-token-file", args.admin_token_file)):
+            if value is not None:
+                common += [option, str(value)]
+        for name, weight in args.client_weight:
+            common += ["--client-weight", f"{name}={weight}"]
+        flag, endpoint = ("--http", args.http) if args.http else ("--tcp", args.tcp) if args.tcp else ("--unix", args.unix)
+
+        if flag == "--unix":
+            if os.path.exists(endpoint):
+                os.unlink(endpoint)
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(endpoint)
+            self.listener.listen(1024)
+            self.worker_args = ["--unix", endpoint, "--listen-fd", str(self.listener.fileno())] + common
+            self.address = endpoint
+            _log(f"serving unix on {endpoint} with {self.count} workers")
+            return
+
+        host, port = _split_endpoint(endpoint)
+        if hasattr(socket, "SO_REUSEPORT"):
+            # Bound but never listening: it only reserves the port (resolving port 0)
+            # and receives no connections; each worker binds its own listener.
+            self.listener = socket.socket(socket.AF_INET6 if host and ":" in host else socket.AF_INET)
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.listener.bind((host or "0.0.0.0", port))
+            port = self.listener.getsockname()[1]
+            self.worker_args = [flag, _join_endpoint(host, port), "--reuse-port"] + common
+        else:
+            self.listener = socket.create_server((host or "", port), backlog=1024,
+                                                 family=socket.AF_INET6 if host and ":" in host else socket.AF_INET)
+            port = self.listener.getsockname()[1]
+            self.worker_args = [flag, _join_endpoint(host, port), "--listen-fd", str(self.listener.fileno())] + common
+        self.address = _join_endpoint(host, port)
+        _log(f"serving {flag[2:]} on {host or '*'}:{port} with {self.count} workers")
+
+    def spawn(self) -> Optional[Worker]:
+        """Start one worker and wait until it reports that it is listening."""
+        ready_read, ready_write = os.pipe()
+        pass_fds = [ready_write]
+        if "--listen-fd" in self.worker_args:
+            pass_fds.append(self.listener.fileno())
+        try:
+            process = subprocess.Popen(
+                [sys.executable, SERVER_SCRIPT] + self.worker_args + ["--ready-fd", str(ready_write)],
+                stdin=subprocess.DEVNULL,
+                pass_fds=pass_fds,
+                # Through the environment rather than argv, where ps would show it.
+                env={**os.environ, "CALCULATOR_ADMIN_TOKEN": self.args.admin_token or ""},
+            )
+        finally:
+            os.close(ready_write)
+        try:
+            readable, _, _ = select.select([ready_read], [], [], READY_TIMEOUT)
+            ready = bool(readable) and os.read(ready_read, 64).startswith(b"ready")
+        finally:
+            os.close(ready_read)
+        if not ready:
+            _log(f"worker {process.pid} did not become ready; stopping it")
+            process.kill()
+            process.wait()
+            return None
+        return Worker(process)
+
+    def _forget_metrics(self, pid: int):
+        try:
+            os.unlink(os.path.join(self.metrics_dir, f"worker-{pid}.json"))
+        except FileNotFoundError:
+            pass
+
+    def _reap(self):
+        for worker in list(self.retiring):
+            if worker.process.poll() is not None:
+                self.retiring.remove(worker)
+                self._forget_metrics(worker.process.pid)
+            elif time.monotonic() > worker.retire_deadline:
+                worker.process.kill()
+
+        for index, worker in enumerate(self.workers):
+            if worker.restart_at is None:
+                code = worker.process.poll()
+                if code is None:
+                    continue
+                self._forget_metrics(worker.process.pid)
+                lifetime = time.monotonic() - worker.started
+                if lifetime < MIN_HEALTHY_SECONDS:
+                    # Crash-looping: restart at a deadline, so the loop keeps serving signals meanwhile.
+                    delay = self.restart_delay
+                    self.restart_delay = min(MAX_RESTART_DELAY, self.restart_delay * 2)
+                else:
+                    delay = 0.0
+                    self.restart_delay = 0.5
+                worker.restart_at = time.monotonic() + delay
+                _log(f"worker {worker.process.pid} exited with {code} after {lifetime:.1f}s; restarting in {delay:.1f}s")
+            if time.monotonic() < worker.restart_at:
+                continue
+            replacement = self.spawn()
+            if replacement is not None:
+                self.workers[index] = replacement
+            else:
+                worker.restart_at = time.monotonic() + self.restart_delay
+                self.restart_delay = min(MAX_RESTART_DELAY, self.restart_delay * 2)
+
+    def _retire(self, worker: Worker):
+        worker.retire_deadline = time.monotonic() + self.args.drain_timeout + 5.0
+        try:
+            worker.process.send_signal(signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        self.retiring.append(worker)
+
+    def reload(self):
+        """Rolling restart: each replacement is ready before its predecessor drains."""
+        _log("reloading workers")
+        for index, old in enumerate(list(self.workers)):
+            new = self.spawn()
+            if new is None:
+                _log("reload aborted; keeping remaining workers")
+                return
+            self.workers[index] = new
+            self._retire(old)
+        _log("reload complete")
+
+    def run(self) -> int:
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+
+        try:
+            for _ in range(self.count):
+                worker = self.spawn()
+                if worker is None:
+                    _log("initial worker failed to start")
+                    return 1
+                self.workers.append(worker)
+            from calculator_server import announce_ready
+            announce_ready(self.args, self.address)
+            while not self.stopping:
+                time.sleep(0.2)
+                if self.stopping:
+                    break  # workers that exit on the same signal are not restarted
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                self._reap()
+        finally:
+            for worker in self.workers:
+                self._retire(worker)
+            self.workers = []
+            while self.retiring:
+                self._reap()
+                time.sleep(0.1)
+            if self.listener is not None:
+                self.listener.close()
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+            if self.args.ready_file and os.path.exists(self.args.ready_file):
+                os.unlink(self.args.ready_file)
+        _log("stopped")
+        return 0
+
+
+def supervise(args: argparse.Namespace) -> int:
+    """Run the pre-fork supervisor for a socket or HTTP transport."""
+    if not (args.tcp or args.unix or args.http):
+        _log("--workers requires --tcp, --unix or --http")
+        return 2
+    return Supervisor(args).run()
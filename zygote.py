@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Fork server ("zygote") for per-session calculator servers.
+
+Spawning ``calculator_server.py`` for every agent session costs an interpreter
+start plus imports each time. ``python calculator_server.py --zygote PATH``
+pays that once instead:
+
+* the parent imports everything, including the modules that are normally
+  loaded on first use (NumPy, the binary codecs, shared arrays)
+* it answers a few requests on a throwaway session, so the tool table,
+  parsers and codecs are initialized and their caches are warm
+* it calls ``gc.freeze()``, so the collector never writes to the objects it
+  built, and forked children keep sharing those pages copy-on-write
+* it then listens on the Unix socket PATH
+
+A client connects and sends, with ``SCM_RIGHTS``, the file descriptors to use
+as the session's stdin and stdout (and optionally stderr). The zygote forks. The
+child puts those descriptors on 0/1/2 and serves that one session over stdio
+until its stdin closes. The parent replies ``{"pid": N}`` and, when the child
+exits, ``{"exit": code}`` on the same connection. ``fork_session`` is the
+client side, and ``mcp_client.AsyncClient.fork(PATH)`` gives a connected client
+for a forked session on a socketpair.
+
+Sessions are started in their own session (``setsid``), so stopping the zygote
+does not end conversations already in progress. The zygote is a fork of an
+interpreter that never started threads or an event loop, which is what makes
+forking it safe. Forked sessions run the code the zygote loaded, so restart
+the zygote to pick up new code.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import traceback
+from typing import Any, Dict, List, Optional
+
+# Largest request a client may send along with its descriptors.
+MAX_REQUEST_BYTES = 4096
+
+
+def _log(message: str):
+    print(f"[zygote {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def warm_up(args: argparse.Namespace) -> argparse.Namespace:
+    """Import and exercise everything a session needs, before any fork; returns the sessions' arguments.
+
+    Sessions get the zygote's own options (admission limits, recording,
+    tracing and so on), less the ones that only concern the zygote itself.
+    """
+    # The executor behind asyncio.to_thread, which reads a stdio session's stdin.
+    import concurrent.futures.thread  # noqa: F401
+
+    import calculator_server
+    from lazy_imports import load_pending
+
+    load_pending()
+    session_args = argparse.Namespace(**vars(args))
+    session_args.zygote = session_args.ready_file = session_args.ready_fd = None
+
+    async def answer_sample_requests():
+        async def discard(message: Dict[str, Any]):
+            pass
+
+        server = calculator_server.MCPServer("calculator-server")
+        calculator_server.current_session.set(calculator_server.Session(discard, peer="warm-up"))
+        requests = [
+            {"jsonrpc": "2.0", "id": 1, "method": "initialize",
+             "params": {"protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "zygote"}}},
+            {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+            {"jsonrpc": "2.0", "id": 3, "method": "tools/call", "params": {"name": "add", "arguments": {"a": 1, "b": 2}}},
+            {"jsonrpc": "2.0", "id": 4, "method": "tools/call",
+             "params": {"name": "divide", "arguments": {"a": 1, "b": 0}}},
+        ]
+        for request in requests:
+            await server.handle_message(json.dumps(request).encode())
+        server.shutdown()
+
+    asyncio.run(answer_sample_requests())
+    return session_args
+
+
+def _run_session(fds: List[int], inherited: List[socket.socket], session_args: argparse.Namespace):
+    """In the forked child: serve one stdio session on ``fds``, then exit without returning."""
+    code = 0
+    try:
+        signal.set_wakeup_fd(-1)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        os.setsid()
+        for sock in inherited:
+            sock.close()
+        # Each session is its own process: like workers, it writes its own trace and admin token file.
+        if session_args.trace:
+            session_args.trace = f"{session_args.trace}.{os.getpid()}"
+        if session_args.admin_token_file:
+            session_args.admin_token_file = f"{session_args.admin_token_file}.{os.getpid()}"
+        stdin, stdout = fds[0], fds[1]
+        stderr = fds[2] if len(fds) > 2 else os.open(os.devnull, os.O_WRONLY)
+        for target, fd in ((0, stdin), (1, stdout), (2, stderr)):
+            os.dup2(fd, target)
+        for fd in set(fds) | {stderr}:
+            if fd > 2:
+                os.close(fd)
+        import calculator_server
+        asyncio.run(calculator_server.main(session_args))
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+class Zygote:
+    def __init__(self, path: str):
+        self.path = path
+        self.listener: Optional[socket.socket] = None
+        # Signal handlers write to this pair, so a child exiting or SIGTERM wakes the accept loop.
+        self.wakeup = socket.socketpair()
+        # Control connection of each live session, told the child's exit status.
+        self.sessions: Dict[int, socket.socket] = {}
+        self.session_args: Optional[argparse.Namespace] = None
+        self.stopping = False
+
+    def _fork(self, conn: socket.socket):
+        conn.settimeout(1.0)  # a client that connects but never sends must not stall the zygote
+        try:
+            _, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST_BYTES, 3)
+        except OSError as e:
+            _log(f"bad request: {e}")
+            conn.close()
+            return
+        if len(fds) < 2:
+            for fd in fds:
+                os.close(fd)
+            conn.sendall(b'{"error": "send stdin and stdout (and optionally stderr) descriptors"}\n')
+            conn.close()
+            return
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            _run_session(fds, [self.listener, conn, *self.wakeup] + list(self.sessions.values()), self.session_args)
+        for fd in fds:
+            os.close(fd)
+        try:
+            conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+        except OSError:
+            pass  # the client gave up; the session still runs until its stdin closes
+        self.sessions[pid] = conn
+
+    def _reap(self):
+        while self.sessions:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            conn = self.sessions.pop(pid, None)
+            if conn is not None:
+                try:
+                    conn.sendall(json.dumps({"exit": os.waitstatus_to_exitcode(status)}).encode() + b"\n")
+                except OSError:
+                    pass
+                conn.close()
+
+    def run(self, args: argparse.Namespace) -> int:
+        from calculator_server import announce_ready
+
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        self.session_args = warm_up(args)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(128)
+        for end in self.wakeup:
+            end.setblocking(False)
+        signal.set_wakeup_fd(self.wakeup[1].fileno())
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        # Everything built so far is shared with every child; keep the collector from dirtying it.
+        gc.freeze()
+        announce_ready(args, self.path)
+        try:
+            while not self.stopping:
+                readable, _, _ = select.select([self.listener, self.wakeup[0]], [], [], 1.0)
+                if self.wakeup[0] in readable:
+                    try:
+                        self.wakeup[0].recv(4096)
+                    except BlockingIOError:
+                        pass
+                if self.listener in readable:
+                    conn, _ = self.listener.accept()
+                    self._fork(conn)
+                self._reap()
+        finally:
+            signal.set_wakeup_fd(-1)
+            self.listener.close()
+            for end in self.wakeup:
+                end.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            for conn in self.sessions.values():
+                conn.close()
+            if args.ready_file and os.path.exists(args.ready_file):
+                os.unlink(args.ready_file)
+        _log(f"stopped ({len(self.sessions)} sessions still running)")
+        return 0
+
+
+def serve(args: argparse.Namespace) -> int:
+    """Run the zygote for ``calculator_server.py --zygote PATH``."""
+    if args.tcp or args.unix or args.http or args.workers > 1:
+        _log("--zygote serves forked stdio sessions; it cannot be combined with a socket transport or --workers")
+        return 2
+    return Zygote(os.path.abspath(args.zygote)).run(args)
+
+
+class ForkedSession:
+    """A session forked by a zygote, with the parts of ``asyncio.subprocess.Process`` clients use.
+
+    It is not our child, so its exit status arrives from the zygote on the control connection.
+    """
+
+    def __init__(self, pid: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.pid = pid
+        self.returncode: Optional[int] = None
+        self._writer = writer
+        self._exited = asyncio.create_task(self._watch(reader))
+
+    async def _watch(self, reader: asyncio.StreamReader):
+        try:
+            line = await reader.readline()
+            self.returncode = json.loads(line)["exit"] if line else -1
+        except (ValueError, KeyError, ConnectionError):
+            self.returncode = -1  # lost track of it along with the zygote
+        finally:
+            self._writer.close()
+
+    async def wait(self) -> int:
+        await asyncio.shield(self._exited)
+        return self.returncode
+
+    def send_signal(self, signum: int):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+async def fork_session(path: str, fds: List[int]) -> ForkedSession:
+    """Ask the zygote listening on ``path`` to serve a session on ``fds`` (stdin, stdout[, stderr])."""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.setblocking(False)
+        await loop.sock_connect(sock, path)
+        # A few bytes on an idle local socket: this never blocks.
+        socket.send_fds(sock, [b"{}"], fds)
+        reader, writer = await asyncio.open_unix_connection(sock=sock)
+    except BaseException:
+        sock.close()
+        raise
+    line = await reader.readline()
+    reply = json.loads(line) if line else {"error": "zygote closed the connection"}
+    if "pid" not in reply:
+        writer.close()
+        raise ConnectionError(f"zygote refused the session: {reply.get('error')}")
+    return ForkedSession(reply["pid"], reader, writer)